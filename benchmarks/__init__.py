@@ -0,0 +1,14 @@
+"""
+Transport benchmarks
+
+Run from repository root:
+
+    python -m benchmarks                        # run all scenarios
+    python -m benchmarks --save baseline.json   # save results as baseline
+    python -m benchmarks --compare baseline.json --threshold 0.2
+
+Every scenario is `<payload>/<mode>`: payload is described by `runner.PAYLOADS`
+(body size, chunked, gzip, keep-alive, latency of `server.BenchmarkHandler`),
+mode is `single` (one `Curl` handle), `pooled` (threads sharing `CurlPool`) or
+`concurrent` (`CurlMulti`).
+"""
@@ -0,0 +1,49 @@
+import argparse
+import sys
+
+from .runner import MODES, PAYLOADS, run_all, save_baseline, load_baseline, compare
+from .server import start_server
+
+COLUMNS = ('rps', 'p50_ms', 'p99_ms', 'cpu_ms_per_req', 'peak_rss_kb', 'errors')
+
+
+def report(name, metrics):
+    print '%-26s' % name + ''.join('%16s' % metrics[column] for column in COLUMNS)
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Transport benchmarks')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight for pooled/concurrent modes')
+    parser.add_argument('--payload', action='append', choices=[name for name, params in PAYLOADS],
+                        help='run only these payloads')
+    parser.add_argument('--mode', action='append', choices=MODES, help='run only these modes')
+    parser.add_argument('--save', metavar='PATH', help='save results as baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare results with baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative change which is a regression')
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    server, url = start_server()
+    try:
+        print '%-26s' % 'scenario' + ''.join('%16s' % column for column in COLUMNS)
+        results = run_all(url, args.requests, args.concurrency, args.payload, args.mode or MODES, report)
+    finally:
+        server.terminate()
+
+    if args.save:
+        save_baseline(args.save, results)
+        print 'Baseline saved to %s' % args.save
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold)
+        for name, metric, old, new, change in regressions:
+            print 'REGRESSION %s %s: %s -> %s (%+.0f%%)' % (name, metric, old, new, change * 100)
+        if regressions:
+            return 1
+        print 'No regressions against %s' % args.compare
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
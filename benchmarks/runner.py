@@ -0,0 +1,246 @@
+import json
+import multiprocessing
+import resource
+import threading
+import time
+import urllib
+
+# name -> query params of benchmark server
+PAYLOADS = [
+    ('small', {'size': 512}),
+    ('large', {'size': 1024 * 1024}),
+    ('chunked', {'size': 64 * 1024, 'chunked': 1}),
+    ('gzip', {'size': 64 * 1024, 'gzip': 1}),
+    ('no-keepalive', {'size': 512, 'keepalive': 0}),
+    ('latency', {'size': 512, 'delay': 20}),
+]
+MODES = ('single', 'pooled', 'concurrent')
+
+# metric -> direction of regression
+METRICS = {
+    'rps': -1,
+    'p50_ms': 1,
+    'p99_ms': 1,
+    'cpu_ms_per_req': 1,
+    'peak_rss_kb': 1,
+}
+
+
+def percentile(values, percent):
+    """
+    @param values (list): sorted values
+    @param percent (int): percentile in 0..100
+    @return (float): nearest-rank percentile
+    """
+    if not values:
+        return None
+    index = max(int(round(len(values) * percent / 100.0)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def _profile():
+    from src.transport.profiles import Profile
+    return Profile('benchmark', use_cache=False, timeout=30, download_limit=2 * 1024 * 1024)
+
+
+class SingleRunner(object):
+    """ Sequential requests on one `Curl` handle"""
+
+    def __init__(self, concurrency):
+        from src.transport.curl_connector import Curl
+        self.curl = Curl()
+        self.profile = _profile()
+
+    def run(self, urls):
+        latencies, errors = [], 0
+        for url in urls:
+            start = time.time()
+            try:
+                self.curl.request(url, profile=self.profile)
+            except Exception:
+                errors += 1
+            latencies.append(time.time() - start)
+        return latencies, errors
+
+    def close(self):
+        pass
+
+
+class PooledRunner(object):
+    """ `concurrency` threads sharing `CurlPool`"""
+
+    def __init__(self, concurrency):
+        from src.transport.pool import CurlPool
+        self.concurrency = concurrency
+        self.pool = CurlPool(profile=_profile(), max_size=concurrency, coalesce=False)
+
+    def run(self, urls):
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        urls = list(urls)
+
+        def worker():
+            while True:
+                with lock:
+                    if not urls:
+                        return
+                    url = urls.pop()
+                start = time.time()
+                try:
+                    self.pool.request(url)
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                latency = time.time() - start
+                with lock:
+                    latencies.append(latency)
+
+        threads = [threading.Thread(target=worker) for _ in xrange(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors[0]
+
+    def close(self):
+        self.pool.close()
+
+
+class ConcurrentRunner(object):
+    """ `CurlMulti` with `concurrency` transfers in flight"""
+
+    def __init__(self, concurrency):
+        from src.transport.curl_multi import CurlMulti
+        self.concurrency = concurrency
+        self.multi = CurlMulti(profile=_profile(), max_connections=concurrency, coalesce=False)
+
+    def run(self, urls):
+        latencies, errors = [], [0]
+        urls = list(urls)
+
+        def add():
+            start = time.time()
+            self.multi.add_request(urls.pop()).add_done_callback(lambda future: done(future, start))
+
+        def done(future, start):
+            latencies.append(time.time() - start)
+            if future.exception() is not None:
+                errors[0] += 1
+            if urls:
+                add()  # keep `concurrency` transfers in flight
+
+        for _ in xrange(min(self.concurrency, len(urls))):
+            add()
+        while self.multi.perform():
+            pass
+        return latencies, errors[0]
+
+    def close(self):
+        self.multi.close()
+
+
+RUNNERS = {
+    'single': SingleRunner,
+    'pooled': PooledRunner,
+    'concurrent': ConcurrentRunner,
+}
+
+
+def _measure(mode, base_url, params, requests, concurrency, warmup, result_queue):
+    urls = ['%s?%s' % (base_url, urllib.urlencode(dict(params, i=i))) for i in xrange(requests + warmup)]
+    runner = RUNNERS[mode](concurrency)
+    runner.run(urls[requests:])
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.time()
+    latencies, errors = runner.run(urls[:requests])
+    elapsed = time.time() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    runner.close()
+    cpu = (end_usage.ru_utime - usage.ru_utime) + (end_usage.ru_stime - usage.ru_stime)
+    latencies.sort()
+    result_queue.put({
+        'requests': requests,
+        'errors': errors,
+        'concurrency': concurrency if mode != 'single' else 1,
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'cpu_ms_per_req': round(cpu * 1000 / requests, 4),
+        'peak_rss_kb': end_usage.ru_maxrss,
+    })
+
+
+def run_scenario(mode, base_url, params, requests=200, concurrency=8, warmup=10):
+    """ Run scenario in a fresh process, so peak RSS and CPU belong to this scenario only
+    @param mode (str): one of `MODES`
+    @param base_url (str): url of benchmark server
+    @param params (dict): query params of benchmark server
+    @param requests (int): count of measured requests
+    @param concurrency (int): requests in flight for `pooled` and `concurrent` modes
+    @param warmup (int): count of requests before measuring
+    @return (dict): metrics
+    """
+    result_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure,
+                                      args=(mode, base_url, params, requests, concurrency, warmup, result_queue))
+    process.start()
+    try:
+        return result_queue.get(timeout=600)
+    finally:
+        process.join()
+
+
+def run_all(base_url, requests=200, concurrency=8, payloads=None, modes=MODES, report=None):
+    """
+    @param base_url (str): url of benchmark server
+    @param requests (int): count of measured requests per scenario
+    @param concurrency (int): requests in flight for `pooled` and `concurrent` modes
+    @param payloads (list): names of `PAYLOADS` to run, None - all
+    @param modes (tuple): modes to run
+    @param report (callable): `report(name, metrics)` called after every scenario
+    @return (dict): scenario name -> metrics
+    """
+    results = {}
+    for payload, params in PAYLOADS:
+        if payloads and payload not in payloads:
+            continue
+        for mode in modes:
+            name = '%s/%s' % (payload, mode)
+            results[name] = run_scenario(mode, base_url, params, requests, concurrency)
+            if report is not None:
+                report(name, results[name])
+    return results
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(baseline, results, threshold=0.2):
+    """ Compare results with baseline
+    @param baseline (dict): scenario name -> metrics
+    @param results (dict): scenario name -> metrics
+    @param threshold (float): relative change of metric which is a regression, any increase of errors is one
+    @return (list): `(scenario, metric, baseline value, value, relative change)` of regressions
+    """
+    regressions = []
+    for name, metrics in sorted(results.iteritems()):
+        if name not in baseline:
+            continue
+        for metric, direction in sorted(METRICS.iteritems()):
+            old, new = baseline[name].get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = float(new - old) / old
+            if change * direction > threshold:
+                regressions.append((name, metric, old, new, change))
+        old, new = baseline[name].get('errors'), metrics.get('errors')
+        if old is not None and new is not None and new > old:
+            regressions.append((name, 'errors', old, new, float(new - old) / old if old else float('inf')))
+    return regressions
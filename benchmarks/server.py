@@ -0,0 +1,95 @@
+import BaseHTTPServer
+import SocketServer
+import gzip
+import multiprocessing
+import time
+import urlparse
+from io import BytesIO
+
+CHUNK_SIZE = 16 * 1024
+
+
+class BenchmarkHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Stand-in for upstream, response is described by query params:
+
+    `size` - body size in bytes, `delay` - latency in ms, `chunked=1` - chunked
+    transfer encoding, `gzip=1` - gzip body if client accepts it,
+    `keepalive=0` - close connection after response
+    """
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1  # buffered writes, headers and body go out in one send
+    disable_nagle_algorithm = True  # chunks are written one by one
+    _bodies = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        params = dict(urlparse.parse_qsl(urlparse.urlsplit(self.path).query))
+        delay = float(params.get('delay', 0)) / 1000
+        if delay:
+            time.sleep(delay)
+        compress = params.get('gzip') == '1' and 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        body = self._body(int(params.get('size', 512)), compress)
+        keepalive = params.get('keepalive', '1') != '0'
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        if not keepalive:
+            self.send_header('Connection', 'close')
+            self.close_connection = 1
+        if params.get('chunked') == '1':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in xrange(0, len(body), CHUNK_SIZE):
+                chunk = body[start:start + CHUNK_SIZE]
+                self.wfile.write('%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write('0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    do_POST = do_GET
+
+    @classmethod
+    def _body(cls, size, compress):
+        key = (size, compress)
+        if key not in cls._bodies:
+            body = ('0123456789abcdef' * (size / 16 + 1))[:size]
+            if compress:
+                buf = BytesIO()
+                with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                    f.write(body)
+                body = buf.getvalue()
+            cls._bodies[key] = body
+        return cls._bodies[key]
+
+
+class BenchmarkServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def _serve(port_queue):
+    server = BenchmarkServer(('127.0.0.1', 0), BenchmarkHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server():
+    """ Start server in a separate process, so its CPU time is not counted
+    @return process (multiprocessing.Process): server process, must be terminated
+    @return url (str): base url of server
+    """
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(port_queue,))
+    process.daemon = True
+    process.start()
+    return process, 'http://127.0.0.1:%d/' % port_queue.get(timeout=10)
@@ -17,3 +17,12 @@ class BaseCommunicator(object):
 
     def set_handler(self, handler):
         pass
+
+    def set_submit(self, submit):
+        """ Set non-blocking entry of core
+        @param submit (callable): `submit(message, callback)` returns future of response and calls
+            `callback(message, response)` when response is ready
+
+        Communicator without own implementation waits for response in its thread.
+        """
+        self.set_handler(lambda message: submit(message).result())
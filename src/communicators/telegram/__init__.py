@@ -5,6 +5,7 @@ from telegram.ext import MessageHandler, Filters
 
 from src.communicators import BaseCommunicator, Message
 from src.communicators.telegram.command_handler import CommandHandlers
+from src.core.utils.executor import ExecutorBusy
 from src.logger import get_logger
 
 log = get_logger('comm.telegram')
@@ -29,6 +30,26 @@ class Telegram(BaseCommunicator):
         message_handler = MessageHandler(Filters.text, core_handler)
         self._dispatcher.add_handler(message_handler)
 
+    def set_submit(self, submit):
+        def core_handler(bot, update):
+            chat_id = update.message.chat_id
+
+            def reply(message, resp):
+                if not isinstance(resp, basestring):
+                    resp = 'wat?'
+                bot.send_message(chat_id=chat_id, text=resp)
+
+            message = Message(msg=update.message.text,
+                              source='telegram')
+            try:
+                submit(message, reply)
+            except ExecutorBusy:
+                log.warning('Message is rejected, core is busy')
+                bot.send_message(chat_id=chat_id, text='Too many requests, try again later')
+
+        message_handler = MessageHandler(Filters.text, core_handler)
+        self._dispatcher.add_handler(message_handler)
+
     def start(self):
         self._updater.start_polling()
 
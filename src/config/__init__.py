@@ -8,6 +8,8 @@ from .readers import readers
 
 module_list = [
     'src.logger',
+    'src.transport',
+    'src.core',
     'src.communicators.*',
     'src.plugins.*',
 ]
@@ -9,7 +9,9 @@ from src.communicators import Message
 from src.config import parse_config
 from src.core.controllers.communicator import Communicator
 from src.core.controllers.plugin import Plugin
+from src.core.pipeline import Pipeline
 from src.logger import logger_init, get_logger
+from src.transport import transport_init, warm_up
 
 log = get_logger('core')
 
@@ -18,18 +20,28 @@ class Core(object):
     def __init__(self, config_path):
         self._config = parse_config(config_path)
         logger_init(self._config.core.logger)
+        transport_init(self._config.core.transport)
         self._communicators = Communicator(self._config.communicators)
-        self._plugins = Plugin(self._config.plugins)
+        dispatch = self._config.core.dispatch
+        self._plugins = Plugin(self._config.plugins, mode=dispatch.mode, deadline=dispatch.deadline)
+        pipeline = self._config.core.pipeline
+        self._pipeline = Pipeline(self._plugins, dispatch.fallback, deadline=dispatch.deadline,
+                                  activator_workers=pipeline.activator_workers,
+                                  requester_workers=pipeline.requester_workers,
+                                  responser_workers=pipeline.responser_workers,
+                                  queue_size=pipeline.queue_size)
+        warm_up(self._plugins.origins())
+
+    def submit(self, message, callback=None):
+        """ Process message without blocking, see `Pipeline.submit`
+        @return (Future): future of response
+        """
+        return self._pipeline.submit(message, callback)
 
     def user_message_handler(self, message):
-        if not isinstance(message, Message):
-            message = Message(msg=message)
-        log.debug(message)
-        response = self._plugins.process_message(message)
-        if not response:
-            response = 'Sorry, we cannot find processor for this request =('
-        return response
+        """ Process message and wait for response"""
+        return self.submit(message).result()
 
     def run(self):
-        self._communicators.set_handler(self.user_message_handler)
+        self._communicators.set_submit(self.submit)
         self._communicators.start()
@@ -0,0 +1,40 @@
+from src.config import configurator, ConfigurationError, ConfigContainer
+from src.core.controllers.plugin import MODES
+
+
+@configurator(path='core.dispatch')
+def conf(config,
+         mode='sequential',
+         deadline=None,
+         fallback='Sorry, we cannot find processor for this request =(',
+         ):
+    if mode not in MODES:
+        raise ConfigurationError('Unknown dispatch mode %s, expected one of %s' % (mode, ', '.join(MODES)))
+    if deadline is not None and float(deadline) <= 0:
+        raise ConfigurationError('Option deadline must be positive or null')
+    return ConfigContainer({
+        'mode': mode,
+        'deadline': float(deadline) if deadline is not None else None,
+        'fallback': fallback,
+    })
+
+
+@configurator(path='core.pipeline')
+def pipeline_conf(config,
+                  activator_workers=2,
+                  requester_workers=16,
+                  responser_workers=4,
+                  queue_size=256,
+                  ):
+    for name, value in (('activator_workers', activator_workers), ('requester_workers', requester_workers),
+                        ('responser_workers', responser_workers)):
+        if int(value) < 1:
+            raise ConfigurationError('Option %s must be positive' % name)
+    if int(queue_size) < 0:
+        raise ConfigurationError('Option queue_size must not be negative')
+    return ConfigContainer({
+        'activator_workers': int(activator_workers),
+        'requester_workers': int(requester_workers),
+        'responser_workers': int(responser_workers),
+        'queue_size': int(queue_size),
+    })
@@ -17,3 +17,7 @@ class Communicator(BaseController):
     def set_handler(self, handler):
         for comm_name, comm in self._communicators.iteritems():
             comm.set_handler(handler=handler)
+
+    def set_submit(self, submit):
+        for comm_name, comm in self._communicators.iteritems():
+            comm.set_submit(submit=submit)
@@ -1,22 +1,227 @@
+import sys
+import threading
+
 from src.core.controllers import BaseController
+from src.core.utils.activator import Activator
+from src.core.utils.executor import Executor, ExecutorBusy
+from src.core.utils.futures import Future, CancelledError, TimeoutError, is_future
 from src.logger import get_logger
 
 log = get_logger('plugins')
 
+SEQUENTIAL = 'sequential'  # candidates one after another
+CONCURRENT = 'concurrent'  # all candidates at once in worker threads
+MODES = (SEQUENTIAL, CONCURRENT)
+
+
+class Dispatch(object):
+    """ Answer of candidate plugins to one message, resolved without blocking
+
+    Plugin may answer with a value or with a future of it. In sequential mode
+    the next candidate is asked when the previous one refuses (answers None),
+    exception of plugin fails the dispatch. In concurrent mode all candidates
+    are asked at once, plugin which raised is logged and counted as refused;
+    answer is known when the highest priority plugin which has not refused yet
+    answers. Queued work is cancelled once answer is known; running plugins can
+    not be interrupted, their answers are dropped.
+    """
+
+    def __init__(self, plugins, names, message, executor, concurrent):
+        """
+        @param plugins (dict): plugin name -> plugin instance
+        @param names (list): candidates, the highest priority first
+        @param message (Message): message
+        @param executor (Executor): executor which runs `process_message` of plugins
+        @param concurrent (bool): ask all candidates at once
+        """
+        self.future = Future()
+        self._plugins = plugins
+        self._names = names
+        self._message = message
+        self._executor = executor
+        self._concurrent = concurrent
+        self._lock = threading.Lock()
+        self._finished = {}  # index of candidate -> (answer, exc_info)
+        self._pending = {}  # index of candidate -> future of its answer
+        self._resolved = False
+
+    @property
+    def concurrent(self):
+        return self._concurrent
+
+    def start(self):
+        if not self._names:
+            self.future.set_result(None)
+        elif self._concurrent:
+            for index in xrange(len(self._names)):
+                self._ask(index)
+        else:
+            self._ask(0)
+        return self
+
+    def _ask(self, index):
+        try:
+            future = self._executor.submit(self._plugins[self._names[index]].process_message, self._message)
+        except ExecutorBusy, e:
+            self._finish(index, None, (type(e), e, None))
+            return
+        self._follow(index, future)
+
+    def _follow(self, index, future):
+        with self._lock:
+            resolved = self._resolved
+            if not resolved:
+                self._pending[index] = future
+        if resolved:
+            future.cancel()
+            return
+        future.add_done_callback(lambda done: self._done(index, done))
+
+    def _done(self, index, future):
+        if future.cancelled():
+            self._finish(index, None, (CancelledError, CancelledError(), None))
+            return
+        try:
+            answer = future.result()
+        except Exception:
+            self._finish(index, None, sys.exc_info())
+            return
+        if is_future(answer):
+            self._follow(index, answer)
+        else:
+            self._finish(index, answer, None)
+
+    def _finish(self, index, answer, exc_info):
+        with self._lock:
+            self._pending.pop(index, None)
+            if self._resolved:
+                return
+            self._finished[index] = (answer, exc_info)
+            if exc_info is not None and exc_info[0] is not CancelledError:
+                log.error('Exception while processing %s: %s' % (self._names[index], exc_info[1]))
+            if exc_info is not None and not self._concurrent:
+                known = True
+            else:
+                known, answer = self._pick(complete=True)
+                exc_info = None
+            self._resolved = known
+        if not known:
+            if not self._concurrent:
+                self._ask(index + 1)
+            return
+        self._resolve(answer, exc_info)
+
+    def _pick(self, complete):
+        """
+        @param complete (bool): answer is known only when all plugins of higher priority refused
+        @return (tuple): (answer is known, answer)
+        """
+        for index in xrange(len(self._names)):
+            if index not in self._finished:
+                if complete:
+                    return False, None
+                continue
+            answer, exc_info = self._finished[index]
+            if exc_info is None and answer is not None:
+                return True, answer
+        return True, None
+
+    def _resolve(self, answer, exc_info=None):
+        with self._lock:
+            pending, self._pending = self._pending.values(), {}
+        for future in pending:
+            future.cancel()
+        if exc_info is not None:
+            self.future.set_exception(exc_info[1], exc_info)
+        else:
+            self.future.set_result(answer)
+
+    def expire(self):
+        """ Resolve with the best answer so far, e.g. at deadline"""
+        with self._lock:
+            if self._resolved:
+                return
+            self._resolved = True
+            answer = self._pick(complete=False)[1]
+            log.warning('No answer of %s in time' % ', '.join(
+                self._names[index] for index in xrange(len(self._names)) if index not in self._finished))
+        self._resolve(answer)
+
 
 class Plugin(BaseController):
-    def __init__(self, config, modules_folder='plugins'):
+    def __init__(self, config, modules_folder='plugins', mode=SEQUENTIAL, workers=8, deadline=None):
+        """
+        @param config (ImmutableConfigContainer): `plugins` config branch
+        @param modules_folder (str): package of plugins
+        @param mode (str): `sequential` or `concurrent`
+        @param workers (int): worker threads which run plugins for `dispatch`
+        @param deadline (float): seconds to wait for answer in concurrent mode, None - no deadline
+        """
         super(Plugin, self).__init__(modules_folder)
         self._plugins = self._get_init_classes(self.modules_folder, config=config)
+        self.mode = mode
+        self.deadline = deadline
+        self._executor = Executor(workers, name='plugins')  # threads are started on demand
+        self._activator = Activator()
+        # plugins with higher `priority` are asked first and win over the others
+        for name in sorted(self._plugins, key=lambda name: -getattr(self._plugins[name], 'priority', 0)):
+            self._activator.add(name, getattr(self._plugins[name], 'triggers', None))
+        self._activator.compile()
+
+    def candidates(self, message):
+        """ Plugins whose triggers are found in message, plugins without `triggers` are always candidates
+        @param message (Message): message
+        @return (list): plugin names, the highest priority first
+        """
+        return self._activator.candidates(message.msg)
+
+    def dispatch(self, message, names=None, executor=None):
+        """ Ask candidates without blocking, see `Dispatch`
+        @param message (Message): message
+        @param names (list): candidates, found by `candidates` by default
+        @param executor (Executor): executor which runs plugins, own executor of concurrent mode by default
+        @return (Dispatch): started dispatch, `future` of it resolves with answer
+        """
+        if names is None:
+            names = self.candidates(message)
+        return Dispatch(self._plugins, names, message, executor or self._executor,
+                        self.mode == CONCURRENT).start()
 
     def process_message(self, message):
+        """
+        @param message (Message): message
+        @return: answer of the highest priority plugin which answered, None - no answer
+        """
+        names = self.candidates(message)
+        if self.mode == CONCURRENT and names:
+            dispatch = self.dispatch(message, names)
+            try:
+                return dispatch.future.result(self.deadline)
+            except TimeoutError:
+                dispatch.expire()
+                return dispatch.future.result()
         res = None
-        for plugin in self._plugins:
+        for plugin in names:
             try:
                 res = self._plugins[plugin].process_message(message)
+                if is_future(res):
+                    res = res.result()
             except Exception, e:
                 log.error('Exception while processing %s: %s' % (plugin, str(e)))
                 raise
             if res is not None:
                 break
         return res
+
+    def origins(self):
+        """ Upstream urls declared by plugins with `origins` method
+        @return (list): urls
+        """
+        origins = []
+        for plugin in self._plugins.itervalues():
+            if hasattr(plugin, 'origins'):
+                origins.extend(plugin.origins())
+        return origins
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,113 @@
+import threading
+
+from src.communicators import Message
+from src.core.utils.executor import Executor, ExecutorBusy
+from src.core.utils.futures import Future, chain
+from src.core.utils.loop import EventLoop
+from src.logger import get_logger
+
+log = get_logger('core.pipeline')
+
+
+class Pipeline(object):
+    """ Message processing in three stages, every stage has its own bounded executor
+
+    Activator - finds candidate plugins of message;
+    Requester - runs plugins, plugin answers with a value or a future of it;
+    Responser - turns answer into response and calls completion callback.
+
+    `submit` returns at once, so communicator threads are never blocked by
+    slow plugins or upstreams. Message which does not fit into a full stage
+    queue is rejected with `ExecutorBusy`.
+    """
+
+    def __init__(self, plugins, fallback, deadline=None, activator_workers=2, requester_workers=16,
+                 responser_workers=4, queue_size=256):
+        """
+        @param plugins (Plugin): plugin controller
+        @param fallback (str): response when no plugin answered
+        @param deadline (float): seconds to wait for plugin answers in concurrent mode, None - no deadline
+        @param activator_workers (int): threads of activator stage
+        @param requester_workers (int): threads of requester stage
+        @param responser_workers (int): threads of responser stage
+        @param queue_size (int): maximum count of queued work items of every stage, 0 - no limit
+        """
+        self.plugins = plugins
+        self.fallback = fallback
+        self.deadline = deadline
+        self._activator = Executor(activator_workers, queue_size, name='activator')
+        self._requester = Executor(requester_workers, queue_size, name='requester')
+        self._responser = Executor(responser_workers, queue_size, name='responser')
+        self._loop = None  # timers of deadlines
+        if deadline is not None:
+            self._loop = EventLoop()
+            thread = threading.Thread(target=self._loop.run_forever, name='pipeline-timers')
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, message, callback=None):
+        """ Process message without blocking
+        @param message (Message|basestring): message
+        @param callback (callable): `callback(message, response)`, called on responser thread
+        @return (Future): future of response
+
+        @raise ExecutorBusy: activator queue is full
+        """
+        if not isinstance(message, Message):
+            message = Message(msg=message)
+        log.debug(message)
+        result = Future()
+        activated = self._activator.submit(self._activate, message, callback, result)
+        activated.add_done_callback(lambda future: self._check(future, result))
+        return result
+
+    @staticmethod
+    def _check(future, result):
+        if future.exception() is not None and not result.done():
+            log.error('Pipeline failed: %s' % future.exception())
+            result.set_exception(future.exception())
+
+    def _activate(self, message, callback, result):
+        names = self.plugins.candidates(message)
+        dispatch = self.plugins.dispatch(message, names, self._requester)
+        if self._loop is not None and dispatch.concurrent and not dispatch.future.done():
+            self._loop.call_soon_threadsafe(self._loop.call_later, self.deadline, dispatch.expire)
+        dispatch.future.add_done_callback(lambda answer: self._respond(message, answer, callback, result))
+
+    def _respond(self, message, answer, callback, result):
+        try:
+            responded = self._responser.submit(self._deliver, message, answer, callback)
+        except ExecutorBusy, e:
+            log.error('Response to %s is dropped: %s' % (message, e))
+            result.set_exception(e)
+            return
+        chain(responded, result)
+
+    def _deliver(self, message, answer, callback):
+        try:
+            response = answer.result()
+        except Exception, e:
+            log.error('Exception while processing %s: %s' % (message, e))
+            response = None
+        if not response:
+            response = self.fallback
+        if callback is not None:
+            try:
+                callback(message, response)
+            except Exception, e:
+                log.error('Exception in response callback of %s: %s' % (message, e))
+                raise
+        return response
+
+    def stats(self):
+        return {
+            'activator': self._activator.qsize(),
+            'requester': self._requester.qsize(),
+            'responser': self._responser.qsize(),
+        }
+
+    def close(self):
+        for executor in (self._activator, self._requester, self._responser):
+            executor.shutdown(wait=False)
+        if self._loop is not None:
+            self._loop.stop()
@@ -0,0 +1,121 @@
+import re
+from collections import deque
+
+RE_TYPE = type(re.compile(''))
+
+
+class KeywordAutomaton(object):
+    """ Aho-Corasick automaton over keywords of many owners
+
+    Text is scanned once, every position costs one transition (plus failure
+    transitions amortized over the text), whatever count of keywords there is.
+    """
+
+    def __init__(self):
+        self._goto = [{}]  # state -> {char: state}
+        self._fail = [0]
+        self._out = [set()]  # state -> owners of keywords ending in state
+        self._compiled = True
+
+    def add(self, keyword, owner):
+        """
+        @param keyword (unicode): keyword, empty one is ignored
+        @param owner (object): value reported when keyword is found
+        """
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+                self._goto[state][char] = nxt
+            state = nxt
+        self._out[state].add(owner)
+        self._compiled = False
+
+    def compile(self):
+        """ Build failure links, must be called after the last `add`"""
+        queue = deque(self._goto[0].itervalues())  # failure links of depth 1 lead to root
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].iteritems():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+        self._compiled = True
+
+    def search(self, text):
+        """
+        @param text (unicode): text to scan
+        @return (set): owners of keywords found in text
+        """
+        if not self._compiled:
+            self.compile()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class Activator(object):
+    """ Finds plugins which may answer a message
+
+    Plugin declares `triggers` - keywords (strings) and patterns (compiled
+    regular expressions). Keywords of all plugins are matched by one
+    `KeywordAutomaton` pass over the message, patterns are searched only for
+    plugins which have them. Plugin without `triggers` is a candidate for
+    every message. Keywords are matched case-insensitively, `Message` text is
+    lowercased already.
+    """
+
+    def __init__(self):
+        self._order = []
+        self._keywords = KeywordAutomaton()
+        self._patterns = []  # (name, pattern)
+        self._always = set()
+
+    def add(self, name, triggers=None):
+        """
+        @param name (str): plugin name
+        @param triggers (iterable): keywords and compiled patterns, None - plugin is always a candidate
+        """
+        self._order.append(name)
+        if triggers is None:
+            self._always.add(name)
+            return
+        for trigger in triggers:
+            if isinstance(trigger, RE_TYPE):
+                self._patterns.append((name, trigger))
+            else:
+                if isinstance(trigger, str):
+                    trigger = trigger.decode('utf-8')
+                self._keywords.add(trigger.lower(), name)
+
+    def compile(self):
+        self._keywords.compile()
+
+    def candidates(self, text):
+        """
+        @param text (unicode): message text
+        @return (list): names of candidate plugins in order of `add`
+        """
+        if isinstance(text, str):
+            text = text.decode('utf-8', 'replace')
+        found = self._keywords.search(text) | self._always
+        for name, pattern in self._patterns:
+            if name not in found and pattern.search(text):
+                found.add(name)
+        return [name for name in self._order if name in found]
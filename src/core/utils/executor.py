@@ -0,0 +1,92 @@
+import sys
+import threading
+from collections import deque
+
+from src.core.utils.futures import Future
+from src.logger import get_logger
+
+log = get_logger('core.executor')
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class Executor(object):
+    """ Fixed set of worker threads with a bounded queue of work
+
+    `submit` returns `Future`; work cancelled before a worker takes it is
+    skipped. Threads are started lazily, up to `max_workers`.
+    """
+
+    def __init__(self, max_workers=8, max_queue=0, name='executor'):
+        """
+        @param max_workers (int): count of worker threads
+        @param max_queue (int): maximum count of queued work items, 0 - no limit
+        @param name (str): prefix of thread names
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.name = name
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._threads = []
+        self._idle = 0
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """ Run `fn(*args, **kwargs)` in a worker thread
+        @return (Future): result of `fn`
+
+        @raise ExecutorBusy: queue is full or executor is shut down
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise ExecutorBusy('Executor %s is shut down' % self.name)
+            if self.max_queue and len(self._queue) >= self.max_queue:
+                raise ExecutorBusy('Queue of executor %s is full' % self.name)
+            self._queue.append((future, fn, args, kwargs))
+            self._ready.notify()
+            if len(self._queue) > self._idle and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name='%s-%d' % (self.name, len(self._threads)))
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._shutdown:
+                    self._idle += 1
+                    self._ready.wait()
+                    self._idle -= 1
+                if not self._queue:
+                    return
+                future, fn, args, kwargs = self._queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except Exception, e:
+                future.set_exception(e, sys.exc_info())
+            else:
+                future.set_result(result)
+
+    def qsize(self):
+        with self._lock:
+            return len(self._queue)
+
+    def shutdown(self, wait=True):
+        """ Stop workers after queued work is done
+        @param wait (bool): wait until workers exit
+        """
+        with self._lock:
+            self._shutdown = True
+            self._ready.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,166 @@
+import sys
+import threading
+import time
+
+from src.logger import get_logger
+
+log = get_logger('core.futures')
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+CANCELLED = 'CANCELLED'
+FINISHED = 'FINISHED'
+
+
+class CancelledError(Exception):
+    pass
+
+
+class TimeoutError(Exception):
+    pass
+
+
+class Future(object):
+    """ Result of an asynchronous operation (subset of `concurrent.futures.Future`)"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def __repr__(self):
+        return '<Future state=%s>' % self._state
+
+    def cancel(self):
+        """ Cancel the operation if it is not started yet
+        @return (bool): True if future was cancelled
+        """
+        with self._condition:
+            if self._state in (RUNNING, FINISHED):
+                return False
+            if self._state != CANCELLED:
+                self._state = CANCELLED
+                self._condition.notify_all()
+        self._run_callbacks()
+        return True
+
+    def cancelled(self):
+        return self._state == CANCELLED
+
+    def running(self):
+        return self._state == RUNNING
+
+    def done(self):
+        return self._state in (CANCELLED, FINISHED)
+
+    def set_running_or_notify_cancel(self):
+        """ Mark future as running
+        @return (bool): False if future was cancelled and work must be skipped
+        """
+        with self._condition:
+            if self._state == CANCELLED:
+                return False
+            self._state = RUNNING
+            return True
+
+    def set_result(self, result):
+        """ Resolve future with result, ignored if future is already cancelled or finished"""
+        with self._condition:
+            if self.done():
+                return
+            self._result = result
+            self._state = FINISHED
+            self._condition.notify_all()
+        self._run_callbacks()
+
+    def set_exception(self, exception, exc_info=None):
+        """ Resolve future with exception, ignored if future is already cancelled or finished
+        @param exception (Exception): raised exception
+        @param exc_info (tuple): `sys.exc_info()` to keep the original traceback
+        """
+        if exc_info is None:
+            exc_info = sys.exc_info()
+            if exc_info[1] is not exception:
+                exc_info = (type(exception), exception, None)
+        with self._condition:
+            if self.done():
+                return
+            self._exc_info = exc_info
+            self._state = FINISHED
+            self._condition.notify_all()
+        self._run_callbacks()
+
+    def _wait(self, timeout):
+        with self._condition:
+            if timeout is None:
+                while not self.done():
+                    self._condition.wait()
+            else:
+                deadline = time.time() + timeout
+                while not self.done():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError()
+                    self._condition.wait(remaining)
+            if self._state == CANCELLED:
+                raise CancelledError()
+
+    def result(self, timeout=None):
+        """ Wait for the operation and return its result
+        @param timeout (float): seconds to wait, None - wait forever
+        @return: result of the operation
+
+        @raise CancelledError: future was cancelled
+        @raise TimeoutError: operation is not finished in time
+        @raise Exception: exception raised by the operation
+        """
+        self._wait(timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        return self._exc_info[1] if self._exc_info else None
+
+    def add_done_callback(self, fn):
+        """ Call `fn(future)` when future is done (immediately if it is done already)"""
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _run_callbacks(self):
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                log.exception('Exception in future callback %r' % fn)
+
+
+def is_future(obj):
+    """ Object is a future-like result (`Future`, `concurrent.futures.Future`)"""
+    return hasattr(obj, 'add_done_callback') and hasattr(obj, 'result')
+
+
+def chain(source, target):
+    """ Resolve `target` with outcome of `source` when it is done
+    @param source (Future): future to follow
+    @param target (Future): future to resolve
+    """
+    def copy(future):
+        if target.done():
+            return
+        if future.cancelled():
+            target.cancel()
+        elif future.exception() is not None:
+            target.set_exception(future.exception(), getattr(future, '_exc_info', None))
+        else:
+            target.set_result(future.result())
+
+    source.add_done_callback(copy)
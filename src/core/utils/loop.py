@@ -0,0 +1,236 @@
+import errno
+import fcntl
+import heapq
+import itertools
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from src.logger import get_logger
+
+log = get_logger('core.loop')
+
+READ = 1
+WRITE = 2
+
+
+class TimerHandle(object):
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop(object):
+    """ Minimal single-threaded event loop
+
+    Implements the part of `asyncio` loop interface used by evented transport:
+    `add_reader`, `remove_reader`, `add_writer`, `remove_writer`, `call_soon`,
+    `call_soon_threadsafe`, `call_later`, `time`, `run_until_complete`, `stop`.
+    Uses epoll when it is available and select otherwise.
+
+    Callbacks may be scheduled from any thread, loop is woken up when they are
+    scheduled from a thread other than the one running it. Readers and writers
+    must be (un)registered on the loop thread.
+    """
+
+    def __init__(self):
+        self._readers = {}  # fd -> (callback, args)
+        self._writers = {}
+        self._registered = {}  # fd -> mask registered in epoll
+        self._ready = deque()
+        self._timers = []  # heap of (when, sequence, TimerHandle)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._thread_ident = None  # thread inside `run_once`
+        self._epoll = select.epoll() if hasattr(select, 'epoll') else None
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        for fd in (self._wakeup_r, self._wakeup_w):  # full pipe must not block writers
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.add_reader(self._wakeup_r, self._read_wakeup)
+
+    def time(self):
+        return time.time()
+
+    def call_soon(self, callback, *args):
+        """ Run `callback(*args)` on the next loop iteration, may be called from any thread"""
+        handle = TimerHandle(None, callback, args)
+        with self._lock:
+            self._ready.append(handle)
+        self._wakeup()
+        return handle
+
+    call_soon_threadsafe = call_soon
+
+    def call_later(self, delay, callback, *args):
+        """ Run `callback(*args)` after `delay`, may be called from any thread
+        @param delay (float): seconds
+        @param callback (callable): `callback(*args)`
+        @return (TimerHandle): handle, callback may be cancelled with `handle.cancel()`
+        """
+        handle = TimerHandle(self.time() + delay, callback, args)
+        with self._lock:
+            heapq.heappush(self._timers, (handle.when, next(self._sequence), handle))
+        self._wakeup()
+        return handle
+
+    def _wakeup(self):
+        """ Interrupt poll of loop thread, so it sees new callbacks and timers"""
+        if self._thread_ident == threading.current_thread().ident:
+            return
+        try:
+            os.write(self._wakeup_w, 'x')
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):  # full pipe wakes loop up anyway
+                raise
+
+    def _check_thread(self):
+        if self._thread_ident not in (None, threading.current_thread().ident):
+            raise RuntimeError('Loop fds must be changed on the loop thread')
+
+    def add_reader(self, fd, callback, *args):
+        self._check_thread()
+        self._readers[fd] = (callback, args)
+        self._update(fd)
+
+    def remove_reader(self, fd):
+        self._check_thread()
+        if self._readers.pop(fd, None) is not None:
+            self._update(fd)
+
+    def add_writer(self, fd, callback, *args):
+        self._check_thread()
+        self._writers[fd] = (callback, args)
+        self._update(fd)
+
+    def remove_writer(self, fd):
+        self._check_thread()
+        if self._writers.pop(fd, None) is not None:
+            self._update(fd)
+
+    def _update(self, fd):
+        if self._epoll is None:
+            return
+        mask = (select.EPOLLIN if fd in self._readers else 0) | (select.EPOLLOUT if fd in self._writers else 0)
+        old = self._registered.get(fd)
+        try:
+            if not mask:
+                if old is not None:
+                    del self._registered[fd]
+                    self._epoll.unregister(fd)
+            elif old is None:
+                self._epoll.register(fd, mask)
+                self._registered[fd] = mask
+            elif old != mask:
+                self._epoll.modify(fd, mask)
+                self._registered[fd] = mask
+        except (IOError, OSError), e:  # fd was closed before it was removed
+            log.debug('Can not update fd %d in epoll: %s' % (fd, e))
+            self._registered.pop(fd, None)
+
+    def _read_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except OSError:  # drained
+            pass
+
+    def _poll(self, timeout):
+        """
+        @return (list): `(fd, READ|WRITE mask)` of ready fds
+        """
+        if self._epoll is not None:
+            try:
+                events = self._epoll.poll(-1 if timeout is None else timeout)
+            except IOError, e:
+                if e.errno != errno.EINTR:
+                    raise
+                return []
+            return [(fd, (READ if event & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP) else 0) |
+                     (WRITE if event & (select.EPOLLOUT | select.EPOLLERR | select.EPOLLHUP) else 0))
+                    for fd, event in events]
+        try:
+            r, w, x = select.select(self._readers.keys(), self._writers.keys(), [], timeout)
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+        ready = dict.fromkeys(r, READ)
+        for fd in w:
+            ready[fd] = ready.get(fd, 0) | WRITE
+        return ready.items()
+
+    def run_once(self, timeout=None):
+        """ Wait for events at most `timeout` seconds and run ready callbacks"""
+        self._thread_ident = threading.current_thread().ident
+        try:
+            self._run_once(timeout)
+        finally:
+            self._thread_ident = None
+
+    def _run_once(self, timeout):
+        with self._lock:
+            if self._ready:
+                timeout = 0
+            elif self._timers:
+                timeout = max(0, min(self._timers[0][0] - self.time(), timeout if timeout is not None else 1e9))
+        ready = deque()
+        for fd, mask in self._poll(timeout):
+            if mask & READ and fd in self._readers:
+                ready.append(TimerHandle(None, *self._readers[fd]))
+            if mask & WRITE and fd in self._writers:
+                ready.append(TimerHandle(None, *self._writers[fd]))
+        now = self.time()
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                ready.append(heapq.heappop(self._timers)[2])
+            ready.extend(self._ready)
+            self._ready = deque()
+        for handle in ready:
+            if handle.cancelled:
+                continue
+            try:
+                handle.callback(*handle.args)
+            except Exception:
+                log.exception('Exception in loop callback %r' % handle.callback)
+
+    def run_until_complete(self, future, timeout=None):
+        """ Run loop until future is done
+        @param future (Future): future
+        @param timeout (float): seconds, None - no limit
+        @return: result of future, see `Future.result`
+        """
+        deadline = self.time() + timeout if timeout is not None else None
+        while not future.done():
+            remaining = deadline - self.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            self.run_once(remaining)
+        return future.result(0)
+
+    def run_forever(self):
+        self._stopping = False
+        while not self._stopping:
+            self.run_once()
+
+    def stop(self):
+        self.call_soon_threadsafe(self._stop)
+
+    def _stop(self):
+        self._stopping = True
+
+    def close(self):
+        self.remove_reader(self._wakeup_r)
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+        if self._epoll is not None:
+            self._epoll.close()
@@ -6,6 +6,8 @@ from src.transport import get_transport
 
 
 class Weather(object):
+    triggers = (u'погод', u'за окном')
+
     def __init__(self, config):
         self._transport = get_transport()
         self.appid = config.openweathermap_appid
@@ -24,10 +26,13 @@ class Weather(object):
             'future_1': u"""Завтра на улице {description}, {temp} градусов по Цельсию""",
         }
 
+    def origins(self):
+        return self._urls.values()
+
     def check_message(self, message):
         code = None
         city = None
-        if not any(word in message for word in [u'погод', u'за окном']):
+        if not any(word in message for word in self.triggers):
             return None, None
         code = 'now'
         if any(word in message for word in [u'сегодня', u'сейчас']):
@@ -1,10 +1,141 @@
+import threading
+
 from src.transport.curl_connector import Curl
+from src.transport.curl_multi import CurlMulti
+from src.transport.evented import EventedMulti
+from src.transport.pool import CurlPool
+from src.transport.resilience import ResilientPool
+from src.transport.cassette import CassetteTransport
+from src.transport.profiles import get_profile, register_profile
+from src.transport.share import configure_share, get_share
+from src.transport.stats import configure_stats, get_stats
+from src.transport.batch import configure_batch, request_many
+from src.transport.scheduler import INTERACTIVE, BACKGROUND, configure_scheduler, get_scheduler
+from src.transport.warmup import Warmer
+from src.transport.proxies import ProxyPool, ProxiedTransport
+from src.transport.cache import ResponseCache, set_cache
+from src.transport.disk_cache import DiskCache, TieredCache
+from src.transport.exceptions import ECurlConfigError
+
+ENGINES = {
+    'pool': CurlPool,
+    'multi': CurlMulti,
+    'evented': EventedMulti,
+    'resilient': ResilientPool,
+    'cassette': CassetteTransport,
+}
+
+_engine_settings = {
+    'pool': {},
+    'multi': {},
+    'evented': {},
+    'resilient': {},
+    'cassette': {},
+}
+_default_engine = 'pool'
+_warmup_settings = {}
+_warmers = []
+_proxy_pool = None
+
+_transports = {}
+_lock = threading.Lock()
+
+
+def transport_init(config):
+    """ Register transport profiles and engine settings
+    @param config (ImmutableConfigContainer): `core.transport` config branch
+    """
+    global _default_engine, _proxy_pool
+    for name, settings in config.profiles.items():
+        settings = settings.to_dict() if settings else {}
+        register_profile(name, **settings)
+    _engine_settings['pool'] = {
+        'max_size': config.pool_size,
+        'idle_timeout': config.pool_idle_timeout,
+        'checkout_timeout': config.pool_checkout_timeout,
+        'coalesce': config.coalesce,
+    }
+    _engine_settings['multi'] = {
+        'coalesce': config.coalesce,
+    }
+    _engine_settings['evented'] = {
+        'coalesce': config.coalesce,
+    }
+    _engine_settings['resilient'] = dict(_engine_settings['pool'], **{
+        'retries': config.retries,
+        'backoff': config.retry_backoff,
+        'backoff_max': config.retry_backoff_max,
+        'hedge_percentile': config.hedge_percentile,
+        'breaker_threshold': config.breaker_threshold,
+        'breaker_reset_timeout': config.breaker_reset_timeout,
+    })
+    _engine_settings['cassette'] = {
+        'path': config.cassette_path,
+        'mode': config.cassette_mode,
+        'latency': config.cassette_latency,
+    }
+    _default_engine = config.engine
+    _warmup_settings.update({
+        'mode': config.warmup_mode,
+        'connections': config.warmup_connections,
+        'refresh_interval': config.warmup_refresh,
+    })
+    share = (config.share_dns, config.share_ssl_sessions, config.share_connections)
+    configure_share(any(share), dns=share[0], ssl_session=share[1], connections=share[2])
+    configure_stats(window=config.stats_window)
+    if config.disk_cache_path:
+        set_cache(TieredCache(DiskCache(config.disk_cache_path, config.disk_cache_size)))
+    else:
+        set_cache(ResponseCache())
+    configure_scheduler(concurrency=config.concurrency, background_share=config.background_share)
+    configure_batch(max_concurrency=config.batch_concurrency, max_per_host=config.batch_host_concurrency)
+    if _proxy_pool is not None:
+        _proxy_pool.stop()
+    _proxy_pool = None
+    if config.proxies:
+        proxies = [proxy.to_dict() if hasattr(proxy, 'to_dict') else proxy for proxy in config.proxies]
+        _proxy_pool = ProxyPool(proxies, check_url=config.proxy_check_url, check_interval=config.proxy_check_interval,
+                                max_error_rate=config.proxy_max_error_rate, eviction_time=config.proxy_eviction_time)
+        _proxy_pool.start()
+    with _lock:
+        _transports.clear()
+
+
+def get_transport(name='default', engine=None):
+    """ Get shared transport instance
+    @param name (str): name of transport profile, every name has its own transport
+    @param engine (str): transport engine, one of `ENGINES` keys, `engine` from config by default
+    @return (CurlPool|CurlMulti|EventedMulti|ResilientPool|CassetteTransport|ProxiedTransport): transport,
+        requests go through proxy pool when proxies are configured and profile has no `proxy_info`
 
-_http = None
+    @raise ECurlConfigError: unknown engine or profile
+    """
+    engine = engine or _default_engine
+    key = (name, engine)
+    with _lock:
+        if key not in _transports:
+            if engine not in ENGINES:
+                raise ECurlConfigError('Unknown transport engine %s' % engine)
+            profile = get_profile(name)
+            transport = ENGINES[engine](profile=profile, **_engine_settings[engine])
+            if _proxy_pool is not None and not profile.settings.get('proxy_info'):
+                transport = ProxiedTransport(_proxy_pool, transport)
+            _transports[key] = transport
+        return _transports[key]
 
 
-def get_transport(name='default'):
-    global _http
-    if _http is None:
-        _http = Curl()
-    return _http
+def warm_up(origins, name='default', engine=None):
+    """ Pre-connect shared transport to upstream origins in background, see `Warmer`
+    @param origins (iterable): urls of upstreams
+    @param name (str): name of transport profile
+    @param engine (str): transport engine, `engine` from config by default
+    @return (Warmer|None): started warmer, None if warmup is disabled or there are no origins
+    """
+    if not _warmup_settings.get('mode'):
+        return None
+    warmer = Warmer(get_transport(name, engine), origins, **_warmup_settings)
+    if not warmer.origins:
+        return None
+    warmer.start()
+    _warmers.append(warmer)
+    return warmer
@@ -0,0 +1,267 @@
+import Queue
+import sys
+import threading
+import time
+from collections import deque
+
+from src.core.utils.futures import Future
+from src.logger import get_logger
+from .curl_multi import CurlMulti
+from .evented import EventedMulti
+from .exceptions import (ErrorResponse, ECurlConnectionTimeout, ECurlConnectionError, ECurlSSLConnectionError,
+                         ECurlCircuitOpen, ECurlDownloadLimitExceeded, ECurlProxyError, ECurlPoolTimeout)
+from .proxies import ProxiedTransport
+from .stats import host_key
+
+log = get_logger('transport.batch')
+
+# exception class -> ErrorResponse code, first match wins
+ERROR_CODES = (
+    (ECurlConnectionTimeout, ErrorResponse.TIMEOUT),
+    (ECurlPoolTimeout, ErrorResponse.TIMEOUT),
+    (ECurlConnectionError, ErrorResponse.CONNECT_FAIL),
+    (ECurlSSLConnectionError, ErrorResponse.CONNECT_FAIL),
+    (ECurlCircuitOpen, ErrorResponse.CONNECT_FAIL),
+    (ECurlDownloadLimitExceeded, ErrorResponse.DOWNLOAD_LIMIT_EXCEEDED),
+    (ECurlProxyError, ErrorResponse.PROXY_FAIL),
+)
+
+SPEC_FIELDS = ('url', 'method', 'body', 'headers', 'sink')
+
+_batch_settings = {
+    'max_concurrency': 16,
+    'max_per_host': 6,
+}
+
+
+def configure_batch(max_concurrency=16, max_per_host=6):
+    """ Set default limits of `request_many`
+    @param max_concurrency (int): maximum count of requests of one batch in flight
+    @param max_per_host (int): maximum count of requests of one batch to one host in flight
+    @return: None
+    """
+    _batch_settings['max_concurrency'] = max_concurrency
+    _batch_settings['max_per_host'] = max_per_host
+
+
+def make_spec(spec):
+    """
+    @param spec (str|dict): url or dict with `url`, `method`, `body`, `headers`, `sink`
+        and additional params for `Curl.configure`
+    @return (dict): spec with all `SPEC_FIELDS` and `curlargs`
+    """
+    if not isinstance(spec, dict):
+        spec = {'url': spec}
+    spec = dict(spec)
+    normalized = {
+        'url': spec.pop('url'),
+        'method': spec.pop('method', 'GET'),
+        'body': spec.pop('body', None),
+        'headers': spec.pop('headers', None),
+        'sink': spec.pop('sink', None),
+    }
+    normalized['curlargs'] = spec
+    return normalized
+
+
+def error_response(exception, request):
+    """
+    @param exception (Exception): error of request
+    @param request (dict): spec of request
+    @return (ErrorResponse): error response with code matching exception
+    """
+    code = ErrorResponse.UNKNOWN
+    for error_class, error_code in ERROR_CODES:
+        if isinstance(exception, error_class):
+            code = error_code
+            break
+    return ErrorResponse(code, '%s: %s' % (exception.__class__.__name__, exception), request)
+
+
+def _submit_thread(transport, spec):
+    """ Run blocking `transport.request` in a thread
+    @return (Future): future of request
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = transport.request(spec['url'], spec['method'], spec['body'], spec['headers'], spec['sink'],
+                                       **spec['curlargs'])
+        except Exception, e:
+            future.set_exception(e, sys.exc_info())
+        else:
+            future.set_result(result)
+
+    thread = threading.Thread(target=run, name='transport-batch')
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+class Batch(object):
+    """ Requests performed concurrently within global and per-host limits
+
+    Requests are dispatched in input order, a request to a host which is at
+    its limit waits and requests to other hosts pass it by. Transports with
+    `add_request` run requests without extra threads, other transports get
+    one thread per request in flight.
+    """
+
+    def __init__(self, transport, specs, max_concurrency=None, max_per_host=None):
+        """
+        @param transport (object): transport with `request` method
+        @param specs (list): request specs, see `make_spec`
+        @param max_concurrency (int): maximum count of requests in flight, 0 - no limit
+        @param max_per_host (int): maximum count of requests to one host in flight, 0 - no limit
+        """
+        self.transport = transport
+        self.specs = [make_spec(spec) for spec in specs]
+        self.max_concurrency = _batch_settings['max_concurrency'] if max_concurrency is None else max_concurrency
+        self.max_per_host = _batch_settings['max_per_host'] if max_per_host is None else max_per_host
+        self._hosts = [host_key(spec['url']) for spec in self.specs]
+        self._pending = deque(xrange(len(self.specs)))
+        self._in_flight = {}  # index -> Future
+        self._host_counts = {}  # host -> count of requests in flight
+        self._completed = Queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        # caller drives plain `CurlMulti` by `perform`, evented one has its own loop
+        engine = transport.transport if isinstance(transport, ProxiedTransport) else transport
+        self._driven = isinstance(engine, CurlMulti) and not isinstance(engine, EventedMulti)
+
+    def _submit(self, spec):
+        if hasattr(self.transport, 'add_request'):
+            return self.transport.add_request(spec['url'], spec['method'], spec['body'], spec['headers'],
+                                              spec['sink'], **spec['curlargs'])
+        return _submit_thread(self.transport, spec)
+
+    def _take(self):
+        """ Pop requests which may be started now
+        @return (list): indexes of requests
+        """
+        started = []
+        with self._lock:
+            if self._closed:
+                return started
+            skipped = deque()
+            while self._pending:
+                if self.max_concurrency and len(self._in_flight) + len(started) >= self.max_concurrency:
+                    break
+                index = self._pending.popleft()
+                host = self._hosts[index]
+                if self.max_per_host and self._host_counts.get(host, 0) >= self.max_per_host:
+                    skipped.append(index)
+                    continue
+                self._host_counts[host] = self._host_counts.get(host, 0) + 1
+                self._in_flight[index] = None
+                started.append(index)
+            skipped.extend(self._pending)
+            self._pending = skipped
+        return started
+
+    def _fill(self):
+        for index in self._take():
+            try:
+                future = self._submit(self.specs[index])
+            except Exception, e:
+                future = Future()
+                future.set_exception(e)
+            with self._lock:
+                self._in_flight[index] = future
+            future.add_done_callback(lambda f, index=index: self._finish(index, f))
+
+    def _finish(self, index, future):
+        with self._lock:
+            if self._in_flight.pop(index, None) is None and self._closed:
+                return
+            host = self._hosts[index]
+            self._host_counts[host] -= 1
+        if future.cancelled():
+            result = ErrorResponse(ErrorResponse.UNKNOWN, 'Request cancelled', self.specs[index])
+        else:
+            error = future.exception()
+            result = error_response(error, self.specs[index]) if error is not None else future.result()
+        self._completed.put((index, result))
+        self._fill()
+
+    def _next(self, deadline):
+        """ Wait for next completed request
+        @return (tuple|None): `(index, result)`, None on deadline
+        """
+        while True:
+            try:
+                return self._completed.get_nowait()
+            except Queue.Empty:
+                pass
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return None
+            if self._driven:
+                self.transport.perform(0.05 if remaining is None else min(remaining, 0.05))
+                continue
+            try:
+                return self._completed.get(timeout=remaining if remaining is not None else 3600)
+            except Queue.Empty:
+                pass
+
+    def _abort(self):
+        """ Stop batch on deadline
+        @return (list): `(index, ErrorResponse)` of requests which are not completed
+        """
+        with self._lock:
+            self._closed = True
+            in_flight, self._in_flight = self._in_flight, {}
+            pending, self._pending = list(self._pending), deque()
+        for future in in_flight.itervalues():
+            if future is not None:
+                future.cancel()
+        return [(index, ErrorResponse(ErrorResponse.TIMEOUT, 'Batch deadline exceeded', self.specs[index]))
+                for index in sorted(in_flight.keys() + pending)]
+
+    def as_completed(self, timeout=None):
+        """ Run requests
+        @param timeout (float): deadline of the whole batch in seconds, None - no limit
+        @yield (tuple): `(index, result)` in completion order, result is `(response, resp_body)`
+            or `ErrorResponse`; requests not completed on deadline get `ErrorResponse.TIMEOUT`
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        self._fill()
+        for _ in xrange(len(self.specs)):
+            item = self._next(deadline)
+            if item is None:
+                for item in self._abort():
+                    yield item
+                return
+            yield item
+
+    def results(self, timeout=None):
+        """ Run requests, see `as_completed`
+        @return (list): results in input order
+        """
+        results = [None] * len(self.specs)
+        for index, result in self.as_completed(timeout):
+            results[index] = result
+        return results
+
+
+def request_many(specs, transport=None, max_concurrency=None, max_per_host=None, as_completed=False, timeout=None):
+    """ Perform requests concurrently
+    @param specs (list): request specs, url or dict with `url`, `method`, `body`, `headers`, `sink`
+        and additional params for `Curl.configure`
+    @param transport (object): transport, `get_transport()` by default
+    @param max_concurrency (int): maximum count of requests in flight, `configure_batch` value by default
+    @param max_per_host (int): maximum count of requests to one host in flight, `configure_batch` value by default
+    @param as_completed (bool): return generator of `(index, result)` in completion order
+    @param timeout (float): deadline of the whole batch in seconds, None - no limit
+    @return (list|generator): results in input order, result is `(response, resp_body)` or `ErrorResponse`
+    """
+    if transport is None:
+        from src.transport import get_transport
+        transport = get_transport()
+    batch = Batch(transport, specs, max_concurrency, max_per_host)
+    if as_completed:
+        return batch.as_completed(timeout)
+    return batch.results(timeout)
@@ -0,0 +1,290 @@
+import threading
+import time
+import urlparse
+from collections import OrderedDict
+from copy import copy
+from email.utils import parsedate_tz, mktime_tz
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+CACHEABLE_STATUSES = (200, 203, 300, 301, 410)
+KEY_HEADERS = ('accept', 'accept-language', 'authorization', 'cookie')
+# request headers which response may vary on and still be cached: `KEY_HEADERS` and `Accept-Encoding`,
+# which is always sent by libcurl itself (bodies are stored decoded)
+VARY_HEADERS = KEY_HEADERS + ('accept-encoding',)
+# request headers which carry credentials, response to such request is stored only if it is `public`
+CREDENTIAL_HEADERS = ('authorization', 'cookie')
+STATIC_TTL = 24 * 60 * 60
+
+
+def parse_cache_control(value):
+    """
+    @param value (str): Cache-Control header value
+    @return (dict): directive -> value (None for directives without value)
+    """
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, val = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = val.strip('"') or None
+    return directives
+
+
+def parse_http_date(value):
+    if not value:
+        return None
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def varies_on_other_headers(response):
+    """
+    @param response (Response): response
+    @return (bool): response varies on request headers which are not part of cache key, `Vary: *` included
+    """
+    for value in response.get_all('Vary'):
+        for name in value.split(','):
+            name = name.strip().lower()
+            if name and name not in VARY_HEADERS:
+                return True
+    return False
+
+
+def is_private(key, response):
+    """ Response is personal and must not be shared through cache
+    @param key (tuple): key from `ResponseCache.make_key`
+    @param response (Response): response
+    @return (bool): response sets cookies or request had credentials, and response is not explicitly `public`
+    """
+    method, url, key_headers, credentials = key[:4]
+    if not (credentials or response.get('Set-Cookie') is not None or
+            any(name in CREDENTIAL_HEADERS for name, value in key_headers)):
+        return False
+    return 'public' not in parse_cache_control(response.get('Cache-Control'))
+
+
+def freshness_lifetime(response, static=False, static_ttl=STATIC_TTL):
+    """ Freshness lifetime of response according to RFC 7234
+    @param response (Response): response
+    @param static (bool): response is a static file, use `static_ttl` if server gives no explicit lifetime
+    @param static_ttl (int): heuristic lifetime for static files
+    @return (int|None): lifetime in seconds, None if response must not be stored
+    """
+    cache_control = parse_cache_control(response.get('Cache-Control'))
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return 0
+    for directive in ('s-maxage', 'max-age'):
+        if cache_control.get(directive):
+            try:
+                lifetime = int(cache_control[directive])
+                break
+            except ValueError:
+                return 0
+    else:
+        expires = response.get('Expires')
+        if expires is not None:
+            expires_at = parse_http_date(expires)
+            if expires_at is None:  # invalid date means "already expired"
+                return 0
+            lifetime = expires_at - (parse_http_date(response.get('Date')) or time.time())
+        elif static:
+            lifetime = static_ttl
+        else:
+            lifetime = 0
+    try:
+        lifetime -= int(response.get('Age') or 0)
+    except ValueError:
+        pass
+    return max(int(lifetime), 0)
+
+
+class CacheEntry(object):
+    __slots__ = ('response', 'body', 'expires', 'etag', 'last_modified', 'size')
+
+    def __init__(self, response, body, lifetime):
+        self.response = response
+        self.body = body
+        self.size = len(body or '')
+        self.expires = time.time() + lifetime
+        self.etag = response.get('ETag')
+        self.last_modified = response.get('Last-Modified')
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.expires
+
+    def can_revalidate(self):
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        """
+        @return (list): headers for conditional request
+        """
+        headers = []
+        if self.etag:
+            headers.append('If-None-Match: %s' % self.etag)
+        if self.last_modified:
+            headers.append('If-Modified-Since: %s' % self.last_modified)
+        return headers
+
+    def result(self):
+        """
+        @return response (Response): copy of the stored response marked as `fromcache`
+        @return resp_body (str): response body
+        """
+        response = copy(self.response)
+        response.fromcache = True
+        return response, self.body
+
+
+class ResponseCache(object):
+    """ Thread-safe bounded LRU cache of responses"""
+
+    def __init__(self, max_entries=1024, max_size=64 * 1024 * 1024, static_ttl=STATIC_TTL):
+        """
+        @param max_entries (int): maximum count of entries
+        @param max_size (int): maximum total size of cached bodies, in bytes
+        @param static_ttl (int): lifetime in seconds for static files without explicit lifetime
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.static_ttl = static_ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stored': 0,
+            'evicted': 0,
+        }
+
+    @staticmethod
+    def make_key(method, url, headers=None, credentials=None):
+        """
+        @param method (str): method
+        @param url (str): url
+        @param headers (dict): request headers, only `KEY_HEADERS` are part of the key
+        @param credentials (str): fingerprint of cookies and auth set on handle, see `Curl.credentials_fingerprint`
+        @return (tuple): cache key
+        """
+        key_headers = ()
+        if headers:
+            key_headers = tuple(sorted((name.lower(), str(value)) for name, value in headers.iteritems()
+                                       if name.lower() in KEY_HEADERS))
+        return method, str(url), key_headers, credentials
+
+    @staticmethod
+    def is_static(url, static_files):
+        """
+        @param url (str): url
+        @param static_files (tuple): extensions of static files
+        @return (bool): url points to a static file
+        """
+        path = urlparse.urlsplit(str(url)).path.lower()
+        return any(path.endswith(ext) for ext in static_files)
+
+    def get_from_cache(self, key):
+        """
+        @param key (tuple): key from `make_key`
+        @return (CacheEntry|None): cache entry, may be stale
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries[key] = entry
+            if entry.is_fresh():
+                self._stats['hits'] += 1
+            else:
+                self._stats['misses'] += 1
+            return entry
+
+    def add_to_cache(self, key, response, body, static=False):
+        """ Store response if it is cacheable
+        @param key (tuple): key from `make_key`
+        @param response (Response): response
+        @param body (str): response body
+        @param static (bool): response is a static file
+        @return (CacheEntry|None): stored entry
+        """
+        if (response.status not in CACHEABLE_STATUSES or varies_on_other_headers(response) or
+                is_private(key, response)):
+            return None
+        lifetime = freshness_lifetime(response, static, self.static_ttl)
+        if lifetime is None:
+            return None
+        entry = CacheEntry(response, body, lifetime)
+        if (not lifetime and not entry.can_revalidate()) or entry.size > self.max_size:
+            return None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._size += entry.size
+            self._stats['stored'] += 1
+            while len(self._entries) > self.max_entries or self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self._stats['evicted'] += 1
+        return entry
+
+    def revalidated(self, key, entry, response, static=False):
+        """ Refresh entry after `304 Not Modified`
+        @param key (tuple): key from `make_key`
+        @param entry (CacheEntry): revalidated entry
+        @param response (Response): 304 response
+        @param static (bool): response is a static file
+        @return response (Response): stored response
+        @return resp_body (str): stored body
+        """
+        lifetime = None
+        if response.get('Cache-Control') or response.get('Expires'):
+            lifetime = freshness_lifetime(response, static, self.static_ttl)
+        if lifetime is None:
+            lifetime = freshness_lifetime(entry.response, static, self.static_ttl) or 0
+        with self._lock:
+            entry.expires = time.time() + lifetime
+            self._stats['revalidated'] += 1
+        return entry.result()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'entries': len(self._entries),
+                'size': self._size,
+            })
+        return stats
+
+
+_default_cache = ResponseCache()
+
+
+def set_cache(cache):
+    """ Replace cache of handles created after this call
+    @param cache (ResponseCache): cache
+    @return: None
+    """
+    global _default_cache
+    _default_cache = cache
+
+
+def get_cache():
+    """ Cache shared by all transport handles"""
+    return _default_cache
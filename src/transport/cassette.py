@@ -0,0 +1,256 @@
+import hashlib
+import marshal
+import os
+import struct
+import threading
+import time
+import zlib
+from copy import copy
+
+from src.logger import get_logger
+from . import exceptions
+from .cache import ResponseCache
+from .curl_connector import Response, VERSION_NAMES
+from .exceptions import BaseCurlException, ECurlCassetteMiss, ECurlConfigError
+from .pool import CurlPool
+from .profiles import get_profile
+
+log = get_logger('transport.cassette')
+
+MAGIC = 'EVECASSETTE1\n'
+RECORD_HEADER = struct.Struct('!I')
+
+RECORD = 'record'
+REPLAY = 'replay'
+AUTO = 'auto'  # replay known exchanges, record new ones
+MODES = (RECORD, REPLAY, AUTO)
+
+
+def make_key(method, url, body=None, headers=None):
+    """
+    @param method (str): method
+    @param url (object with __str__ method): url
+    @param body (str): request body
+    @param headers (dict): request headers, only headers which change response are part of the key
+    @return (tuple): key of exchange
+    """
+    body_hash = hashlib.sha1(body).hexdigest() if body else None
+    return ResponseCache.make_key(method, url, headers) + (body_hash,)
+
+
+class Exchange(object):
+    """ Recorded response or error"""
+
+    __slots__ = ('response', 'body', 'error', 'elapsed')
+
+    def __init__(self, response, body, error, elapsed):
+        self.response = response
+        self.body = body
+        self.error = error  # (exception class name, message)
+        self.elapsed = elapsed
+
+    def dumps(self, key):
+        statusline = raw_headers = None
+        if self.response is not None:
+            response = self.response
+            version = VERSION_NAMES.get(response.version, 'HTTP/1.1')
+            statusline = '%s %d %s' % (version, response.status, response.reason)
+            raw_headers = response.raw_headers
+        body = self.body
+        if body is not None and not isinstance(body, str):  # spooled body is a memory map
+            body = body[:]
+        return zlib.compress(marshal.dumps((key, self.error, self.elapsed, statusline, raw_headers, body)))
+
+    @staticmethod
+    def loads(data):
+        key, error, elapsed, statusline, raw_headers, body = marshal.loads(zlib.decompress(data))
+        response = Response(raw_headers, statusline) if statusline else None
+        return key, Exchange(response, body, error, elapsed)
+
+    def result(self):
+        """
+        @return (tuple): `(response, resp_body)`
+
+        @raise ECurl*: recorded error
+        """
+        if self.error is not None:
+            name, message = self.error
+            error_class = getattr(exceptions, name, None)
+            if not (isinstance(error_class, type) and issubclass(error_class, BaseCurlException)):
+                error_class = exceptions.ECurlUnknownRequestError
+            raise error_class(message)
+        return copy(self.response), self.body
+
+
+class Cassette(object):
+    """ Append-only file of exchanges with in-memory index
+
+    Record is a length-prefixed zlib-compressed marshal of key, status line,
+    raw headers, body and elapsed time. File is read once, lookups are dict lookups.
+    Exchanges recorded for one key several times are replayed in turn.
+    """
+
+    def __init__(self, path):
+        """
+        @param path (str): cassette file, created on first record
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}  # key -> [exchanges]
+        self._cursors = {}  # key -> index of exchange to replay next
+        self._file = None
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ECurlConfigError('%s is not a transport cassette' % self.path)
+            count = 0
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                data = f.read(RECORD_HEADER.unpack(header)[0])
+                try:
+                    key, exchange = Exchange.loads(data)
+                except Exception, e:  # truncated by interrupted recording
+                    log.warning('Cassette %s: broken record skipped (%s)' % (self.path, e))
+                    break
+                self._index.setdefault(key, []).append(exchange)
+                count += 1
+        log.debug('Cassette %s: %d exchanges loaded' % (self.path, count))
+
+    def __len__(self):
+        return sum(len(exchanges) for exchanges in self._index.itervalues())
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key):
+        """
+        @param key (tuple): key from `make_key`
+        @return (Exchange|None): exchange
+        """
+        exchanges = self._index.get(key)
+        if not exchanges:
+            return None
+        if len(exchanges) == 1:
+            return exchanges[0]
+        with self._lock:
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = (cursor + 1) % len(exchanges)
+        return exchanges[cursor]
+
+    def add(self, key, exchange):
+        """ Append exchange to file and index"""
+        data = exchange.dumps(key)
+        with self._lock:
+            if self._file is None:
+                new = not os.path.exists(self.path) or not os.path.getsize(self.path)
+                self._file = open(self.path, 'ab')
+                if new:
+                    self._file.write(MAGIC)
+            self._file.write(RECORD_HEADER.pack(len(data)) + data)
+            self._file.flush()
+            self._index.setdefault(key, []).append(exchange)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CassetteTransport(object):
+    """ Transport which records exchanges of live transport into cassette and replays them"""
+
+    def __init__(self, profile=None, path='transport.cassette', mode=REPLAY, latency=None, transport=None):
+        """
+        @param profile (Profile): transport profile of live requests, `default` profile by default
+        @param path (str): cassette file
+        @param mode (str): `record`, `replay` or `auto` (replay known exchanges, record new ones)
+        @param latency (str|float): replay delay: None - no delay, `original` - recorded time, float - seconds
+        @param transport (object): live transport for recording, `CurlPool` by default
+        """
+        if mode not in MODES:
+            raise ECurlConfigError('Unknown cassette mode %s' % mode)
+        self.profile = profile if profile is not None else get_profile()
+        self.mode = mode
+        self.latency = latency
+        self.cassette = Cassette(path)
+        self._transport = transport
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'replayed': 0,
+            'recorded': 0,
+            'missed': 0,
+        }
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            self._transport = CurlPool(profile=self.profile)
+        return self._transport
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, **curlargs):
+        """ Performing request, see `Curl.request`
+        @return response (Response):  response object
+        @return resp_body (str): response body
+
+        @raise ECurlCassetteMiss: exchange is not recorded in `replay` mode
+        """
+        key = make_key(method, url, body, headers)
+        exchange = self.cassette.get(key) if self.mode != RECORD else None
+        if exchange is None:
+            if self.mode == REPLAY:
+                self._count('missed')
+                raise ECurlCassetteMiss('Exchange is not recorded: %s %s' % (method, url))
+            exchange = self._record(key, url, method, body, headers, curlargs)
+        else:
+            self._count('replayed')
+            delay = exchange.elapsed if self.latency == 'original' else self.latency
+            if delay:
+                time.sleep(delay)
+        response, resp_body = exchange.result()
+        if sink is not None:
+            sink.write(resp_body)
+            resp_body = sink.getvalue()
+        return response, resp_body
+
+    def request_many(self, specs, **kwargs):
+        """ Perform requests concurrently on this transport, see `batch.request_many`
+        @return (list|generator): results in input order, result is `(response, resp_body)` or `ErrorResponse`
+        """
+        from .batch import request_many
+        return request_many(specs, self, **kwargs)
+
+    def stream(self, url, method='GET', body=None, headers=None, **curlargs):
+        """ Same as `request`, body is returned as one chunk"""
+        response, resp_body = self.request(url, method, body, headers, **curlargs)
+        return response, iter([resp_body] if resp_body else [])
+
+    def _record(self, key, url, method, body, headers, curlargs):
+        start = time.time()
+        try:
+            response, resp_body = self.transport.request(url, method, body, headers, **curlargs)
+        except BaseCurlException, e:
+            exchange = Exchange(None, None, (e.__class__.__name__, str(e)), time.time() - start)
+        else:
+            exchange = Exchange(response, resp_body, None, time.time() - start)
+        self.cassette.add(key, exchange)
+        self._count('recorded')
+        return exchange
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['exchanges'] = len(self.cassette)
+        return stats
+
+    def close(self):
+        self.cassette.close()
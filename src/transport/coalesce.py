@@ -0,0 +1,105 @@
+import sys
+import threading
+from copy import copy
+
+from src.core.utils.futures import Future, CancelledError
+
+COALESCE_METHODS = ('GET', 'HEAD')
+
+
+def make_key(method, url, headers=None, curlargs=None):
+    """
+    @param method (str): method
+    @param url (object with __str__ method): url
+    @param headers (dict): request headers
+    @param curlargs (dict): params for `Curl.configure`
+    @return (tuple): key of identical requests
+    """
+    key_headers = ()
+    if headers:
+        key_headers = tuple(sorted((name.lower(), str(value)) for name, value in headers.iteritems()))
+    return method, str(url), key_headers, repr(sorted(curlargs.items())) if curlargs else None
+
+
+def copy_result(result):
+    """ Copy of `(response, resp_body)` for another waiter, body string is immutable"""
+    response, resp_body = result
+    return copy(response), resp_body
+
+
+def follow(source, target):
+    """ Resolve `target` future with a copy of `source` result"""
+    if source.cancelled():
+        target.cancel()
+        return
+    try:
+        result = copy_result(source.result())
+    except CancelledError:
+        target.cancel()
+    except Exception, e:
+        target.set_exception(e, sys.exc_info())
+    else:
+        target.set_result(result)
+
+
+class SingleFlight(object):
+    """ Thread-safe registry of requests in flight
+
+    The first request with some key (leader) is performed, identical requests
+    which arrive while it is in flight are absorbed and get its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> Future of leader
+        self._stats = {
+            'leaders': 0,
+            'absorbed': 0,
+        }
+
+    def join(self, key, future):
+        """ Register request future or get future of identical request in flight
+        @param key (tuple): key from `make_key`
+        @param future (Future): future of request
+        @return (Future|None): leader future, None if `future` became the leader
+        """
+        with self._lock:
+            leader = self._flights.get(key)
+            if leader is not None and not leader.done():
+                self._stats['absorbed'] += 1
+                return leader
+            self._flights[key] = future
+            self._stats['leaders'] += 1
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return None
+
+    def do(self, key, fn, *args, **kwargs):
+        """ Call `fn` or wait for result of identical call in flight
+        @param key (tuple): key from `make_key`
+        @param fn (callable): function returning `(response, resp_body)`
+        @return (tuple): `(response, resp_body)`, response is a copy for absorbed calls
+        """
+        future = Future()
+        leader = self.join(key, future)
+        if leader is not None:
+            return copy_result(leader.result())
+        future.set_running_or_notify_cancel()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception, e:
+            exc_info = sys.exc_info()
+            future.set_exception(e, exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        future.set_result(result)
+        return result
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        return stats
@@ -0,0 +1,104 @@
+from src.config import configurator, ConfigurationError, ConfigContainer
+from src.transport import ENGINES
+from src.transport.cassette import MODES as CASSETTE_MODES
+from src.transport.warmup import MODES as WARMUP_MODES
+from src.transport.profiles import Profile
+from src.transport.proxies import ProxyPool
+
+
+@configurator(path='core.transport')
+def conf(config,
+         engine='pool',
+         pool_size=16,
+         pool_idle_timeout=300,
+         pool_checkout_timeout=30,
+         coalesce=True,
+         share_dns=True,
+         share_ssl_sessions=True,
+         share_connections=True,
+         stats_window=60,
+         retries=2,
+         retry_backoff=0.1,
+         retry_backoff_max=2.0,
+         hedge_percentile=None,
+         breaker_threshold=5,
+         breaker_reset_timeout=30,
+         cassette_path='transport.cassette',
+         cassette_mode='replay',
+         cassette_latency=None,
+         concurrency=16,
+         background_share=0.25,
+         batch_concurrency=16,
+         batch_host_concurrency=6,
+         warmup_mode='head',
+         warmup_connections=1,
+         warmup_refresh=55,
+         disk_cache_path=None,
+         disk_cache_size=256 * 1024 * 1024,
+         proxies=None,
+         proxy_check_url=None,
+         proxy_check_interval=30,
+         proxy_max_error_rate=0.5,
+         proxy_eviction_time=60,
+         profiles=None,
+         ):
+    profiles = profiles.to_dict() if profiles else {}
+    for name, settings in profiles.items():
+        settings = settings or {}
+        try:
+            Profile(name, **settings)  # compile to check settings
+        except Exception as e:
+            raise ConfigurationError('Invalid transport profile %s: %s' % (name, e))
+        profiles[name] = settings
+    profiles.setdefault('default', {})
+    if engine not in ENGINES:
+        raise ConfigurationError('Unknown transport engine %s' % engine)
+    if cassette_mode not in CASSETTE_MODES:
+        raise ConfigurationError('Unknown cassette mode %s' % cassette_mode)
+    proxies = [proxy.to_dict() if hasattr(proxy, 'to_dict') else proxy for proxy in proxies or []]
+    try:
+        ProxyPool(proxies)  # check proxy infos
+    except Exception as e:
+        raise ConfigurationError('Invalid transport proxies: %s' % e)
+    if not 0 < float(background_share) <= 1:
+        raise ConfigurationError('Background share must be in (0, 1], not %s' % background_share)
+    if warmup_mode and warmup_mode not in WARMUP_MODES:
+        raise ConfigurationError('Unknown warmup mode %s' % warmup_mode)
+    if cassette_latency not in (None, 'original'):
+        cassette_latency = float(cassette_latency)
+
+    return ConfigContainer({
+        'engine': engine,
+        'pool_size': int(pool_size),
+        'pool_idle_timeout': int(pool_idle_timeout),
+        'pool_checkout_timeout': int(pool_checkout_timeout),
+        'coalesce': bool(coalesce),
+        'share_dns': bool(share_dns),
+        'share_ssl_sessions': bool(share_ssl_sessions),
+        'share_connections': bool(share_connections),
+        'stats_window': int(stats_window),
+        'retries': int(retries),
+        'retry_backoff': float(retry_backoff),
+        'retry_backoff_max': float(retry_backoff_max),
+        'hedge_percentile': int(hedge_percentile) if hedge_percentile else None,
+        'breaker_threshold': int(breaker_threshold),
+        'breaker_reset_timeout': float(breaker_reset_timeout),
+        'cassette_path': cassette_path,
+        'cassette_mode': cassette_mode,
+        'cassette_latency': cassette_latency,
+        'concurrency': int(concurrency),
+        'background_share': float(background_share),
+        'batch_concurrency': int(batch_concurrency),
+        'batch_host_concurrency': int(batch_host_concurrency),
+        'warmup_mode': warmup_mode or None,
+        'warmup_connections': int(warmup_connections),
+        'warmup_refresh': float(warmup_refresh or 0),
+        'disk_cache_path': disk_cache_path,
+        'disk_cache_size': int(disk_cache_size),
+        'proxies': proxies,
+        'proxy_check_url': proxy_check_url,
+        'proxy_check_interval': float(proxy_check_interval),
+        'proxy_max_error_rate': float(proxy_max_error_rate),
+        'proxy_eviction_time': float(proxy_eviction_time),
+        'profiles': profiles,
+    })
@@ -61,6 +61,8 @@ CURL_HTTP_VERSION_2 = 3
 CURL_HTTP_VERSION_2TLS = 4
 
 CURL_HTTP_VERSION_2_0 = 3
+CURL_HTTP_VERSION_2_PRIOR_KNOWLEDGE = 5
+CURL_HTTP_VERSION_3 = 30
 
 CURL_HTTP_VERSION_LAST = 5
 CURL_HTTP_VERSION_NONE = 0
@@ -452,6 +454,7 @@ INFOTYPE_TEXT = 0
 INFO_CERTINFO = 4194338
 INFO_COOKIELIST = 4194332
 INFO_FILETIME = 2097166
+INFO_HTTP_VERSION = 2097198
 
 INFO_RTSP_CLIENT_CSEQ = 2097189
 
@@ -510,6 +513,7 @@ LOCAL_IP = 1048617
 LOCAL_PORT = 2097194
 
 LOCK_DATA_COOKIE = 2
+LOCK_DATA_CONNECT = 5
 LOCK_DATA_DNS = 3
 
 LOCK_DATA_SSL_SESSION = 4
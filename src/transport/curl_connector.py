@@ -1,11 +1,17 @@
+import hashlib
 import platform
 import pycurl
+import urlparse
 import curl_codes
 from io import BytesIO
-from StringIO import StringIO
 from contextlib import contextmanager
 
 from src.logger import get_logger
+from .cache import get_cache, CACHEABLE_METHODS
+from .sinks import BufferSink, ChunkQueue, SpoolSink
+from .profiles import BASE_PROFILE, DEFAULT_STATIC
+from .share import get_share
+from .stats import TimingRecord, get_stats, host_key
 from .exceptions import ECurlUndefinedAttribute
 from .exceptions import ECurlUndefinedMethod
 from .exceptions import ECurlStatusLineExpected
@@ -13,6 +19,7 @@ from .exceptions import ECurlConnectionTimeout
 from .exceptions import ECurlDownloadLimitExceeded
 from .exceptions import ECurlProxyError
 from .exceptions import ECurlUnknownRequestError
+from .exceptions import ECurlConnectionError
 from .exceptions import ECurlMethodRequestError
 from .exceptions import ECurlSSLConnectionError
 from .exceptions import ECurlConfigError
@@ -25,6 +32,9 @@ if pycurl.version_info()[2] >= 470784:  # hex(470784) => 0x72f00 => 0x07, 0x2f,
 else:
     raise Exception('libcurl version must be greater (%s < 7.47.0)' % pycurl.version_info()[1])
 
+CONNECTION_ERRORS = (codes.E_COULDNT_RESOLVE_HOST, codes.E_COULDNT_CONNECT, codes.E_GOT_NOTHING,
+                     codes.E_SEND_ERROR, codes.E_RECV_ERROR, codes.E_PARTIAL_FILE)
+
 UNKNOWN = 0
 WINDOWS = 1
 LINUX = 2
@@ -40,19 +50,7 @@ NULL = 'NUL' if OS == WINDOWS else '/dev/null'
 
 log = get_logger('transport')
 
-DEBUG_MODE = 1
-
-PROXY_TYPE_CONNECTOR = {
-    'socks4': codes.PROXYTYPE_SOCKS4,
-    'socks5': codes.PROXYTYPE_SOCKS5,
-    'socks5h': codes.PROXYTYPE_SOCKS5_HOSTNAME,
-    'http_no_connect': codes.PROXYTYPE_HTTP,
-    'transparent': codes.PROXYTYPE_HTTP,
-    'http': codes.PROXYTYPE_HTTP,  # TODO: check if right
-    # 'http_1_0': codes.PROXYTYPE_HTTP_1_0,
-    # 'socks4a': codes.PROXYTYPE_SOCKS4A,
-    # 'socks5_hostname': codes.PROXYTYPE_SOCKS5_HOSTNAME
-}
+DEBUG_MODE = 0  # capture VERBOSE output of every request (diagnostic mode)
 
 ALLOWED_CIPHERS = [
     'DEFAULT',
@@ -72,7 +70,6 @@ ALLOWED_CIPHERS = [
 
 _UTF8_TYPES = (bytes, type(None))
 BODY_METHODS = ("POST", "PATCH", "PUT")
-DEFAULT_STATIC = ['.js', '.pdf']
 
 
 def utf8(value):
@@ -90,58 +87,140 @@ def utf8(value):
     return value.encode("utf-8")
 
 
-class Response(dict):
-    """An object more like email.Message than httplib.HTTPResponse."""
-
-    """Is this response from our local cache"""
-    fromcache = False
+HTTP_VERSIONS = {
+    'HTTP/1.0': 10,
+    'HTTP/1.1': 11,
+    'HTTP/2': 20,
+    'HTTP/2.0': 20,
+    'HTTP/3': 30,
+}
+VERSION_NAMES = {version: name for name, version in HTTP_VERSIONS.iteritems() if name != 'HTTP/2.0'}  # for status line
+HTTP_VERSION_NAMES = {
+    codes.CURL_HTTP_VERSION_1_0: 'HTTP/1.0',
+    codes.CURL_HTTP_VERSION_1_1: 'HTTP/1.1',
+    codes.CURL_HTTP_VERSION_2_0: 'HTTP/2',
+    codes.CURL_HTTP_VERSION_3: 'HTTP/3',
+}
 
-    """HTTP protocol version used by server. 10 for HTTP/1.0, 11 for HTTP/1.1. """
-    version = 11
 
-    "Status code returned by server. "
-    status = 200
+class Response(object):
+    """An object more like email.Message than httplib.HTTPResponse.
 
-    """Reason phrase returned by server."""
-    reason = "Ok"
+    Raw header block is kept as is, case-insensitive index of headers is built on first access.
+    """
 
-    previous = None
+    __slots__ = ('status', 'reason', 'version', 'fromcache', 'previous', 'raw_headers', '_index')
 
     def __init__(self, headers, statusline):
-        try:
-            self["headers"] = [(i.split(":", 1)[0], i.split(":", 1)[1].strip())
-                               for i in headers if ':' in i]  # store headers in self["headers"] instead
-        except IndexError as e:
-            self["headers"] = [
-                (i.split(":", 1)[0], i.split(":", 1)[1].strip()) if len(i.split(":", 1)) > 1 else ('', i.strip())
-                for i in headers if ':' in i]  # bad header without ':' sign
-        for i in self['headers']:
-            self[i[0]] = i[1]
-
-        sl_splitted = statusline.strip().split(' ')
-        self.status = int(sl_splitted[1])
-        self['status'] = str(sl_splitted[1])
-        self.reason = sl_splitted[2:]
-        try:
-            self.version = int(''.join(sl_splitted[0].split('/')[-1].split('.')))
-        except Exception, e:
-            self.version = 10
+        """
+        @param headers (str|list): raw header block or list of header lines
+        @param statusline (str): status line
+        """
+        if not isinstance(headers, basestring):
+            headers = '\r\n'.join(headers)
+        self.raw_headers = headers
+        self._index = None
+        self.fromcache = False  # is this response from our local cache
+        self.previous = None
+
+        sl_splitted = statusline.strip().split(' ', 2)
+        self.status = int(sl_splitted[1])  # status code returned by server
+        self.reason = sl_splitted[2] if len(sl_splitted) > 2 else ''  # reason phrase returned by server
+        # HTTP protocol version used by server. 10 for HTTP/1.0, 11 for HTTP/1.1, 20 for HTTP/2
+        self.version = HTTP_VERSIONS.get(sl_splitted[0].upper(), 10)
+
+    def __copy__(self):
+        response = Response.__new__(Response)
+        for name in self.__slots__:
+            setattr(response, name, getattr(self, name))
+        return response
+
+    def __repr__(self):
+        return '<Response status=%d fromcache=%s>' % (self.status, self.fromcache)
+
+    @property
+    def headers(self):
+        """
+        @return (list): `(name, value)` pairs in order of receiving
+        """
+        headers = []
+        for line in self.raw_headers.splitlines():
+            if line[:1] in (' ', '\t') and headers:  # obsolete line folding
+                headers[-1] = (headers[-1][0], headers[-1][1] + ' ' + line.strip())
+            elif ':' in line:
+                name, value = line.split(':', 1)
+                headers.append((name.strip(), value.strip()))
+        return headers
+
+    def _get_index(self):
+        if self._index is None:
+            index = {}
+            for name, value in self.headers:
+                index.setdefault(name.lower(), []).append(value)
+            self._index = index
+        return self._index
+
+    def __getitem__(self, name):
+        """
+        @param name (str): header name, case-insensitive
+        @return (str): value of the last header with this name
 
-    def __getattr__(self, name):
-        if name == 'dict':
-            return self
-        else:
-            raise AttributeError(name)
+        @raise KeyError: no such header
+        """
+        return self._get_index()[name.lower()][-1]
+
+    def __contains__(self, name):
+        return name.lower() in self._get_index()
+
+    def get(self, name, default=None):
+        values = self._get_index().get(name.lower())
+        return values[-1] if values else default
+
+    def get_all(self, name):
+        """
+        @param name (str): header name, case-insensitive
+        @return (list): values of all headers with this name
+        """
+        return list(self._get_index().get(name.lower(), ()))
+
+    def keys(self):
+        return self._get_index().keys()
+
+    def items(self):
+        return self.headers
 
 
 class Curl(object):
     """ Transport implementation"""
 
     # _cookie_file = None
-    def __init__(self, *args, **kwargs):
+    def __init__(self, cache=None, share=None, stats=None, *args, **kwargs):
+        """
+        @param cache (ResponseCache): response cache, shared transport cache by default
+        @param share (CurlShare): DNS/SSL session/connection share, shared transport share by default
+        @param stats (TransportStats): receiver of timing records, shared transport stats by default
+        """
         self.h = pycurl.Curl()
+        self._options = {}  # option -> value, set on handle
+        self.profile = None
+        self._share = share if share is not None else get_share()
+        if self._share is not None:
+            self._share.attach(self)
+        self._stats = stats
+        self._transfer_recorded = True
+        self.last_timing = None
+        self._cache = cache if cache is not None else get_cache()
+        self._cache_key = None
+        self._cache_entry = None
+        self.use_cache = True
+        self.no_body = False
+        self.static_files = tuple(DEFAULT_STATIC)
         self.write_buffer = None
+        self.downloaded = 0
         self.debug_buffer = None
+        self.header_buffer = None
+        self.debug = DEBUG_MODE
+        self._last_request = None
         self.curl_options = {
             "GET": codes.HTTPGET,
             "POST": codes.POST,
@@ -156,136 +235,65 @@ class Curl(object):
         self.http_auth_creds = None
         self.connection_close = False
         self.download_limit = 15728640
+        self.spool_threshold = None
+        self.timeouts = (15, 5)
+        self.adaptive_timeout = None
         self._error = (None, None)
+        self.base_profile = BASE_PROFILE  # settings of requests without profile, see `configure`
+        self.apply_profile(BASE_PROFILE)
 
-    def configure(self, download_limit=None, no_body=False,
-                  raw_response=False, max_redirects=None, keep_alive=False, timeout=15, expect100_timeout_ms=1000,
-                  connect_timeout=5, validate_cert=False, allow_ipv6=True, proxy_info=None, handle_cookie=False,
-                  static_files=None, ciper=None, SSLv3=False, http_auth_credintals=None, connection_close=False,
-                  cookie_data=None):
-        """ Configure transport before sending request
-        @param download_limit (int): download limit for pages, in bytes
-        @param no_body (bool): get response without body
-        @param raw_response (bool): return raw response (with headers in body)
-        @param max_redirects (int): count of maximum redirects
-        @param keep_alive (bool): sending keep-alive header
-        @param timeout (int): timeout for request
-        @param expect100_timeout_ms (int): time in ms for waiting for `expect:100` header
-        @param connect_timeout (int): timeot for connect
-        @param validate_cert (bool): validation of certificate
-        @param allow_ipv6 (bool): using ipv6
-        @param proxy_info (dict): information for connection via proxy
-        @param static_files (tuple): overwrite default extensions for static files
-        @param ciper (str): setting ciper for ssl connection
-        @param SSLv3 (bool): using SSLv3
-        @param http_auth_credintals (list): credintals for http auth
-        @param connection_close (bool): sending `connection:close` header
+    def configure(self, **settings):
+        """ Configure transport for requests without profile, `curlargs` of request override these settings
+        @param settings (dict): params for `profiles.compile_options`, unset params have default values
         @return: None
 
         @raise Exception: timeout or connect_timeout type error
         """
-        self.reset()
-        self.setopt(codes.NOPROGRESS, 1)
-        self.setopt(codes.PATH_AS_IS, 1)
-        self.setopt(codes.ACCEPT_ENCODING, '')
-        self.setopt(codes.FOLLOWLOCATION, 0)
-        self.setopt(codes.MAXREDIRS, max_redirects if max_redirects else -1)
-        self.setopt(codes.TCP_KEEPALIVE, keep_alive)
-        self.setopt(codes.HEADER, raw_response)
-
-        if not download_limit:
-            download_limit = 15728640  # 15 Mb
-        if download_limit > 104857600:
-            log.warning("Config: download limit exceeded. Limit setted to default value (100 Mb).")
-            download_limit = 104857600  # 100 Mb
-
-        self.download_limit = download_limit
-        self.setopt(codes.MAXFILESIZE, download_limit)
-        self.setopt(codes.PROGRESSFUNCTION, self.progress_handler)
-        self.setopt(codes.NOPROGRESS, 0)
-
-        try:
-            timeout = int(timeout) if timeout else 15  # or zero?
-        except Exception, e:
-            raise Exception('Timeout must be int, not %s' % type(timeout))
-        self.setopt(codes.TIMEOUT, timeout)
+        self.base_profile = BASE_PROFILE.derive(**settings)
+        self.apply_profile(self.base_profile)
 
+    def apply_profile(self, profile):
+        """ Apply transport profile, only options which differ from the current ones are sent to libcurl
+        @param profile (Profile): profile
+        @return: None
+        """
+        for option, value in profile.sticky:
+            if value is None and self._options.get(option) is not None:
+                self.renew()
+                break
         try:
-            connect_timeout = int(connect_timeout) if connect_timeout else 5  # or zero?
-        except Exception, e:
-            raise Exception('Connect_timeout must be int, not %s' % type(connect_timeout))
-        self.setopt(codes.CONNECTTIMEOUT, connect_timeout)
-
-        self.setopt(codes.EXPECT_100_TIMEOUT_MS, expect100_timeout_ms)
-        self.setopt(codes.NOBODY, no_body)
-        self.connection_close = True if connection_close or raw_response else False
-
-        self._cache.set_static(static_files)
-
-        # libcurl/pycurl is not thread-safe by default.  When multiple threads
-        # are used, signals should be disabled.  This has the side effect
-        # of disabling DNS timeouts in some environments (when libcurl is
-        # not linked against ares), so we don't do it when there is only one
-        # thread.
-        self.setopt(codes.NOSIGNAL, 1)
-
-        # https://github.com/hwi/HWIOAuthBundle/issues/655
-        # Real problem was that CURL (through Buzz) used ipv6 when available.
-        # Request on IPV6 address timed out after 5s, a request on an IPV4 address
-        # was then done with success. Forcing use of ipv4 would have fix the issue
-        # in my particular case. Unfortunately neither HWIOAuthBundle nor Buzz
-        # (so far I know) let user set the CURLOPT_IPRESOLVE option to CURL_IPRESOLVE_V4.
-        #
-        # A solution could be to change internal DNS to bypass IPV6 addresses so we
-        # only receive IPV4 but we didn't test it.
-        self.setopt(codes.IPRESOLVE, codes.IPRESOLVE_V4)
-
-        if handle_cookie:
-            self.setopt(pycurl.COOKIEFILE, "")
-        else:
-            self.setopt(codes.COOKIEJAR, None)
-            self.setopt(codes.COOKIELIST, 'ALL')
-
-        if cookie_data:
-            self.setopt(codes.COOKIE, cookie_data)
-
-        if validate_cert:
-            self.setopt(codes.SSL_VERIFYPEER, 1)
-            self.setopt(codes.SSL_VERIFYHOST, 2)
-        else:
-            self.setopt(codes.SSL_VERIFYPEER, 0)
-            self.setopt(codes.SSL_VERIFYHOST, 0)
-
-        if not allow_ipv6:
-            # Curl behaves reasonably when DNS resolution gives an ipv6 address
-            # that we can't reach, so allow ipv6 unless the user asks to disable.
-            self.setopt(codes.IPRESOLVE, codes.IPRESOLVE_V4)
-        else:
-            self.setopt(codes.IPRESOLVE, codes.IPRESOLVE_WHATEVER)
-
-        for method in self.curl_options.values():
-            self.setopt(method, False)
-
-        if proxy_info:
-            # proxy_info.proxy_rdns is not used
-            self.setopt(codes.PROXY, proxy_info['host'])
-            self.setopt(codes.PROXYTYPE, PROXY_TYPE_CONNECTOR.get(proxy_info['type'], codes.PROXYTYPE_HTTP))
-            self.setopt(codes.PROXYPORT, proxy_info['port'])
-            if 'user' in proxy_info and 'pass' in proxy_info:
-                credentials = '%s:%s' % (proxy_info['user'],
-                                         proxy_info['pass'])
-                self.setopt(codes.PROXYUSERPWD, credentials)
-
-        if ciper:
-            self.setopt(codes.SSL_CIPHER_LIST, ciper)
-        else:
-            self.setopt(codes.SSL_CIPHER_LIST, None)
-
-        if http_auth_credintals:
-            self.add_credentials(**http_auth_credintals)
-
-        self.setopt_credintals()
-        self.setopt_SSLv3(SSLv3)
+            for option, value in profile.options:
+                if self._options.get(option) != value:
+                    self.setopt(option, value)
+        except (pycurl.error, TypeError):  # option can not be unset, start from scratch
+            self.reset()
+            for option, value in profile.options:
+                if value is not None:
+                    self.setopt(option, value)
+        if profile is not self.profile:
+            for option, value in profile.actions:
+                self.setopt(option, value)
+        for name, value in profile.attributes:
+            setattr(self, name, value)
+        self.profile = profile
+
+    def setopt(self, option, value):
+        self.h.setopt(option, value)
+        self._options[option] = value
+
+    def reset(self):
+        self.h.reset()
+        self._options.clear()
+        self.profile = None
+
+    def renew(self):
+        """ Replace libcurl handle with a fresh one, e.g. cookie engine survives `reset` and can not be turned off"""
+        self.h.close()
+        self.h = pycurl.Curl()
+        self._options.clear()
+        self.profile = None
+        if self._share is not None:
+            self._share.attach(self)
 
     def setopt_credintals(self):
         """Set credintals"""
@@ -297,8 +305,8 @@ class Curl(object):
         self.setopt(codes.SSLVERSION, codes.SSLVERSION_SSLv3 if self.SSLv3 or flag else codes.SSLVERSION_DEFAULT)
 
     def set_SSLv3(self, turn_on=True):
-        self.SSLv3 = turn_on
-        self.setopt_SSLv3()
+        self.base_profile = self.base_profile.derive(SSLv3=bool(turn_on))
+        self.apply_profile(self.base_profile)
 
     def add_credentials(self, username, password):
         """ Set credintals for http auth
@@ -306,15 +314,26 @@ class Curl(object):
         @param password (str): password
         @return: None
         """
-        self.http_auth_creds = (username, password)
-        self.setopt_credintals()
+        self.base_profile = self.base_profile.derive(http_auth_credintals={'username': username,
+                                                                            'password': password})
+        self.apply_profile(self.base_profile)
 
     def clear_credentials(self):
-        self.http_auth_creds = None
-
-    def init_storages(self):
-        self.write_buffer = StringIO()
-        self.debug_buffer = {i: [] for i in xrange(7)}
+        self.base_profile = self.base_profile.derive(http_auth_credintals=None)
+        self.apply_profile(self.base_profile)
+
+    def set_debug(self, turn_on=True):
+        """ Switch diagnostic mode: VERBOSE output of requests is captured in `debug_buffer`"""
+        self.debug = turn_on
+
+    def init_storages(self, sink=None):
+        if sink is None:
+            sink = SpoolSink(self.spool_threshold) if self.spool_threshold else BufferSink()
+        self.write_buffer = sink
+        self.downloaded = 0
+        self.header_buffer = []
+        self.debug_buffer = {i: [] for i in xrange(7)} if self.debug else None
+        self._error = (None, None)
 
     def __getattr__(self, item):
         if hasattr(self.h, item):
@@ -323,20 +342,19 @@ class Curl(object):
             return getattr(self, item)
         raise ECurlUndefinedAttribute(item)
 
-    @contextmanager
-    def prepare_to_request(self, url, method='GET', body=None, headers=None, **curlargs):
-        """
+    def prepare(self, url, method='GET', body=None, headers=None, sink=None, profile=None, **curlargs):
+        """ Prepare handle for request, see `prepare_to_request`
         @param url (method): url for request
         @param method (str): method
         @param body (str): body
         @param headers (list): additional headers
+        @param sink (BaseSink): receiver of body chunks, response cache is not used with custom sink
+        @param profile (Profile): transport profile, `base_profile` by default, `curlargs` override its settings
         @param curlargs (dict): additional params for `configure` method
-        @return (None): None
+        @return (tuple|None): `(response, resp_body)` from cache, request must not be performed
 
         @raise ECurlUndefinedMethod: method is undefined
         @raise ECurlMethodRequestError: can't set body for this method
-
-        @yield None
         """
         # print '[Curl_] prepare request:', url, method
         # print '[Curl_] cookie before preparing:', self.get_curl_cookies()
@@ -344,12 +362,23 @@ class Curl(object):
         #     cstr = headers.pop('cookie')
         #     if isinstance(curlargs['cookie_data'], str):
         #         curlargs['cookie_data'] += '; '+cstr
-        if curlargs:
-            self.configure(**curlargs)
+        # one-off `curlargs` are not kept on handle, every request starts from profile
+        self.apply_profile((profile or self.base_profile).derive(**curlargs))
         # print '[Curl_] cookie after preparing:', self.get_curl_cookies()
-        self.init_storages()
+        self.init_storages(sink)
+        if sink is None:
+            cached = self.lookup_cache(url, method, headers)
+            if cached is not None:
+                return cached
+        else:
+            self._cache_key = self._cache_entry = None
+        self._transfer_recorded = False
+        if self.adaptive_timeout is not None:
+            self.apply_timeouts(url)
         self.setopt(codes.URL, str(url))
         headers_to_curl = ['Expect:']
+        if self._cache_entry is not None:
+            headers_to_curl.extend(self._cache_entry.conditional_headers())
         if self.connection_close:
             headers_to_curl.append('Connection: Close')
         if headers:
@@ -358,10 +387,13 @@ class Curl(object):
                     continue
                 headers_to_curl.append("%s: %s" % (i, headers[i]))
         self.setopt(codes.HTTPHEADER, headers_to_curl)
+        self._last_request = (method, url, headers_to_curl, body)
         if method in self.curl_options:
             self.setopt(self.curl_options[method], True)
         else:
             raise ECurlUndefinedMethod(method)
+        if self.no_body:
+            self.setopt(codes.NOBODY, True)
         body_expected = method in BODY_METHODS
         body = str(body) if body is not None else ''
         if body_expected or body:
@@ -386,15 +418,41 @@ class Curl(object):
                 self.setopt(codes.UPLOAD, True)
                 self.setopt(codes.INFILESIZE, len(body or ''))
 
-        self.setopt(codes.WRITEDATA, self.write_buffer)
-        self.setopt(codes.VERBOSE, 1)
-        self.setopt(codes.DEBUGFUNCTION, self.debug_handler)
-
-        yield
+        self.setopt(codes.WRITEFUNCTION, self.write_handler)
+        self.setopt(codes.HEADERFUNCTION, self.header_handler)
+        if self.debug:
+            self.setopt(codes.VERBOSE, 1)
+            self.setopt(codes.DEBUGFUNCTION, self.debug_handler)
 
+    def cleanup(self):
+        """ Reset request-specific options after request"""
         self.setopt(codes.URL, '')
         self.setopt(codes.HTTPHEADER, [])
-        self.setopt(codes.VERBOSE, 0)
+        if self.debug:
+            self.setopt(codes.VERBOSE, 0)
+
+    @contextmanager
+    def prepare_to_request(self, url, method='GET', body=None, headers=None, sink=None, profile=None, **curlargs):
+        """
+        @param url (method): url for request
+        @param method (str): method
+        @param body (str): body
+        @param headers (list): additional headers
+        @param sink (BaseSink): receiver of body chunks
+        @param profile (Profile): transport profile
+        @param curlargs (dict): additional params for `configure` method
+        @return (None): None
+
+        @raise ECurlUndefinedMethod: method is undefined
+        @raise ECurlMethodRequestError: can't set body for this method
+
+        @yield (tuple|None): `(response, resp_body)` from cache, request must not be performed
+        """
+        cached = self.prepare(url, method, body, headers, sink, profile, **curlargs)
+        try:
+            yield cached
+        finally:
+            self.cleanup()
 
     def get_last_ip(self):
         """ Get last used ip for connection
@@ -402,22 +460,24 @@ class Curl(object):
         """
         return self.getinfo(codes.PRIMARY_IP)
 
-    def request(self, url, method='GET', body=None, headers=None, **curlargs):
+    def request(self, url, method='GET', body=None, headers=None, sink=None, profile=None, **curlargs):
         """ Performing request
         @param url (object with __str__ method): url for request
         @param method (str): method
         @param body (str): body
         @param headers (list): additional headers
+        @param sink (BaseSink): receiver of body chunks, body is kept in memory by default
+        @param profile (Profile): transport profile, `base_profile` by default, `curlargs` override its settings
         @param curlargs (dict): additional params for `configure` method
         @return response (Response):  response object
-        @return resp_body (str): response body
-        @return raw_request (str): raw request
+        @return resp_body (str): response body, `sink.getvalue()` for custom sink
 
         @raise ECurlConnectionTimeout: timeout error
         @raise ECurlDownloadLimitExceeded: download limit exceeded
         @raise ECurlProxyError: proxy error while trying request
         @raise ECurlSSLConnectionError: SSL error while trying request
         @raise ECurlConfigError: URL was not properly formatted
+        @raise ECurlConnectionError: connection failed or was broken
         @raise ECurlUnknownRequestError: unknown curl error
         @raise ECurlStatusLineExpected: no statusline in response
         @raise Shutdown: immediatly shutdown request
@@ -425,51 +485,228 @@ class Curl(object):
         """
         response = None
         resp_body = None
-        raw_request = None
-        # cached = self._cache.get_from_cache(url)
-        # if cached:  # remember about basic auth
-        #     return cached
         # if get_registry().shutdown_requested:
         #     raise Exception('Raising Shutdown again (probably someone caught and ignored it)') # todo: shutdown!
-        with self.prepare_to_request(url, method, body, headers, **curlargs):
+        with self.prepare_to_request(url, method, body, headers, sink, profile, **curlargs) as cached:
+            if cached is not None:
+                return cached
             try:
                 self.perform()
             except pycurl.error, e:
-                effective_url = self.getinfo(codes.EFFECTIVE_URL)
-
-                if self._error[0]:
-                    err_code, err_message = self._error
-                else:
-                    err_code = e[0]
-                    err_message = e[1]
-
-                err_str = (effective_url, err_message)
-
-                if err_code == codes.E_OPERATION_TIMEDOUT:
-                    raise ECurlConnectionTimeout('Timeout error while trying (%s: %s)' % err_str)
-                if err_code == codes.E_FILESIZE_EXCEEDED:
-                    raise ECurlDownloadLimitExceeded('Download limit exceeded on %s' % err_str[0])
-                if err_code == codes.E_COULDNT_RESOLVE_PROXY:
-                    raise ECurlProxyError('Proxy error while trying request (%s: %s)' % err_str)
-                if err_code == codes.E_SSL_CONNECT_ERROR:
-                    raise ECurlSSLConnectionError('SSL error while trying request (%s: %s)' % err_str)
-                if err_code == codes.E_URL_MALFORMAT:
-                    raise ECurlConfigError('URL was not properly formatted (%s: %s)' % err_str)
-                raise ECurlUnknownRequestError('Unknown error while trying %s: %s' % err_str)
+                self.raise_error(e[0], e[1])
             except Exception, e:
                 raise
-            # import pprint;  pprint.pprint(self.debug_buffer)
-            splitted = self.debug_buffer[1][-1].split('\r\n')
-            if ':' in splitted[0]:
-                raise ECurlStatusLineExpected()
-            response = Response(splitted[1:], splitted[0])
-            resp_body = self.write_buffer.getvalue()
+            response, resp_body = self.get_response()
+        return response, resp_body
 
+    def raw_request(self):
+        """ Raw request of the last transfer
+        In diagnostic mode request is taken from libcurl output, otherwise it is rebuilt from request
+        params (headers added by libcurl itself, e.g. `Accept-Encoding`, are missing).
+        @return (str|None): raw request
+        """
+        if self.debug_buffer and self.debug_buffer[codes.INFOTYPE_HEADER_OUT]:
             raw_request = self.debug_buffer[codes.INFOTYPE_HEADER_OUT][-1]
             if self.debug_buffer[codes.INFOTYPE_DATA_OUT]:  # append POST data
                 raw_request += self.debug_buffer[codes.INFOTYPE_DATA_OUT][-1]
+            return raw_request
+        if self._last_request is None:
+            return None
+        method, url, headers, body = self._last_request
+        parsed = urlparse.urlsplit(str(url))
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % parsed.netloc]
+        lines.extend(i for i in headers if not i.endswith(':'))
+        return '\r\n'.join(lines) + '\r\n\r\n' + (body or '')
+
+    def stream(self, url, method='GET', body=None, headers=None, profile=None, **curlargs):
+        """ Performing request, body is returned by chunks as soon as they are received
+        @param url (object with __str__ method): url for request
+        @param method (str): method
+        @param body (str): body
+        @param headers (list): additional headers
+        @param profile (Profile): transport profile, `base_profile` by default, `curlargs` override its settings
+        @param curlargs (dict): additional params for `configure` method
+        @return response (Response):  response object
+        @return chunks (generator): body chunks, must be consumed or closed to finish the transfer
 
-                # self._cache.add_to_cache(url, (response, resp_body, raw_request))
+        @raise ECurl*: see `request`, errors after the first chunk are raised by `chunks`
+        """
+        sink = ChunkQueue()
+        self.prepare(url, method, body, headers, sink, profile, **curlargs)
+        multi = pycurl.CurlMulti()
+        multi.add_handle(self.h)
+        try:
+            running = True
+            while running and not sink:
+                running = self._stream_step(multi)
+            response, resp_body = self.get_response()
+        except Exception:
+            self._stream_close(multi)
+            raise
+        return response, self._stream_chunks(multi, sink, running)
+
+    def _stream_step(self, multi):
+        """ Drive streamed transfer
+        @return (bool): transfer is not completed yet
+        """
+        ret = codes.E_CALL_MULTI_PERFORM
+        while ret == codes.E_CALL_MULTI_PERFORM:
+            ret, num_handles = multi.perform()
+        num_queued, ok_list, err_list = multi.info_read()
+        if err_list:
+            self.raise_error(err_list[0][1], err_list[0][2])
+        if ok_list:
+            return False
+        multi.select(1.0)
+        return True
+
+    def _stream_chunks(self, multi, sink, running):
+        try:
+            while running or sink:
+                for chunk in sink.pop_all():
+                    yield chunk
+                if running:
+                    running = self._stream_step(multi)
+        finally:
+            self._stream_close(multi)
+
+    def _stream_close(self, multi):
+        multi.remove_handle(self.h)
+        multi.close()
+        self.cleanup()
+
+    def raise_error(self, err_code, err_message):
+        """ Convert libcurl error of the last transfer to transport exception
+        @param err_code (int): libcurl error code
+        @param err_message (str): libcurl error message
+        @return (None): never returns
+
+        @raise ECurlConnectionTimeout: timeout error
+        @raise ECurlDownloadLimitExceeded: download limit exceeded
+        @raise ECurlProxyError: proxy error while trying request
+        @raise ECurlSSLConnectionError: SSL error while trying request
+        @raise ECurlConfigError: URL was not properly formatted
+        @raise ECurlConnectionError: connection failed or was broken
+        @raise ECurlUnknownRequestError: unknown curl error
+        """
+        if self._error[0]:
+            err_code, err_message = self._error
+
+        self.transfer_done(err_code)
+        effective_url = self.getinfo(codes.EFFECTIVE_URL)
+
+        err_str = (effective_url, err_message)
+
+        if err_code == codes.E_OPERATION_TIMEDOUT:
+            raise ECurlConnectionTimeout('Timeout error while trying (%s: %s)' % err_str)
+        if err_code == codes.E_FILESIZE_EXCEEDED:
+            raise ECurlDownloadLimitExceeded('Download limit exceeded on %s' % err_str[0])
+        if err_code == codes.E_COULDNT_RESOLVE_PROXY:
+            raise ECurlProxyError('Proxy error while trying request (%s: %s)' % err_str)
+        if err_code == codes.E_SSL_CONNECT_ERROR:
+            raise ECurlSSLConnectionError('SSL error while trying request (%s: %s)' % err_str)
+        if err_code == codes.E_URL_MALFORMAT:
+            raise ECurlConfigError('URL was not properly formatted (%s: %s)' % err_str)
+        if err_code in CONNECTION_ERRORS:
+            raise ECurlConnectionError('Connection error while trying (%s: %s)' % err_str)
+        raise ECurlUnknownRequestError('Unknown error while trying %s: %s' % err_str)
+
+    def get_response(self):
+        """ Build response of the last successful transfer
+        @return response (Response):  response object
+        @return resp_body (str): response body
+
+        @raise ECurlStatusLineExpected: no statusline in response
+        """
+        self.transfer_done()
+        if not self.header_buffer or not self.header_buffer[0].startswith('HTTP/'):
+            raise ECurlStatusLineExpected()
+        response = Response(''.join(self.header_buffer[1:]), self.header_buffer[0])
+        resp_body = self.write_buffer.getvalue()
+        return self.store_cache(response, resp_body)
+
+    def apply_timeouts(self, url):
+        """ Set timeouts of request derived from latency of host, see `TransportStats.timeouts`
+        @param url (object with __str__ method): url for request
+        @return (tuple): `(timeout, connect_timeout)` in seconds
+        """
+        multiplier, min_timeout, min_connect_timeout = self.adaptive_timeout
+        timeout, connect_timeout = self.timeouts
+        timeouts = (self._stats or get_stats()).timeouts(host_key(url), multiplier,
+                                                         (min(min_timeout, timeout), timeout),
+                                                         (min(min_connect_timeout, connect_timeout), connect_timeout))
+        for option, value in zip((codes.TIMEOUT_MS, codes.CONNECTTIMEOUT_MS), timeouts):
+            value = int(value * 1000)
+            if self._options.get(option) != value:
+                self.setopt(option, value)
+        return timeouts
+
+    def transfer_done(self, error=None):
+        """ Record timings of the last transfer, only once per request
+        @param error (int): libcurl error code, None for successful transfer
+        @return (TimingRecord|None): record, None if transfer was already recorded
+        """
+        if self._transfer_recorded:
+            return None
+        self._transfer_recorded = True
+        record = TimingRecord.from_curl(self, self._last_request[0] if self._last_request else None, error)
+        self.last_timing = record
+        (self._stats or get_stats()).record(record)
+        if self._share is not None:
+            self._share.record(record)
+        return record
+
+    def credentials_fingerprint(self):
+        """ Digest of cookies and http auth which handle sends with request, part of cache key
+        @return (str|None): digest, None if handle sends no credentials
+        """
+        state = [self._options.get(codes.COOKIE), self._options.get(codes.USERPWD)]
+        if self._options.get(codes.COOKIEFILE) is not None:  # cookie engine is on
+            state.append(tuple(self.h.getinfo(codes.INFO_COOKIELIST)))
+        if not any(state):
+            return None
+        return hashlib.sha1(repr(state)).hexdigest()
+
+    def lookup_cache(self, url, method='GET', headers=None):
+        """ Find response for request in cache
+        Stale entry with validators is kept for conditional request.
+        @param url (object with __str__ method): url for request
+        @param method (str): method
+        @param headers (dict): request headers
+        @return (tuple|None): `(response, resp_body)` of fresh entry
+        """
+        self._cache_key = None
+        self._cache_entry = None
+        if not self.use_cache or method not in CACHEABLE_METHODS:
+            return None
+        if headers and any(i.lower() in ('if-none-match', 'if-modified-since') for i in headers):
+            return None
+        self._cache_key = self._cache.make_key(method, url, headers, self.credentials_fingerprint())
+        entry = self._cache.get_from_cache(self._cache_key)
+        if entry is None:
+            return None
+        if entry.is_fresh():
+            return entry.result()
+        if entry.can_revalidate():
+            self._cache_entry = entry
+        return None
+
+    def store_cache(self, response, resp_body):
+        """ Store response of the last transfer in cache, resolve `304 Not Modified`
+        @param response (Response): response
+        @param resp_body (str): response body
+        @return response (Response): response for caller
+        @return resp_body (str): response body for caller
+        """
+        if self._cache_key is None:
+            return response, resp_body
+        static = self._cache.is_static(self._cache_key[1], self.static_files)
+        if response.status == 304 and self._cache_entry is not None:
+            return self._cache.revalidated(self._cache_key, self._cache_entry, response, static)
+        self._cache.add_to_cache(self._cache_key, response, resp_body, static)
         return response, resp_body
 
     def get_curl_cookies(self):
@@ -477,6 +714,16 @@ class Curl(object):
         cookie_list = self.getinfo(codes.INFO_COOKIELIST)
         return cookie_list
 
+    def header_handler(self, line):
+        """ Collect status line and headers of the last response (skips `100 Continue` and redirects)
+        @param line (str): header line
+        @return (None): None
+        """
+        if line.startswith('HTTP/'):
+            self.header_buffer = [line]
+        else:
+            self.header_buffer.append(line)
+
     def debug_handler(self, code, data):
         """
         @param code (int): code of message type
@@ -492,13 +739,17 @@ class Curl(object):
         except (KeyboardInterrupt, SystemExit):
             pass
 
-    def progress_handler(self, download_total, downloaded, upload_total, uploaded):
-        try:
-            if self.write_buffer.len > self.download_limit:
-                self._error = (codes.E_FILESIZE_EXCEEDED, "")
-                return -1
-        except KeyboardInterrupt:
-            return -1
+    def write_handler(self, chunk):
+        """ Pass body chunk to sink, abort transfer as soon as download limit is exceeded
+        @param chunk (str): body chunk
+        @return (int|None): 0 to abort transfer
+        """
+        downloaded = self.downloaded + len(chunk)
+        if downloaded > self.download_limit:
+            self._error = (codes.E_FILESIZE_EXCEEDED, "")
+            return 0
+        self.downloaded = downloaded
+        self.write_buffer.write(chunk)
 
     def full_info(self):
         return {
@@ -511,8 +762,10 @@ class Curl(object):
                 'redirect-time': self.getinfo(codes.REDIRECT_TIME),
                 'filetime': self.getinfo(codes.INFO_FILETIME),
                 'connect-time': self.getinfo(codes.CONNECT_TIME),
+                'appconnect-time': self.getinfo(codes.APPCONNECT_TIME),
             },
             'effective-url': self.getinfo(codes.EFFECTIVE_URL),
+            'http-version': HTTP_VERSION_NAMES.get(self.getinfo(codes.INFO_HTTP_VERSION)),
             'http-code': self.getinfo(codes.HTTP_CODE),
             'size-upload': self.getinfo(codes.SIZE_UPLOAD),
             'size-download': self.getinfo(codes.SIZE_DOWNLOAD),
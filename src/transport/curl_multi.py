@@ -0,0 +1,297 @@
+import errno
+import fcntl
+import os
+import select
+import threading
+import time
+import pycurl
+from collections import deque
+
+from src.core.utils.futures import Future
+from src.logger import get_logger
+from .coalesce import SingleFlight, COALESCE_METHODS, make_key, follow
+from .curl_connector import Curl, codes
+from .exceptions import ECurlConfigError, ECurlUnknownRequestError
+from .profiles import get_profile
+from .scheduler import INTERACTIVE, BACKGROUND, PRIORITIES, background_limit, get_scheduler
+
+log = get_logger('transport.multi')
+
+
+class CurlMulti(object):
+    """ Concurrent transport implementation on top of `pycurl.CurlMulti`
+
+    Every transfer runs on its own `Curl` handle, all handles are driven from
+    one thread by `perform`. Results are the same as for `Curl.request`.
+    Threads which call `request` concurrently share the work: one of them
+    drives all transfers while the others wait for their results, requests
+    added meanwhile wake the driving thread and are started at once.
+    Handles share connection cache of the multi handle, with HTTP/2 profile
+    concurrent requests to one host are multiplexed over one connection.
+    Queued interactive requests are started before background ones, background
+    requests take at most `background_share` of `max_connections`.
+    """
+
+    def __init__(self, profile=None, max_connections=32, select_timeout=1.0, coalesce=True, multiplex=True,
+                 max_host_connections=0, background_share=None):
+        """
+        @param profile (Profile): transport profile of requests, `default` profile by default
+        @param max_connections (int): maximum count of transfers in flight
+        @param select_timeout (float): maximum time in seconds for waiting on sockets
+        @param coalesce (bool): identical GET/HEAD requests in flight share one transfer
+        @param multiplex (bool): multiplex transfers over HTTP/2 connections
+        @param max_host_connections (int): maximum count of connections to one host, 0 - no limit
+        @param background_share (float): part of `max_connections` available to background requests,
+            share of the shared scheduler by default
+        """
+        self.m = pycurl.CurlMulti()
+        self.m.setopt(codes.M_PIPELINING, codes.PIPE_MULTIPLEX if multiplex else codes.PIPE_NOTHING)
+        if max_host_connections:
+            self.m.setopt(codes.M_MAX_HOST_CONNECTIONS, max_host_connections)
+        self.profile = profile if profile is not None else get_profile()
+        self.max_connections = max_connections
+        if background_share is None:
+            background_share = get_scheduler().background_share
+        self.background_limit = background_limit(max_connections, background_share)
+        self.select_timeout = select_timeout
+        self.coalesce = coalesce
+        self._flights = SingleFlight()
+        self._lock = threading.RLock()  # multi handle and active transfers, held by the driving thread
+        self._queue_lock = threading.Lock()  # queues only, never held while transfers are driven
+        self._driver_changed = threading.Condition(self._queue_lock)
+        self._generation = 0  # incremented when driving thread leaves or a waited request completes
+        self._free = []  # idle Curl handles
+        self._queues = {priority: deque() for priority in PRIORITIES}  # transfers waiting for a free slot
+        self._active = {}  # pycurl.Curl -> (Curl, Future)
+        self._background = set()  # pycurl.Curl of active background transfers
+        self._wakeup_fds = os.pipe()  # interrupts select of driving thread when request is added
+        for fd in self._wakeup_fds:
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    @property
+    def _queue_size(self):
+        with self._queue_lock:
+            return sum(len(queue) for queue in self._queues.itervalues())
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_fds[1], 'x')
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):  # full pipe wakes driver anyway
+                raise
+
+    def _read_wakeup(self):
+        try:
+            while os.read(self._wakeup_fds[0], 4096):
+                pass
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def add_request(self, url, method='GET', body=None, headers=None, sink=None, priority=INTERACTIVE, **curlargs):
+        """ Queue request, it will be started by `perform`
+        @param url (object with __str__ method): url for request
+        @param method (str): method
+        @param body (str): body
+        @param headers (dict): additional headers
+        @param sink (BaseSink): receiver of body chunks, see `Curl.request`
+        @param priority (str): priority class of request, see `scheduler.PRIORITIES`
+        @param curlargs (dict): additional params for `Curl.configure` method
+        @return (Future): future resolved with `(response, resp_body)` or `ECurl*` exception
+        """
+        if priority not in self._queues:
+            raise ECurlConfigError('Unknown request priority %s' % priority)
+        future = Future()
+        if self.coalesce and sink is None and body is None and method in COALESCE_METHODS:
+            leader = self._flights.join(make_key(method, url, headers, curlargs) + (priority,), future)
+            if leader is not None:
+                result = Future()
+                leader.add_done_callback(lambda f: follow(f, result))
+                return result
+        with self._queue_lock:
+            self._queues[priority].append((future, (url, method, body, headers, sink, self.profile), curlargs))
+        self._wakeup()
+        return future
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, priority=INTERACTIVE, **curlargs):
+        """ Performing request, same as `Curl.request`
+        @param priority (str): priority class of request, see `scheduler.PRIORITIES`
+        @return response (Response):  response object
+        @return resp_body (str): response body
+        """
+        future = self.add_request(url, method, body, headers, sink, priority, **curlargs)
+        future.add_done_callback(lambda f: self._changed())
+        while not future.done():
+            with self._queue_lock:
+                generation = self._generation
+            if self._lock.acquire(False):  # nobody drives transfers, this thread does until its request is done
+                try:
+                    self._perform(future.done)
+                finally:
+                    self._lock.release()
+                    self._changed()
+                continue
+            with self._driver_changed:
+                if self._generation == generation:
+                    self._driver_changed.wait(self.select_timeout)
+        return future.result()
+
+    def _changed(self):
+        with self._driver_changed:
+            self._generation += 1
+            self._driver_changed.notify_all()
+
+    def request_many(self, specs, **kwargs):
+        """ Perform requests concurrently on this transport, see `batch.request_many`
+        @return (list|generator): results in input order, result is `(response, resp_body)` or `ErrorResponse`
+        """
+        from .batch import request_many
+        return request_many(specs, self, **kwargs)
+
+    def perform(self, timeout=None):
+        """ Drive queued and active transfers until all of them are completed
+        @param timeout (float): maximum time in seconds, None - until all transfers are completed
+        @return (int): count of transfers which are not completed yet
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            try:
+                self._perform(deadline=deadline)
+                return len(self._active) + self._queue_size
+            finally:
+                self._changed()
+
+    def _perform(self, stop=None, deadline=None):
+        """ Drive transfers, caller holds `_lock`
+        @param stop (callable): driving is stopped when it returns True
+        @param deadline (float): time when driving is stopped, None - until all transfers are completed
+        """
+        self._start_queued()
+        while self._active:
+            ret = codes.E_CALL_MULTI_PERFORM
+            while ret == codes.E_CALL_MULTI_PERFORM:
+                ret, num_handles = self.m.perform()
+            self._read_info()
+            self._start_queued()
+            if not self._active or (stop is not None and stop()):
+                break
+            wait = self.select_timeout
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    break
+            curl_timeout = self.m.timeout()
+            if curl_timeout >= 0:
+                wait = min(wait, curl_timeout / 1000.0)
+            self._select(wait)
+
+    def _select(self, wait):
+        """ Wait for sockets of transfers or for a new request"""
+        read, write, error = self.m.fdset()
+        if not (read or write or error):
+            wait = min(wait, 0.01)  # no sockets yet, e.g. while resolving
+        try:
+            select.select(read + [self._wakeup_fds[0]], write, error, max(wait, 0))
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+        self._read_wakeup()
+
+    def _take_queued(self):
+        """
+        @return (tuple|None): `(queue, (future, args, curlargs))` of request which may be started now
+        """
+        interactive, background = self._queues[INTERACTIVE], self._queues[BACKGROUND]
+        with self._queue_lock:
+            if interactive:
+                queue = interactive
+            elif background and len(self._background) < self.background_limit:
+                queue = background
+            else:
+                return None
+            return queue, queue.popleft()
+
+    def _start_queued(self):
+        while len(self._active) < self.max_connections:
+            taken = self._take_queued()
+            if taken is None:
+                break
+            queue, (future, args, curlargs) = taken
+            if not future.set_running_or_notify_cancel():
+                continue
+            curl = self._free.pop() if self._free else Curl()
+            try:
+                cached = curl.prepare(*args, **curlargs)
+            except Exception, e:
+                self._release(curl)
+                future.set_exception(e)
+                continue
+            if cached is not None:
+                self._release(curl)
+                future.set_result(cached)
+                continue
+            self._active[curl.h] = (curl, future)
+            if queue is self._queues[BACKGROUND]:
+                self._background.add(curl.h)
+            self.m.add_handle(curl.h)
+
+    def _read_info(self):
+        while True:
+            num_queued, ok_list, err_list = self.m.info_read()
+            for h in ok_list:
+                self._complete(h)
+            for h, err_code, err_message in err_list:
+                self._complete(h, (err_code, err_message))
+            if not num_queued:
+                break
+
+    def _complete(self, h, error=None):
+        curl, future = self._active.pop(h)
+        self._background.discard(h)
+        self.m.remove_handle(h)
+        try:
+            if error:
+                curl.raise_error(*error)
+            result = curl.get_response()
+        except Exception, e:
+            self._release(curl)
+            future.set_exception(e)
+        else:
+            self._release(curl)
+            future.set_result(result)
+
+    def _release(self, curl):
+        curl.cleanup()
+        self._free.append(curl)
+
+    def stats(self):
+        """ Transport statistics
+        @return (dict): current count of transfers and coalescing counters
+        """
+        with self._queue_lock:
+            queued = {priority: len(queue) for priority, queue in self._queues.iteritems()}
+        return {
+            'active': len(self._active),
+            'queued': queued,
+            'max_connections': self.max_connections,
+            'coalesce': self._flights.stats(),
+        }
+
+    def close(self):
+        with self._lock:
+            for h, (curl, future) in self._active.items():
+                self.m.remove_handle(h)
+                future.set_exception(ECurlUnknownRequestError('Transport closed while trying %s' %
+                                                              curl.getinfo(codes.EFFECTIVE_URL)))
+            self._active.clear()
+            self._background.clear()
+            with self._queue_lock:
+                queued = [future for queue in self._queues.itervalues() for future, args, curlargs in queue]
+                for queue in self._queues.itervalues():
+                    queue.clear()
+            for future in queued:
+                future.cancel()
+            self._free = []
+            self.m.close()
+            for fd in self._wakeup_fds:
+                os.close(fd)
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from src.logger import get_logger
+from .cache import ResponseCache, CacheEntry
+from .curl_connector import Response, VERSION_NAMES
+
+log = get_logger('transport.disk_cache')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS entries ('
+    ' key TEXT PRIMARY KEY, statusline TEXT, raw_headers TEXT, body BLOB, expires REAL,'
+    ' revalidate INTEGER, size INTEGER, accessed REAL)',
+    'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)',
+)
+TOUCH_INTERVAL = 60  # seconds, access time of entry is updated not more often
+EVICT_EVERY = 16  # writes between size checks
+EVICT_TARGET = 0.9  # eviction frees space down to this part of max size
+
+
+class DiskCache(object):
+    """ Persistent size-bounded store of cache entries in sqlite
+
+    Database is opened in WAL mode, so several worker processes may read and
+    write it concurrently; every thread has its own connection. Entry keeps
+    status line and raw headers as received, response is rebuilt without
+    parsing headers again (they are indexed lazily on first access).
+    Least recently used entries are evicted when total size of bodies exceeds `max_size`.
+    Bodies larger than `max_entry_size` and bodies spooled to temporary files
+    (`mmap`) are not stored: writing them would copy the whole body into memory.
+    """
+
+    def __init__(self, path, max_size=256 * 1024 * 1024, busy_timeout=5, max_entry_size=8 * 1024 * 1024):
+        """
+        @param path (str): database file
+        @param max_size (int): maximum total size of bodies, in bytes
+        @param busy_timeout (float): seconds to wait for lock of another process
+        @param max_entry_size (int): maximum size of stored body, in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stored': 0,
+            'skipped': 0,
+            'evicted': 0,
+            'errors': 0,
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        db = self._db()
+        with db:
+            for statement in SCHEMA:
+                db.execute(statement)
+
+    def _db(self):
+        db, pid = getattr(self._local, 'db', (None, None))
+        if db is None or pid != os.getpid():  # connection must not be used after fork
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            db.text_factory = str
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = (db, os.getpid())
+        return db
+
+    @staticmethod
+    def make_key(key):
+        """
+        @param key (tuple): key from `ResponseCache.make_key`
+        @return (str): key of row, digest - key contains request headers such as `Authorization`
+        """
+        return hashlib.sha1(repr(key)).hexdigest()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def get(self, key):
+        """
+        @param key (tuple): key from `ResponseCache.make_key`
+        @return (CacheEntry|None): entry, may be stale
+        """
+        row_key = self.make_key(key)
+        try:
+            db = self._db()
+            row = db.execute('SELECT statusline, raw_headers, body, expires, accessed FROM entries WHERE key = ?',
+                             (row_key,)).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            statusline, raw_headers, body, expires, accessed = row
+            now = time.time()
+            if now - accessed > TOUCH_INTERVAL:
+                with db:
+                    db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, row_key))
+        except sqlite3.Error, e:
+            self._count('errors')
+            log.warning('Disk cache read failed: %s' % e)
+            return None
+        self._count('hits')
+        entry = CacheEntry(Response(raw_headers, statusline), str(body), 0)
+        entry.expires = expires
+        return entry
+
+    def put(self, key, entry):
+        """ Store entry, replace existing one
+        @param key (tuple): key from `ResponseCache.make_key`
+        @param entry (CacheEntry): entry
+        """
+        response = entry.response
+        statusline = '%s %d %s' % (VERSION_NAMES.get(response.version, 'HTTP/1.1'), response.status, response.reason)
+        body = entry.body or ''
+        skip = not isinstance(body, str) or len(body) > self.max_entry_size
+        try:
+            db = self._db()
+            with db:
+                if skip:  # previous response must not outlive the new one
+                    db.execute('DELETE FROM entries WHERE key = ?', (self.make_key(key),))
+                else:
+                    db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (self.make_key(key), statusline, response.raw_headers, sqlite3.Binary(body),
+                                entry.expires, int(entry.can_revalidate()), len(body), time.time()))
+        except sqlite3.Error, e:
+            self._count('errors')
+            log.warning('Disk cache write failed: %s' % e)
+            return
+        if skip:
+            self._count('skipped')
+            return
+        self._count('stored')
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICT_EVERY == 0
+        if check:
+            self.evict()
+
+    def touch(self, key, expires):
+        """ Set new expiration time of entry, e.g. after revalidation"""
+        try:
+            db = self._db()
+            with db:
+                db.execute('UPDATE entries SET expires = ?, accessed = ? WHERE key = ?',
+                           (expires, time.time(), self.make_key(key)))
+        except sqlite3.Error, e:
+            self._count('errors')
+            log.warning('Disk cache update failed: %s' % e)
+
+    def evict(self):
+        """ Drop expired entries which can not be revalidated and least recently used entries above `max_size`
+        @return (int): count of dropped entries
+        """
+        try:
+            db = self._db()
+            with db:
+                dropped = db.execute('DELETE FROM entries WHERE expires < ? AND revalidate = 0',
+                                     (time.time(),)).rowcount
+                size = db.execute('SELECT total(size) FROM entries').fetchone()[0]
+                if size > self.max_size:
+                    excess = size - self.max_size * EVICT_TARGET
+                    keys = []
+                    for row_key, row_size in db.execute('SELECT key, size FROM entries ORDER BY accessed'):
+                        keys.append((row_key,))
+                        excess -= row_size
+                        if excess <= 0:
+                            break
+                    db.executemany('DELETE FROM entries WHERE key = ?', keys)
+                    dropped += len(keys)
+        except sqlite3.Error, e:
+            self._count('errors')
+            log.warning('Disk cache eviction failed: %s' % e)
+            return 0
+        self._count('evicted', dropped)
+        return dropped
+
+    def clear(self):
+        db = self._db()
+        with db:
+            db.execute('DELETE FROM entries')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            stats['entries'], stats['size'] = self._db().execute(
+                'SELECT count(*), total(size) FROM entries').fetchone()
+        except sqlite3.Error:
+            pass
+        return stats
+
+
+class TieredCache(ResponseCache):
+    """ Memory cache backed by `DiskCache`
+
+    Lookups missed in memory or stale there go to disk, found entries which
+    are fresher than memory ones are promoted to memory.
+    Stored and revalidated entries are written through to disk, so cache
+    survives restarts and is shared by worker processes.
+    """
+
+    def __init__(self, disk, max_entries=1024, max_size=64 * 1024 * 1024, static_ttl=None):
+        """
+        @param disk (DiskCache): disk tier
+        @param max_entries (int): maximum count of entries in memory
+        @param max_size (int): maximum total size of bodies in memory, in bytes
+        @param static_ttl (int): lifetime in seconds for static files without explicit lifetime
+        """
+        kwargs = {'static_ttl': static_ttl} if static_ttl is not None else {}
+        super(TieredCache, self).__init__(max_entries, max_size, **kwargs)
+        self.disk = disk
+
+    def get_from_cache(self, key):
+        entry = super(TieredCache, self).get_from_cache(key)
+        if entry is not None and entry.is_fresh():
+            return entry
+        stored = self.disk.get(key)  # another worker may have stored a fresher response
+        if stored is None or (entry is not None and stored.expires <= entry.expires):
+            return entry
+        with self._lock:
+            if stored.size <= self.max_size:
+                self._remove(key)
+                self._entries[key] = stored
+                self._size += stored.size
+                while len(self._entries) > self.max_entries or self._size > self.max_size:
+                    self._remove(next(iter(self._entries)))
+                    self._stats['evicted'] += 1
+            self._stats['misses'] -= 1  # counted as miss by memory tier
+            self._stats['hits' if stored.is_fresh() else 'misses'] += 1
+        return stored
+
+    def add_to_cache(self, key, response, body, static=False):
+        entry = super(TieredCache, self).add_to_cache(key, response, body, static)
+        if entry is not None:
+            self.disk.put(key, entry)
+        return entry
+
+    def revalidated(self, key, entry, response, static=False):
+        result = super(TieredCache, self).revalidated(key, entry, response, static)
+        self.disk.touch(key, entry.expires)
+        return result
+
+    def clear(self):
+        super(TieredCache, self).clear()
+        self.disk.clear()
+
+    def stats(self):
+        stats = super(TieredCache, self).stats()
+        stats['disk'] = self.disk.stats()
+        return stats
@@ -0,0 +1,154 @@
+import threading
+import time
+
+from src.core.utils.loop import EventLoop
+from src.logger import get_logger
+from .curl_connector import codes
+from .curl_multi import CurlMulti
+
+log = get_logger('transport.evented')
+
+
+class EventedMulti(CurlMulti):
+    """ Event-driven transport on top of `pycurl.CurlMulti`
+
+    libcurl reports sockets it waits on through `M_SOCKETFUNCTION` and the
+    timeout it needs through `M_TIMERFUNCTION`, both are registered in an
+    event loop, so transfers are driven by `socket_action` only when their
+    sockets are ready. There is no thread per request: any count of requests
+    in flight costs one loop.
+
+    Loop must provide `add_reader`, `remove_reader`, `add_writer`, `remove_writer`,
+    `call_soon`, `call_soon_threadsafe` and `call_later`. Without a loop
+    transport runs its own `EventLoop` in a background thread.
+    """
+
+    def __init__(self, loop=None, profile=None, max_connections=256, coalesce=True, multiplex=True,
+                 max_host_connections=0, background_share=None):
+        """
+        @param loop (EventLoop): event loop, None - own loop in a background thread
+        @param profile (Profile): transport profile of requests, `default` profile by default
+        @param max_connections (int): maximum count of transfers in flight
+        @param coalesce (bool): identical GET/HEAD requests in flight share one transfer
+        @param multiplex (bool): multiplex transfers over HTTP/2 connections
+        @param max_host_connections (int): maximum count of connections to one host, 0 - no limit
+        @param background_share (float): part of `max_connections` available to background requests,
+            share of the shared scheduler by default
+        """
+        super(EventedMulti, self).__init__(profile=profile, max_connections=max_connections, coalesce=coalesce,
+                                           multiplex=multiplex, max_host_connections=max_host_connections,
+                                           background_share=background_share)
+        self._idle = threading.Condition(self._lock)
+        self._timer = None
+        self._fds = {}  # fd -> POLL_* registered in loop
+        self._thread = None
+        self.loop = loop
+        if loop is None:
+            self.loop = EventLoop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name='transport-evented')
+            self._thread.daemon = True
+            self._thread.start()
+        self.m.setopt(codes.M_SOCKETFUNCTION, self._on_socket)
+        self.m.setopt(codes.M_TIMERFUNCTION, self._on_timer)
+
+    def add_request(self, url, method='GET', body=None, headers=None, sink=None, **curlargs):
+        """ Start request on the loop, may be called from any thread, see `CurlMulti.add_request`
+        @return (Future): future resolved on the loop thread with `(response, resp_body)` or `ECurl*` exception
+        """
+        return super(EventedMulti, self).add_request(url, method, body, headers, sink, **curlargs)
+
+    def _wakeup(self):
+        self.loop.call_soon_threadsafe(self._kick)
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, **curlargs):
+        """ Performing request, same as `Curl.request`, must not be called on the loop thread
+        @return response (Response):  response object
+        @return resp_body (str): response body
+        """
+        future = self.add_request(url, method, body, headers, sink, **curlargs)
+        if self._thread is None:
+            return self.loop.run_until_complete(future)
+        return future.result()
+
+    def perform(self, timeout=None):
+        """ Wait until all transfers are completed
+        @param timeout (float): maximum time in seconds, None - until all transfers are completed
+        @return (int): count of transfers which are not completed yet
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        if self._thread is None:
+            while self._pending():
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    break
+                self.loop.run_once(remaining)
+            return self._pending()
+        with self._idle:
+            while self._pending():
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            return self._pending()
+
+    def _pending(self):
+        with self._lock:
+            return len(self._active) + self._queue_size
+
+    def _kick(self):
+        with self._lock:
+            self._start_queued()
+            self._notify_idle()
+
+    def _on_socket(self, event, fd, multi, data):
+        """ `M_SOCKETFUNCTION` callback, (un)registers socket in the loop"""
+        old = self._fds.get(fd, codes.POLL_NONE)
+        if event == codes.POLL_REMOVE:
+            event = codes.POLL_NONE
+        if old & codes.POLL_IN and not event & codes.POLL_IN:
+            self.loop.remove_reader(fd)
+        if old & codes.POLL_OUT and not event & codes.POLL_OUT:
+            self.loop.remove_writer(fd)
+        if event & codes.POLL_IN and not old & codes.POLL_IN:
+            self.loop.add_reader(fd, self._action, fd, codes.CSELECT_IN)
+        if event & codes.POLL_OUT and not old & codes.POLL_OUT:
+            self.loop.add_writer(fd, self._action, fd, codes.CSELECT_OUT)
+        if event:
+            self._fds[fd] = event
+        else:
+            self._fds.pop(fd, None)
+
+    def _on_timer(self, timeout_ms):
+        """ `M_TIMERFUNCTION` callback, libcurl must not be reentered from it"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if timeout_ms >= 0:
+            self._timer = self.loop.call_later(timeout_ms / 1000.0, self._action, codes.SOCKET_TIMEOUT, 0)
+
+    def _action(self, fd, event):
+        with self._lock:
+            if fd == codes.SOCKET_TIMEOUT:
+                self._timer = None
+            ret = codes.E_CALL_MULTI_PERFORM
+            while ret == codes.E_CALL_MULTI_PERFORM:
+                ret, running = self.m.socket_action(fd, event)
+            self._read_info()
+            self._start_queued()
+            self._notify_idle()
+
+    def _notify_idle(self):
+        if not self._active and not self._queue_size:
+            self._idle.notify_all()
+
+    def close(self):
+        if self._thread is not None:
+            self.loop.stop()
+            self._thread.join()
+        if self._timer is not None:
+            self._timer.cancel()
+        for fd in self._fds.keys():  # before own loop is closed
+            self._on_socket(codes.POLL_REMOVE, fd, self.m, None)
+        if self._thread is not None:
+            self.loop.close()
+        super(EventedMulti, self).close()
@@ -142,3 +142,19 @@ class ECurlSSLConnectionError(BaseCurlException):
 
 class ECurlConfigError(BaseCurlException):
     pass
+
+
+class ECurlPoolTimeout(BaseCurlException):
+    pass
+
+
+class ECurlConnectionError(ECurlUnknownRequestError):
+    pass
+
+
+class ECurlCircuitOpen(BaseCurlException):
+    pass
+
+
+class ECurlCassetteMiss(BaseCurlException):
+    pass
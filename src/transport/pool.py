@@ -0,0 +1,226 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from src.logger import get_logger
+from .coalesce import SingleFlight, COALESCE_METHODS, make_key
+from .curl_connector import Curl
+from .exceptions import ECurlPoolTimeout
+from .profiles import get_profile
+from .scheduler import INTERACTIVE, get_scheduler
+
+log = get_logger('transport.pool')
+
+
+class CurlPool(object):
+    """ Bounded thread-safe pool of `Curl` handles
+
+    Every request checks out its own handle, so concurrent callers never share
+    buffers. Handles keep their connection cache between checkouts, a thread
+    gets back the handle it used last time when it is idle (keep-alive
+    connections to the same hosts are reused), idle handles are closed after
+    `idle_timeout` seconds. Identical GET/HEAD requests in flight are
+    coalesced: one transfer is performed, all callers get its result.
+    Requests take slots of the shared `PriorityScheduler` budget.
+    """
+
+    def __init__(self, profile=None, max_size=16, idle_timeout=300, checkout_timeout=30, coalesce=True,
+                 scheduler=None):
+        """
+        @param profile (Profile): transport profile of requests, `default` profile by default
+        @param max_size (int): maximum count of handles
+        @param idle_timeout (int): seconds after which idle handle is closed
+        @param checkout_timeout (int): seconds to wait for free handle, None - wait forever
+        @param coalesce (bool): coalesce identical requests in flight
+        @param scheduler (PriorityScheduler): concurrency budget, shared `get_scheduler()` by default
+        """
+        self.profile = profile if profile is not None else get_profile()
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        self.coalesce = coalesce
+        self._flights = SingleFlight()
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._idle = []  # [(Curl, last checkin time)], most recently used is last
+        self._size = 0
+        self._stats = {
+            'created': 0,
+            'evicted': 0,
+            'checkouts': 0,
+            'affinity_hits': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _take_idle(self):
+        preferred = getattr(self._local, 'handle', None)
+        if preferred is not None:
+            for index, (curl, last_used) in enumerate(self._idle):
+                if curl is preferred:
+                    self._stats['affinity_hits'] += 1
+                    return self._idle.pop(index)[0]
+        if self._idle:
+            return self._idle.pop()[0]
+        return None
+
+    def _pop_expired(self, now):
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.pop(0)[0])
+        self._size -= len(expired)
+        self._stats['evicted'] += len(expired)
+        return expired
+
+    @staticmethod
+    def _close_handles(handles):
+        for curl in handles:
+            try:
+                curl.close()
+            except Exception, e:
+                log.warning('Exception while closing curl handle: %s' % e)
+
+    def checkout(self, timeout=None):
+        """ Get handle from pool, handle must be returned with `checkin`
+        @param timeout (float): seconds to wait for free handle, None - `checkout_timeout`
+        @return (Curl): handle
+
+        @raise ECurlPoolTimeout: no free handle in time
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._cond:
+            expired = self._pop_expired(time.time())
+            curl = self._take_idle()
+            while curl is None and self._size >= self.max_size:
+                self._stats['waits'] += 1
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise ECurlPoolTimeout('No free curl handle in %s seconds' % timeout)
+                self._cond.wait(remaining)
+                curl = self._take_idle()
+            if curl is None:
+                self._size += 1
+                self._stats['created'] += 1
+            self._stats['checkouts'] += 1
+        self._close_handles(expired)
+
+        if curl is None:
+            try:
+                curl = Curl()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        self._local.handle = curl
+        return curl
+
+    def checkin(self, curl, discard=False):
+        """ Return handle to pool
+        @param curl (Curl): handle from `checkout`
+        @param discard (bool): close handle instead of reusing
+        """
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((curl, time.time()))
+            self._cond.notify()
+        if discard:
+            self._close_handles([curl])
+
+    @contextmanager
+    def handle(self, timeout=None):
+        """ Checkout handle for the `with` block
+        @yield (Curl): handle
+        """
+        curl = self.checkout(timeout)
+        try:
+            yield curl
+        finally:
+            self.checkin(curl)
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, priority=INTERACTIVE, **curlargs):
+        """ Performing request on a pooled handle, see `Curl.request`
+        @param priority (str): priority class of request, see `scheduler.PRIORITIES`
+        @return response (Response):  response object
+        @return resp_body (str): response body
+        """
+        if self.coalesce and sink is None and body is None and method in COALESCE_METHODS:
+            # interactive request must not wait for background one queued behind the cap
+            key = make_key(method, url, headers, curlargs) + (priority,)
+            return self._flights.do(key, self._request, url, method, body, headers, sink, curlargs, priority)
+        return self._request(url, method, body, headers, sink, curlargs, priority)
+
+    def _request(self, url, method, body, headers, sink, curlargs, priority=INTERACTIVE):
+        with self.scheduler.slot(priority, self.checkout_timeout):
+            with self.handle() as curl:
+                return curl.request(url, method, body, headers, sink, self.profile, **curlargs)
+
+    def request_many(self, specs, **kwargs):
+        """ Perform requests concurrently on this transport, see `batch.request_many`
+        @return (list|generator): results in input order, result is `(response, resp_body)` or `ErrorResponse`
+        """
+        from .batch import request_many
+        return request_many(specs, self, **kwargs)
+
+    def stream(self, url, method='GET', body=None, headers=None, **curlargs):
+        """ Performing streamed request on a pooled handle, see `Curl.stream`
+        Handle is returned to pool when chunks are consumed or closed.
+        @return response (Response):  response object
+        @return chunks (generator): body chunks
+        """
+        curl = self.checkout()
+        try:
+            response, chunks = curl.stream(url, method, body, headers, self.profile, **curlargs)
+        except Exception:
+            self.checkin(curl)
+            raise
+        return response, self._stream_chunks(curl, chunks)
+
+    def _stream_chunks(self, curl, chunks):
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            chunks.close()
+            self.checkin(curl)
+
+    def evict_idle(self):
+        """ Close handles idle for more than `idle_timeout`
+        @return (int): count of closed handles
+        """
+        with self._cond:
+            expired = self._pop_expired(time.time())
+            if expired:
+                self._cond.notify_all()
+        self._close_handles(expired)
+        return len(expired)
+
+    def stats(self):
+        """ Pool statistics
+        @return (dict): counters and current size of the pool
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            })
+        stats['coalesce'] = self._flights.stats()
+        stats['scheduler'] = self.scheduler.stats()
+        return stats
+
+    def close(self):
+        """ Close all idle handles"""
+        with self._cond:
+            idle = [curl for curl, last_used in self._idle]
+            self._idle = []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        self._close_handles(idle)
@@ -0,0 +1,265 @@
+import threading
+from collections import OrderedDict
+
+import pycurl
+
+from src.logger import get_logger
+from . import curl_codes as codes
+from .exceptions import ECurlConfigError
+
+log = get_logger('transport.profiles')
+
+PROXY_TYPE_CONNECTOR = {
+    'socks4': codes.PROXYTYPE_SOCKS4,
+    'socks5': codes.PROXYTYPE_SOCKS5,
+    'socks5h': codes.PROXYTYPE_SOCKS5_HOSTNAME,
+    'http_no_connect': codes.PROXYTYPE_HTTP,
+    'transparent': codes.PROXYTYPE_HTTP,
+    'http': codes.PROXYTYPE_HTTP,  # TODO: check if right
+    # 'http_1_0': codes.PROXYTYPE_HTTP_1_0,
+    # 'socks4a': codes.PROXYTYPE_SOCKS4A,
+    # 'socks5_hostname': codes.PROXYTYPE_SOCKS5_HOSTNAME
+}
+
+HTTP_VERSION_CONNECTOR = {
+    '1.0': codes.CURL_HTTP_VERSION_1_0,
+    '1.1': codes.CURL_HTTP_VERSION_1_1,
+    '2': codes.CURL_HTTP_VERSION_2_0,  # h2 via ALPN for https, h2c upgrade for http
+    '2tls': codes.CURL_HTTP_VERSION_2TLS,  # h2 via ALPN for https, HTTP/1.1 for http
+    '2-prior-knowledge': codes.CURL_HTTP_VERSION_2_PRIOR_KNOWLEDGE,  # h2 without negotiation
+}
+
+DEFAULT_STATIC = ['.js', '.pdf']
+# options which can not be turned off once they are set, even by `curl_easy_reset`, handle is replaced instead
+STICKY_OPTIONS = (codes.COOKIEFILE,)
+DERIVED_CACHE_SIZE = 64
+HTTP2_SUPPORTED = bool(pycurl.version_info()[4] & pycurl.VERSION_HTTP2)
+
+
+def compile_options(download_limit=None, no_body=False,
+                    raw_response=False, max_redirects=None, keep_alive=False, timeout=15, expect100_timeout_ms=1000,
+                    connect_timeout=5, validate_cert=False, allow_ipv6=True, proxy_info=None, handle_cookie=False,
+                    static_files=None, ciper=None, SSLv3=False, http_auth_credintals=None, connection_close=False,
+                    cookie_data=None, use_cache=True, http_version=None, multiplex=True, spool_threshold=None,
+                    adaptive_timeout=True, timeout_multiplier=4.0, min_timeout=1.0, min_connect_timeout=0.3):
+    """ Compile transport settings into libcurl options
+    @param download_limit (int): download limit for pages, in bytes
+    @param no_body (bool): get response without body
+    @param raw_response (bool): return raw response (with headers in body)
+    @param max_redirects (int): count of maximum redirects
+    @param keep_alive (bool): sending keep-alive header
+    @param timeout (int): timeout for request
+    @param expect100_timeout_ms (int): time in ms for waiting for `expect:100` header
+    @param connect_timeout (int): timeot for connect
+    @param validate_cert (bool): validation of certificate
+    @param allow_ipv6 (bool): using ipv6
+    @param proxy_info (dict): information for connection via proxy
+    @param handle_cookie (bool): keep cookies between requests
+    @param static_files (tuple): overwrite default extensions for static files
+    @param ciper (str): setting ciper for ssl connection
+    @param SSLv3 (bool): using SSLv3
+    @param http_auth_credintals (dict): credintals for http auth (`username` and `password`)
+    @param connection_close (bool): sending `connection:close` header
+    @param cookie_data (str): cookies for every request
+    @param use_cache (bool): use response cache for GET and HEAD requests
+    @param http_version (str): HTTP version, one of `HTTP_VERSION_CONNECTOR` keys, None - libcurl default
+    @param multiplex (bool): wait for connection which can multiplex (HTTP/2) instead of opening new one
+    @param spool_threshold (int): bodies larger than this size in bytes are spilled to a temporary file
+        and returned as read-only `mmap`, None - bodies are kept in memory
+    @param adaptive_timeout (bool): derive timeouts of request to a host from its latency,
+        False - `timeout` and `connect_timeout` are fixed
+    @param timeout_multiplier (float): adaptive timeout is p99 latency of host multiplied by this value,
+        it is clamped by `min_timeout`..`timeout` (`min_connect_timeout`..`connect_timeout` for connect)
+    @param min_timeout (float): lower bound of adaptive timeout in seconds
+    @param min_connect_timeout (float): lower bound of adaptive connect timeout in seconds
+    @return options (tuple): `(option, value)` pairs, None value means libcurl default
+    @return actions (tuple): `(option, value)` pairs applied when handle switches to profile
+    @return attributes (tuple): `(name, value)` pairs of `Curl` attributes
+
+    @raise Exception: timeout or connect_timeout type error
+    @raise ECurlConfigError: unknown HTTP version
+    """
+    options = OrderedDict()
+    actions = []
+    options[codes.NOPROGRESS] = 1
+    options[codes.PATH_AS_IS] = 1
+    options[codes.ACCEPT_ENCODING] = ''
+    options[codes.FOLLOWLOCATION] = 0
+    options[codes.MAXREDIRS] = max_redirects if max_redirects else -1
+    options[codes.TCP_KEEPALIVE] = int(bool(keep_alive))
+    options[codes.HEADER] = int(bool(raw_response))
+
+    if not download_limit:
+        download_limit = 15728640  # 15 Mb
+    if download_limit > 104857600:
+        log.warning("Config: download limit exceeded. Limit setted to default value (100 Mb).")
+        download_limit = 104857600  # 100 Mb
+    options[codes.MAXFILESIZE] = download_limit
+
+    try:
+        timeout = int(timeout) if timeout else 15  # or zero?
+    except Exception, e:
+        raise Exception('Timeout must be int, not %s' % type(timeout))
+    options[codes.TIMEOUT_MS] = timeout * 1000
+
+    try:
+        connect_timeout = int(connect_timeout) if connect_timeout else 5  # or zero?
+    except Exception, e:
+        raise Exception('Connect_timeout must be int, not %s' % type(connect_timeout))
+    options[codes.CONNECTTIMEOUT_MS] = connect_timeout * 1000
+
+    options[codes.EXPECT_100_TIMEOUT_MS] = expect100_timeout_ms
+
+    # libcurl/pycurl is not thread-safe by default.  When multiple threads
+    # are used, signals should be disabled.  This has the side effect
+    # of disabling DNS timeouts in some environments (when libcurl is
+    # not linked against ares), so we don't do it when there is only one
+    # thread.
+    options[codes.NOSIGNAL] = 1
+
+    if handle_cookie:
+        options[codes.COOKIEFILE] = ""  # enables cookie engine
+    else:
+        options[codes.COOKIEFILE] = None  # cookie engine is off, see STICKY_OPTIONS
+        options[codes.COOKIEJAR] = None
+    actions.append((codes.COOKIELIST, 'ALL'))  # cookies of another profile must not leak
+
+    options[codes.COOKIE] = cookie_data or None
+
+    if validate_cert:
+        options[codes.SSL_VERIFYPEER] = 1
+        options[codes.SSL_VERIFYHOST] = 2
+    else:
+        options[codes.SSL_VERIFYPEER] = 0
+        options[codes.SSL_VERIFYHOST] = 0
+
+    # https://github.com/hwi/HWIOAuthBundle/issues/655
+    # Real problem was that CURL (through Buzz) used ipv6 when available.
+    # Request on IPV6 address timed out after 5s, a request on an IPV4 address
+    # was then done with success.
+    # Curl behaves reasonably when DNS resolution gives an ipv6 address
+    # that we can't reach, so allow ipv6 unless the user asks to disable.
+    options[codes.IPRESOLVE] = codes.IPRESOLVE_WHATEVER if allow_ipv6 else codes.IPRESOLVE_V4
+
+    if proxy_info:
+        # proxy_info.proxy_rdns is not used
+        options[codes.PROXY] = proxy_info['host']
+        options[codes.PROXYTYPE] = PROXY_TYPE_CONNECTOR.get(proxy_info['type'], codes.PROXYTYPE_HTTP)
+        options[codes.PROXYPORT] = proxy_info['port']
+        if 'user' in proxy_info and 'pass' in proxy_info:
+            options[codes.PROXYUSERPWD] = '%s:%s' % (proxy_info['user'], proxy_info['pass'])
+        else:
+            options[codes.PROXYUSERPWD] = None
+    else:
+        options[codes.PROXY] = None
+        options[codes.PROXYUSERPWD] = None
+
+    options[codes.SSL_CIPHER_LIST] = ciper or None
+
+    http_auth_creds = None
+    if http_auth_credintals:
+        http_auth_creds = (http_auth_credintals['username'], http_auth_credintals['password'])
+        options[codes.HTTPAUTH] = codes.HTTPAUTH_ANY
+        options[codes.USERPWD] = '%s:%s' % http_auth_creds
+    else:
+        options[codes.HTTPAUTH] = codes.HTTPAUTH_BASIC
+        options[codes.USERPWD] = None
+
+    options[codes.SSLVERSION] = codes.SSLVERSION_SSLv3 if SSLv3 else codes.SSLVERSION_DEFAULT
+
+    if http_version is not None:
+        http_version = str(http_version)
+        if http_version not in HTTP_VERSION_CONNECTOR:
+            raise ECurlConfigError('Unknown HTTP version %s' % http_version)
+        if http_version.startswith('2') and not HTTP2_SUPPORTED:
+            log.warning("Config: libcurl is built without HTTP/2 support, HTTP/%s is not used." % http_version)
+            http_version = None
+    options[codes.HTTP_VERSION] = HTTP_VERSION_CONNECTOR.get(http_version, codes.CURL_HTTP_VERSION_NONE)
+    options[codes.PIPEWAIT] = int(bool(multiplex and http_version and http_version.startswith('2')))
+
+    attributes = (
+        ('download_limit', download_limit),
+        ('no_body', bool(no_body)),
+        ('connection_close', bool(connection_close or raw_response)),
+        ('static_files', tuple(static_files) if static_files else tuple(DEFAULT_STATIC)),
+        ('use_cache', bool(use_cache and not (no_body or raw_response))),
+        ('http_auth_creds', http_auth_creds),
+        ('SSLv3', bool(SSLv3)),
+        ('spool_threshold', int(spool_threshold) if spool_threshold else None),
+        ('timeouts', (timeout, connect_timeout)),
+        ('adaptive_timeout', (float(timeout_multiplier), float(min_timeout), float(min_connect_timeout))
+                             if adaptive_timeout else None),
+    )
+    return tuple(options.items()), tuple(actions), attributes
+
+
+class Profile(object):
+    """ Named immutable transport settings, compiled once into vector of libcurl options"""
+
+    __slots__ = ('name', 'settings', 'options', 'actions', 'attributes', 'sticky', '_derived', '_lock')
+
+    def __init__(self, name='default', **settings):
+        """
+        @param name (str): profile name
+        @param settings (dict): params for `compile_options`
+        """
+        options, actions, attributes = compile_options(**settings)
+        sticky = tuple((option, value) for option, value in options if option in STICKY_OPTIONS)
+        for attr, value in (('name', name), ('settings', settings), ('options', options), ('actions', actions),
+                            ('attributes', attributes), ('sticky', sticky), ('_derived', OrderedDict()),
+                            ('_lock', threading.Lock())):
+            super(Profile, self).__setattr__(attr, value)
+
+    def __setattr__(self, name, value):
+        raise TypeError("'%s' object does not support attribute setting" % self.__class__.__name__)
+
+    def __repr__(self):
+        return '<Profile %s>' % self.name
+
+    def derive(self, **overrides):
+        """ Profile with some settings overridden, derived profiles are compiled once and cached
+        @param overrides (dict): params for `compile_options`
+        @return (Profile): profile
+        """
+        if not overrides:
+            return self
+        key = repr(sorted(overrides.items()))
+        with self._lock:
+            profile = self._derived.pop(key, None)
+            if profile is None:
+                settings = dict(self.settings)
+                settings.update(overrides)
+                profile = Profile(self.name, **settings)
+            self._derived[key] = profile
+            while len(self._derived) > DERIVED_CACHE_SIZE:
+                self._derived.popitem(last=False)
+        return profile
+
+
+BASE_PROFILE = Profile('base')
+
+_profiles = {'default': Profile('default')}
+
+
+def register_profile(name, **settings):
+    """ Register named profile
+    @param name (str): profile name
+    @param settings (dict): params for `compile_options`
+    @return (Profile): profile
+    """
+    profile = Profile(name, **settings)
+    _profiles[name] = profile
+    return profile
+
+
+def get_profile(name='default'):
+    """
+    @param name (str): profile name
+    @return (Profile): profile
+
+    @raise ECurlConfigError: unknown profile
+    """
+    try:
+        return _profiles[name]
+    except KeyError:
+        raise ECurlConfigError('Unknown transport profile %s' % name)
@@ -0,0 +1,386 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from src.core.utils.futures import Future
+from src.logger import get_logger
+from .coalesce import SingleFlight, COALESCE_METHODS, make_key, follow
+from .curl_connector import Curl
+from .exceptions import (BaseCurlException, ECurlConfigError, ECurlConnectionError, ECurlConnectionTimeout,
+                         ECurlProxyError)
+from .profiles import PROXY_TYPE_CONNECTOR, get_profile
+from .resilience import IDEMPOTENT_METHODS
+from .stats import TransportStats
+
+log = get_logger('transport.proxies')
+
+# errors which are counted against proxy
+PROXY_ERRORS = (ECurlProxyError, ECurlConnectionError, ECurlConnectionTimeout)
+# errors after which request is repeated through another proxy
+FAILOVER_ERRORS = (ECurlProxyError, ECurlConnectionError)
+# transport methods which are wrapped by `ProxiedTransport` when transport has them
+PROXIED_METHODS = ('stream', 'add_request', 'checkout', 'checkin', 'handle')
+
+
+class ProxyState(object):
+    """ Latency and error rate estimates of one proxy"""
+
+    __slots__ = ('info', 'latency', 'error_rate', 'in_flight', 'requests', 'errors', 'evicted_until')
+
+    def __init__(self, info):
+        self.info = info
+        self.latency = None  # EWMA of seconds, None - not measured yet
+        self.error_rate = 0.0  # EWMA of failures
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.evicted_until = None
+
+    @property
+    def name(self):
+        return '%s://%s:%s' % (self.info['type'], self.info['host'], self.info['port'])
+
+    def expected_latency(self):
+        """ Latency penalized by error rate and requests in flight, unmeasured proxy is tried first"""
+        if self.latency is None and self.errors:  # never worked
+            return float('inf')
+        return (self.latency or 0.0) * (1 + self.in_flight) / max(1.0 - self.error_rate, 0.05)
+
+    def snapshot(self, now):
+        return {
+            'latency': self.latency,
+            'error_rate': round(self.error_rate, 3),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'evicted': self.evicted_until is not None and self.evicted_until > now,
+        }
+
+
+class ProxyPool(object):
+    """ Thread-safe set of proxies, proxy for request is picked by the lowest expected latency
+
+    Every request and health check updates latency and error rate of proxy.
+    Proxy is evicted when its error rate exceeds `max_error_rate`; evicted
+    proxy is probed by health check (or taken back on probation after
+    `eviction_time` without health checks) and returns when it answers.
+    """
+
+    def __init__(self, proxies, check_url=None, check_interval=30, check_timeout=5, max_error_rate=0.5,
+                 eviction_time=60, alpha=0.3):
+        """
+        @param proxies (list): proxy infos, dicts with `host`, `port`, `type` and optional `user`, `pass`
+        @param check_url (str): url requested through every proxy by health check, None - no health checks
+        @param check_interval (float): seconds between health checks
+        @param check_timeout (int): timeout of health check request
+        @param max_error_rate (float): error rate in 0..1 after which proxy is evicted
+        @param eviction_time (float): seconds before evicted proxy is checked again
+        @param alpha (float): weight of the newest sample in moving averages
+
+        @raise ECurlConfigError: invalid proxy info
+        """
+        self._proxies = []
+        for info in proxies:
+            info = dict(info)
+            if 'host' not in info or 'port' not in info:
+                raise ECurlConfigError('Proxy must have host and port: %s' % info)
+            info.setdefault('type', 'http')
+            if info['type'] not in PROXY_TYPE_CONNECTOR:
+                raise ECurlConfigError('Unknown proxy type %s' % info['type'])
+            self._proxies.append(ProxyState(info))
+        self.check_url = check_url
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.max_error_rate = max_error_rate
+        self.eviction_time = eviction_time
+        self.alpha = alpha
+        self._check_stats = TransportStats()  # probes must not skew adaptive timeouts of requests
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._proxies)
+
+    def acquire(self, exclude=()):
+        """ Pick proxy for request, must be released with `release`
+        @param exclude (tuple): proxy states which must not be picked, e.g. just failed ones
+        @return (ProxyState|None): proxy, None if pool is empty
+        """
+        now = time.time()
+        with self._lock:
+            candidates = [proxy for proxy in self._proxies if proxy not in exclude] or self._proxies
+            if not candidates:
+                return None
+            alive = [proxy for proxy in candidates if proxy.evicted_until is None]
+            if not alive and not self.check_url:  # probation of proxies evicted long enough
+                alive = [proxy for proxy in candidates if proxy.evicted_until <= now]
+            if alive:
+                proxy = min(alive, key=ProxyState.expected_latency)
+            else:  # everything is evicted, proxy which is the closest to recovery
+                proxy = min(candidates, key=lambda p: p.evicted_until)
+            proxy.in_flight += 1
+            return proxy
+
+    def release(self, proxy, elapsed, error=None):
+        """ Account result of request through proxy
+        @param proxy (ProxyState): proxy from `acquire`
+        @param elapsed (float): duration of request in seconds
+        @param error (Exception): error of request, None if proxy worked
+        """
+        with self._lock:
+            proxy.in_flight -= 1
+            self._account(proxy, elapsed, error)
+
+    def _account(self, proxy, elapsed, error):
+        failed = isinstance(error, PROXY_ERRORS)
+        proxy.requests += 1
+        proxy.error_rate += self.alpha * ((1.0 if failed else 0.0) - proxy.error_rate)
+        if failed:
+            proxy.errors += 1
+            if proxy.error_rate > self.max_error_rate and proxy.evicted_until is None:
+                proxy.evicted_until = time.time() + self.eviction_time
+                log.warning('Proxy %s evicted, error rate %.2f: %s' % (proxy.name, proxy.error_rate, error))
+            return
+        proxy.latency = elapsed if proxy.latency is None else proxy.latency + self.alpha * (elapsed - proxy.latency)
+        if proxy.evicted_until is not None:
+            proxy.evicted_until = None
+            proxy.error_rate = min(proxy.error_rate, self.max_error_rate / 2)
+            log.info('Proxy %s is back' % proxy.name)
+
+    def check(self):
+        """ Request `check_url` through every proxy which is due, update estimates
+        @return (int): count of healthy proxies
+        """
+        now = time.time()
+        with self._lock:
+            due = [proxy for proxy in self._proxies if proxy.evicted_until is None or proxy.evicted_until <= now]
+        curl = Curl(stats=self._check_stats)
+        try:
+            for proxy in due:
+                start = time.time()
+                try:
+                    curl.request(self.check_url, proxy_info=proxy.info, timeout=self.check_timeout,
+                                 connect_timeout=self.check_timeout, use_cache=False)
+                except BaseCurlException, e:
+                    error = e
+                else:
+                    error = None
+                with self._lock:
+                    if error is not None and proxy.evicted_until is not None:  # still down
+                        proxy.evicted_until = time.time() + self.eviction_time
+                    self._account(proxy, time.time() - start, error)
+        finally:
+            curl.close()
+        with self._lock:
+            return sum(1 for proxy in self._proxies if proxy.evicted_until is None)
+
+    def start(self):
+        """ Run health checks in background thread"""
+        if self._thread is not None or not self.check_url or not self._proxies:
+            return
+        self._thread = threading.Thread(target=self._run, name='transport-proxies')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception, e:
+                log.error('Proxy health check failed: %s' % e)
+            if self._stopped.wait(self.check_interval):
+                return
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {proxy.name: proxy.snapshot(now) for proxy in self._proxies}
+
+
+class ProxiedHandle(object):
+    """ Handle checked out of `ProxiedTransport`, its requests go through proxy pool"""
+
+    def __init__(self, transport, curl):
+        """
+        @param transport (ProxiedTransport): transport which handle belongs to
+        @param curl (Curl): pooled handle
+        """
+        self.transport = transport
+        self.curl = curl
+
+    def __getattr__(self, name):
+        return getattr(self.curl, name)
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, profile=None, **curlargs):
+        """ Performing request through proxy, see `Curl.request`"""
+        return self.transport._through_proxy(self.curl.request, url, method, sink is None, body, headers, sink,
+                                             profile, **curlargs)
+
+    def stream(self, url, method='GET', body=None, headers=None, profile=None, **curlargs):
+        """ Performing streamed request through proxy, see `Curl.stream`"""
+        return self.transport._through_proxy(self.curl.stream, url, method, True, body, headers, profile, **curlargs)
+
+
+class ProxiedTransport(object):
+    """ Transport which sends every request through the best proxy of `ProxyPool`
+
+    Idempotent request which fails on proxy or connection error is repeated
+    through another proxy up to `failover` times. Identical requests are
+    coalesced before proxy is picked, so they share one transfer whichever
+    proxy it goes through. Rest of transport interface (`stream`, `add_request`,
+    `checkout`, `perform` etc.) is available when transport has it, requests of
+    queued transfers and checked out handles go through proxies too.
+    """
+
+    def __init__(self, proxies, transport, failover=1):
+        """
+        @param proxies (ProxyPool): proxy pool
+        @param transport (object): transport which performs requests
+        @param failover (int): count of repeats through other proxies
+        """
+        self.proxies = proxies
+        self.transport = transport
+        self.failover = failover
+        self._flights = SingleFlight()
+
+    def __getattr__(self, name):
+        attr = getattr(self.transport, name)
+        if name in PROXIED_METHODS:
+            return getattr(self, '_' + name)
+        return attr
+
+    @property
+    def profile(self):
+        return getattr(self.transport, 'profile', None) or get_profile()
+
+    def _coalesce_key(self, url, method, body, headers, sink, curlargs):
+        """
+        @return (tuple|None): key of identical requests, None if request must not be coalesced
+        """
+        if not getattr(self.transport, 'coalesce', False) or sink is not None or body is not None:
+            return None
+        if method not in COALESCE_METHODS:
+            return None
+        return make_key(method, url, headers, curlargs)
+
+    def _through_proxy(self, fn, url, method, retry, *args, **curlargs):
+        """ Call `fn(url, method, *args, proxy_info=..., **curlargs)` through the best proxy
+        @param retry (bool): call may be repeated through another proxy, e.g. there is no custom sink
+        @return: result of `fn`
+        """
+        tried = []
+        while True:
+            proxy = self.proxies.acquire(exclude=tuple(tried))
+            if proxy is None:
+                return fn(url, method, *args, **curlargs)
+            start = time.time()
+            try:
+                result = fn(url, method, *args, proxy_info=proxy.info, **curlargs)
+            except Exception, e:
+                exc_info = sys.exc_info()
+                self.proxies.release(proxy, time.time() - start, e)
+                tried.append(proxy)
+                if (not isinstance(e, FAILOVER_ERRORS) or method not in IDEMPOTENT_METHODS or not retry or
+                        len(tried) > self.failover or len(tried) >= len(self.proxies)):
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                log.debug('Request %s %s failed through %s, trying another proxy' % (method, url, proxy.name))
+                continue
+            self.proxies.release(proxy, time.time() - start)
+            return result
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, **curlargs):
+        """ Performing request through proxy, see `Curl.request`
+        @return response (Response):  response object
+        @return resp_body (str): response body
+        """
+        key = self._coalesce_key(url, method, body, headers, sink, curlargs)
+        if key is not None:
+            return self._flights.do(key, self._through_proxy, self.transport.request, url, method, True, body,
+                                    headers, sink, **curlargs)
+        return self._through_proxy(self.transport.request, url, method, sink is None, body, headers, sink, **curlargs)
+
+    def _stream(self, url, method='GET', body=None, headers=None, **curlargs):
+        """ Performing streamed request through proxy, see `CurlPool.stream`
+        Proxy is accounted when response headers are received.
+        @return response (Response):  response object
+        @return chunks (generator): body chunks
+        """
+        return self._through_proxy(self.transport.stream, url, method, True, body, headers, **curlargs)
+
+    def _add_request(self, url, method='GET', body=None, headers=None, sink=None, **curlargs):
+        """ Queue request through proxy, see `CurlMulti.add_request`
+        Queued request is not repeated through another proxy.
+        @return (Future): future resolved with `(response, resp_body)` or `ECurl*` exception
+        """
+        future = Future()
+        key = self._coalesce_key(url, method, body, headers, sink, curlargs)
+        if key is not None:
+            leader = self._flights.join(key, future)
+            if leader is not None:
+                leader.add_done_callback(lambda f: follow(f, future))
+                return future
+        proxy = self.proxies.acquire()
+        start = time.time()
+        try:
+            if proxy is None:
+                queued = self.transport.add_request(url, method, body, headers, sink, **curlargs)
+            else:
+                queued = self.transport.add_request(url, method, body, headers, sink, proxy_info=proxy.info,
+                                                    **curlargs)
+        except Exception, e:
+            exc_info = sys.exc_info()
+            if proxy is not None:
+                self.proxies.release(proxy, time.time() - start, e)
+            future.set_exception(e, exc_info)  # forget coalesced flight
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if proxy is not None:
+            queued.add_done_callback(lambda f: self.proxies.release(
+                proxy, time.time() - start, None if f.cancelled() else f.exception()))
+        queued.add_done_callback(lambda f: follow(f, future))
+        return future
+
+    def _checkout(self, timeout=None):
+        """ Checkout handle whose requests go through proxies, see `CurlPool.checkout`
+        @return (ProxiedHandle): handle, must be returned by `checkin`
+        """
+        return ProxiedHandle(self, self.transport.checkout(timeout))
+
+    def _checkin(self, curl, discard=False):
+        if isinstance(curl, ProxiedHandle):
+            curl = curl.curl
+        self.transport.checkin(curl, discard)
+
+    @contextmanager
+    def _handle(self, timeout=None):
+        """ Checkout handle for the `with` block
+        @yield (ProxiedHandle): handle
+        """
+        curl = self._checkout(timeout)
+        try:
+            yield curl
+        finally:
+            self._checkin(curl)
+
+    def request_many(self, specs, **kwargs):
+        """ Perform requests concurrently on this transport, see `batch.request_many`
+        @return (list|generator): results in input order, result is `(response, resp_body)` or `ErrorResponse`
+        """
+        from .batch import request_many
+        return request_many(specs, self, **kwargs)
+
+    def stats(self):
+        stats = self.transport.stats() if hasattr(self.transport, 'stats') else {}
+        stats['proxies'] = self.proxies.stats()
+        stats['proxy_coalesce'] = self._flights.stats()
+        return stats
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,312 @@
+import random
+import sys
+import threading
+import time
+
+import pycurl
+
+from src.logger import get_logger
+from . import curl_codes as codes
+from .exceptions import ECurlCircuitOpen
+from .exceptions import ECurlConnectionError
+from .exceptions import ECurlConnectionTimeout
+from .exceptions import ECurlPoolTimeout
+from .exceptions import ECurlSSLConnectionError
+from .exceptions import ECurlStatusLineExpected
+from .exceptions import ECurlUnknownRequestError
+from .pool import CurlPool
+from .scheduler import INTERACTIVE
+from .stats import get_stats, host_key
+
+log = get_logger('transport.resilience')
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE')
+RETRYABLE_ERRORS = (ECurlConnectionTimeout, ECurlConnectionError, ECurlStatusLineExpected)
+RETRYABLE_STATUSES = (502, 503, 504)
+# transport errors which are about the host, other errors (pool timeout, open circuit, config) are local
+HOST_ERRORS = (ECurlSSLConnectionError, ECurlUnknownRequestError)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def backoff_delay(attempt, base=0.1, maximum=2.0):
+    """ Exponential backoff with full jitter
+    @param attempt (int): number of failed attempt, from 0
+    @param base (float): delay after the first attempt, in seconds
+    @param maximum (float): maximum delay, in seconds
+    @return (float): delay in seconds
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """ Per-host circuit breaker
+
+    After `threshold` consecutive failures host is `open` and requests fail
+    fast for `reset_timeout` seconds, then one probe request is allowed
+    (`half-open`), its success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        """
+        @param threshold (int): count of consecutive failures which opens circuit, 0 - never open
+        @param reset_timeout (float): seconds before probe request
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> [state, consecutive failures, opened at]
+
+    def before_request(self, host):
+        """
+        @param host (str): host of request
+        @return: None
+
+        @raise ECurlCircuitOpen: host is considered down
+        """
+        if not self.threshold:
+            return
+        with self._lock:
+            circuit = self._hosts.get(host)
+            if circuit is None or circuit[0] == CLOSED:
+                return
+            if circuit[0] == OPEN and time.time() - circuit[2] >= self.reset_timeout:
+                circuit[0] = HALF_OPEN
+                return
+        raise ECurlCircuitOpen('Circuit is open for %s' % host)
+
+    def success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def failure(self, host):
+        if not self.threshold:
+            return
+        with self._lock:
+            circuit = self._hosts.setdefault(host, [CLOSED, 0, None])
+            circuit[1] += 1
+            if circuit[0] == HALF_OPEN or circuit[1] >= self.threshold:
+                if circuit[0] != OPEN:
+                    log.warning('Circuit opened for %s after %d failures' % (host, circuit[1]))
+                circuit[0] = OPEN
+                circuit[2] = time.time()
+
+    def release(self, host):
+        """ Request finished without verdict about host, let another probe in"""
+        with self._lock:
+            circuit = self._hosts.get(host)
+            if circuit is not None and circuit[0] == HALF_OPEN:
+                circuit[0] = OPEN
+
+    def state(self, host):
+        """
+        @param host (str): host
+        @return (str): `closed`, `open` or `half-open`
+        """
+        with self._lock:
+            circuit = self._hosts.get(host)
+            return circuit[0] if circuit is not None else CLOSED
+
+    def states(self):
+        """
+        @return (dict): host -> state of hosts which are not closed
+        """
+        with self._lock:
+            return {host: circuit[0] for host, circuit in self._hosts.iteritems() if circuit[0] != CLOSED}
+
+
+class ResilientPool(CurlPool):
+    """ `CurlPool` with retries, hedged requests and per-host circuit breaker
+
+    Idempotent requests without custom sink are retried with jittered backoff
+    after `RETRYABLE_ERRORS` and `RETRYABLE_STATUSES`. If `hedge_percentile`
+    is set and there are enough timings of the host, a second request is sent
+    when the first one is slower than that percentile, the first response wins.
+    """
+
+    def __init__(self, profile=None, max_size=16, idle_timeout=300, checkout_timeout=30, coalesce=True, scheduler=None,
+                 retries=2, backoff=0.1, backoff_max=2.0, hedge_percentile=None, hedge_min_delay=0.05,
+                 hedge_min_samples=20, breaker_threshold=5, breaker_reset_timeout=30):
+        """
+        @param profile (Profile): transport profile of requests, `default` profile by default
+        @param max_size (int): maximum count of handles
+        @param idle_timeout (int): seconds after which idle handle is closed
+        @param checkout_timeout (int): seconds to wait for free handle, None - wait forever
+        @param coalesce (bool): coalesce identical requests in flight
+        @param scheduler (PriorityScheduler): concurrency budget, shared `get_scheduler()` by default
+        @param retries (int): maximum count of retries
+        @param backoff (float): delay before the first retry, doubled for every next one
+        @param backoff_max (float): maximum delay before retry
+        @param hedge_percentile (int): latency percentile of host after which second request is sent, None - off
+        @param hedge_min_delay (float): minimum delay before second request
+        @param hedge_min_samples (int): minimum count of host timings for hedging
+        @param breaker_threshold (int): consecutive failures which open circuit of host, 0 - off
+        @param breaker_reset_timeout (float): seconds before probe request to host with open circuit
+        """
+        super(ResilientPool, self).__init__(profile, max_size, idle_timeout, checkout_timeout, coalesce, scheduler)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+        self._stats.update({
+            'retries': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'circuit_rejected': 0,
+        })
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, priority=INTERACTIVE, **curlargs):
+        """ Performing request, see `Curl.request`
+        @param priority (str): priority class of request, see `scheduler.PRIORITIES`
+        @return response (Response):  response object
+        @return resp_body (str): response body
+
+        @raise ECurlCircuitOpen: host is considered down
+        @raise ECurl*: error of the last attempt, see `Curl.request`
+        """
+        host = host_key(url)
+        repeatable = method in IDEMPOTENT_METHODS and sink is None
+        attempts = self.retries + 1 if repeatable else 1
+        error = result = None  # outcome of the previous attempt
+        for attempt in xrange(attempts):
+            try:
+                self.breaker.before_request(host)
+            except ECurlCircuitOpen:
+                self._count('circuit_rejected')
+                if error is not None:
+                    raise error[0], error[1], error[2]
+                if result is not None:
+                    return result
+                raise
+            last = attempt + 1 == attempts
+            try:
+                delay = self.hedge_delay(host) if repeatable else None
+                if delay is not None:
+                    with self.scheduler.slot(priority, self.checkout_timeout):
+                        response, resp_body = self._hedged(delay, priority, url, method, body, headers, **curlargs)
+                else:
+                    response, resp_body = super(ResilientPool, self).request(url, method, body, headers, sink,
+                                                                             priority, **curlargs)
+            except RETRYABLE_ERRORS, e:
+                self.breaker.failure(host)
+                if last:
+                    raise
+                error, result = sys.exc_info(), None
+                log.debug('Retrying %s %s after error: %s' % (method, url, e))
+            except HOST_ERRORS:
+                self.breaker.failure(host)
+                raise
+            except Exception:
+                self.breaker.release(host)  # local error, no verdict about host
+                raise
+            else:
+                if response.status not in RETRYABLE_STATUSES:
+                    self.breaker.success(host)
+                    return response, resp_body
+                self.breaker.failure(host)
+                if last:
+                    return response, resp_body
+                error, result = None, (response, resp_body)
+                log.debug('Retrying %s %s after status %d' % (method, url, response.status))
+            self._count('retries')
+            time.sleep(backoff_delay(attempt, self.backoff, self.backoff_max))
+
+    def hedge_delay(self, host):
+        """
+        @param host (str): host
+        @return (float|None): seconds before second request, None - do not hedge
+        """
+        if not self.hedge_percentile:
+            return None
+        percentiles = get_stats().percentiles(host, 'total', (self.hedge_percentile,))
+        if not percentiles or percentiles['count'] < self.hedge_min_samples:
+            return None
+        return max(percentiles['p%d' % self.hedge_percentile], self.hedge_min_delay)
+
+    def _hedged(self, delay, priority, url, method, body, headers, **curlargs):
+        """ Send request, send the same request once more after `delay` seconds, the first response wins
+        Caller holds scheduler slot of the first request, the second one is sent only if there is a free slot.
+        @return response (Response):  response object
+        @return resp_body (str): response body
+        """
+        multi = pycurl.CurlMulti()
+        handles = []
+        active = {}  # pycurl.Curl -> Curl
+        hedge_slot = False
+
+        def start(timeout=None):
+            curl = self.checkout(timeout)
+            handles.append(curl)
+            cached = curl.prepare(url, method, body, headers, None, self.profile, **curlargs)
+            if cached is None:
+                active[curl.h] = curl
+                multi.add_handle(curl.h)
+            return cached
+
+        try:
+            cached = start()
+            if cached is not None:
+                return cached
+            hedge_at = time.time() + delay
+            error = None
+            while active:
+                ret = codes.E_CALL_MULTI_PERFORM
+                while ret == codes.E_CALL_MULTI_PERFORM:
+                    ret, num_handles = multi.perform()
+                num_queued, ok_list, err_list = multi.info_read()
+                for h in ok_list:
+                    curl = active.pop(h)
+                    multi.remove_handle(h)
+                    try:
+                        result = curl.get_response()
+                    except Exception:
+                        error = sys.exc_info()
+                    else:
+                        if curl is not handles[0]:
+                            self._count('hedge_wins')
+                        return result
+                for h, err_code, err_message in err_list:
+                    curl = active.pop(h)
+                    multi.remove_handle(h)
+                    try:
+                        curl.raise_error(err_code, err_message)
+                    except Exception:
+                        error = sys.exc_info()
+                if hedge_at is not None and time.time() >= hedge_at and active:
+                    hedge_at = None
+                    try:
+                        self.scheduler.acquire(priority, 0)
+                        hedge_slot = True
+                        cached = start(timeout=0)
+                    except ECurlPoolTimeout:
+                        log.debug('No free slot or handle for hedged request %s' % url)
+                    else:
+                        self._count('hedged')
+                        if cached is not None:
+                            return cached
+                if active:
+                    wait = 1.0 if hedge_at is None else max(hedge_at - time.time(), 0)
+                    curl_timeout = multi.timeout()
+                    if curl_timeout >= 0:
+                        wait = min(wait, curl_timeout / 1000.0)
+                    if multi.select(wait) == -1 and wait > 0:
+                        time.sleep(min(wait, 0.01))  # no sockets yet, e.g. while resolving
+            raise error[0], error[1], error[2]
+        finally:
+            for curl in handles:
+                if curl.h in active:
+                    multi.remove_handle(curl.h)
+                curl.cleanup()
+                self.checkin(curl)
+            multi.close()
+            if hedge_slot:
+                self.scheduler.release(priority)
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
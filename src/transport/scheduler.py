@@ -0,0 +1,143 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from .exceptions import ECurlConfigError, ECurlPoolTimeout
+
+INTERACTIVE = 'interactive'  # user is waiting for the answer
+BACKGROUND = 'background'  # refreshes, prefetches, warmup
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+def background_limit(concurrency, share):
+    """
+    @param concurrency (int): concurrency budget
+    @param share (float): part of budget available to background requests
+    @return (int): maximum count of background requests in flight, at least one
+    """
+    return max(int(concurrency * share), 1)
+
+
+class _Waiter(object):
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class PriorityScheduler(object):
+    """ Concurrency budget shared by requests of two priority classes
+
+    Waiting interactive requests always get a free slot before background
+    ones; background requests never take more than `background_share` of the
+    budget, so there are free slots for interactive requests when they come.
+    Requests of one class are dispatched in order of arrival.
+    """
+
+    def __init__(self, concurrency=16, background_share=0.25):
+        """
+        @param concurrency (int): maximum count of requests in flight
+        @param background_share (float): part of budget in 0..1 available to background requests
+        """
+        self.concurrency = concurrency
+        self.background_share = background_share
+        self.background_limit = background_limit(concurrency, background_share)
+        self._lock = threading.Lock()
+        self._running = dict.fromkeys(PRIORITIES, 0)
+        self._waiting = {priority: deque() for priority in PRIORITIES}
+        self._stats = {
+            'dispatched': dict.fromkeys(PRIORITIES, 0),
+            'waited': dict.fromkeys(PRIORITIES, 0),
+            'timeouts': 0,
+        }
+
+    def _can_start(self, priority):
+        if sum(self._running.itervalues()) >= self.concurrency:
+            return False
+        if priority == BACKGROUND:
+            return not self._waiting[INTERACTIVE] and self._running[BACKGROUND] < self.background_limit
+        return True
+
+    def _start(self, priority):
+        self._running[priority] += 1
+        self._stats['dispatched'][priority] += 1
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """ Take slot of budget, slot must be returned with `release`
+        @param priority (str): one of `PRIORITIES`
+        @param timeout (float): seconds to wait for slot, None - wait forever
+
+        @raise ECurlConfigError: unknown priority
+        @raise ECurlPoolTimeout: no free slot in time
+        """
+        if priority not in self._running:
+            raise ECurlConfigError('Unknown request priority %s' % priority)
+        with self._lock:
+            if not self._waiting[priority] and self._can_start(priority):
+                self._start(priority)
+                return
+            waiter = _Waiter()
+            self._waiting[priority].append(waiter)
+            self._stats['waited'][priority] += 1
+        if waiter.event.wait(timeout):
+            return
+        with self._lock:
+            if waiter.granted:  # slot was given right at timeout
+                return
+            self._waiting[priority].remove(waiter)
+            self._stats['timeouts'] += 1
+            self._dispatch()  # background waiters may be unblocked by leaving interactive one
+        raise ECurlPoolTimeout('No free transport slot in %s seconds' % timeout)
+
+    def release(self, priority=INTERACTIVE):
+        """ Return slot taken by `acquire`"""
+        with self._lock:
+            self._running[priority] -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            waiting = self._waiting[priority]
+            while waiting and self._can_start(priority):
+                waiter = waiting.popleft()
+                waiter.granted = True
+                self._start(priority)
+                waiter.event.set()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, timeout=None):
+        """ Hold slot of budget for the `with` block, see `acquire`"""
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': dict(self._running),
+                'waiting': {priority: len(waiting) for priority, waiting in self._waiting.iteritems()},
+                'dispatched': dict(self._stats['dispatched']),
+                'waited': dict(self._stats['waited']),
+                'timeouts': self._stats['timeouts'],
+            }
+
+
+_default_scheduler = PriorityScheduler()
+
+
+def configure_scheduler(concurrency=16, background_share=0.25):
+    """ Replace scheduler of transports created after this call
+    @param concurrency (int): maximum count of requests in flight
+    @param background_share (float): part of budget available to background requests
+    @return: None
+    """
+    global _default_scheduler
+    _default_scheduler = PriorityScheduler(concurrency, background_share)
+
+
+def get_scheduler():
+    """ Scheduler shared by all pooled transports"""
+    return _default_scheduler
@@ -0,0 +1,138 @@
+import threading
+
+import pycurl
+
+from src.logger import get_logger
+from . import curl_codes as codes
+
+log = get_logger('transport.share')
+
+DNS_CACHE_TIMEOUT = 60  # libcurl default
+MAX_TRACKED_HOSTS = 1024
+
+
+class CurlShare(object):
+    """ Data shared by all `Curl` handles of transport
+
+    DNS cache, SSL session ids and (if libcurl/pycurl allow it) connection
+    cache are shared through `pycurl.CurlShare`. pycurl installs lock callbacks
+    for every shared data type, so handles may be used from different threads.
+    """
+
+    def __init__(self, dns=True, ssl_session=True, connections=True):
+        """
+        @param dns (bool): share DNS cache
+        @param ssl_session (bool): share SSL session ids
+        @param connections (bool): share connection cache
+        """
+        self.s = pycurl.CurlShare()
+        self.shared = set()
+        for name, enabled, lock_data in (('dns', dns, codes.LOCK_DATA_DNS),
+                                         ('ssl_session', ssl_session, codes.LOCK_DATA_SSL_SESSION),
+                                         ('connections', connections, codes.LOCK_DATA_CONNECT)):
+            if not enabled:
+                continue
+            try:
+                self.s.setopt(codes.SH_SHARE, lock_data)
+            except (pycurl.error, TypeError), e:  # not supported by pycurl/libcurl build
+                log.debug('Sharing of %s is not supported: %s' % (name, e))
+                continue
+            self.shared.add(name)
+        self._lock = threading.Lock()
+        self._resolved = {}  # host -> time of last lookup
+        self._sessions = set()  # hosts with negotiated SSL session
+        self._stats = {
+            'transfers': 0,
+            'connects': 0,
+            'connections_reused': 0,
+            'lookups': 0,
+            'lookups_avoided': 0,
+            'handshakes': 0,
+            'handshakes_avoided': 0,
+            'sessions_resumed': 0,
+        }
+
+    def attach(self, curl):
+        """ Attach handle to shared data
+        @param curl (Curl): handle
+        @return: None
+        """
+        curl.setopt(codes.SHARE, self.s)
+
+    def record(self, record):
+        """ Count lookups and handshakes of finished transfer
+        @param record (TimingRecord): timings of transfer
+        @return: None
+        """
+        host = record.host
+        now = record.timestamp
+        with self._lock:
+            stats = self._stats
+            stats['transfers'] += 1
+            if record.reused:
+                stats['connections_reused'] += 1
+                stats['lookups_avoided'] += 1
+                if record.secure:
+                    stats['handshakes_avoided'] += 1
+                return
+            stats['connects'] += 1
+            resolved = self._resolved.get(host)
+            if 'dns' in self.shared and resolved is not None and now - resolved < DNS_CACHE_TIMEOUT:
+                stats['lookups_avoided'] += 1
+            else:
+                stats['lookups'] += 1
+                self._resolved[host] = now
+            if record.secure:
+                stats['handshakes'] += 1
+                if 'ssl_session' in self.shared and host in self._sessions:
+                    stats['sessions_resumed'] += 1
+                self._sessions.add(host)
+            self._prune(now)
+
+    def _prune(self, now):
+        if len(self._resolved) > MAX_TRACKED_HOSTS:
+            for host, resolved in self._resolved.items():
+                if now - resolved >= DNS_CACHE_TIMEOUT:
+                    del self._resolved[host]
+        if len(self._sessions) > MAX_TRACKED_HOSTS:
+            self._sessions.clear()
+
+    def stats(self):
+        """
+        @return (dict): counters of transfers, connections, lookups and SSL handshakes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['shared'] = sorted(self.shared)
+        return stats
+
+
+_default_share = None
+_share_settings = {}
+_share_lock = threading.Lock()
+
+
+def configure_share(enabled=True, **settings):
+    """ Set up share of handles created after this call
+    @param enabled (bool): share data between handles
+    @param settings (dict): params for `CurlShare`
+    @return: None
+    """
+    global _default_share, _share_settings
+    with _share_lock:
+        _share_settings = dict(settings, enabled=enabled)
+        _default_share = None
+
+
+def get_share():
+    """ Share used by all transport handles
+    @return (CurlShare|None): share, None if sharing is disabled
+    """
+    global _default_share
+    with _share_lock:
+        settings = dict(_share_settings)
+        if not settings.pop('enabled', True):
+            return None
+        if _default_share is None:
+            _default_share = CurlShare(**settings)
+        return _default_share
@@ -0,0 +1,116 @@
+import mmap
+import tempfile
+from collections import deque
+
+
+class BaseSink(object):
+    """ Receiver of response body chunks"""
+
+    def write(self, chunk):
+        raise NotImplementedError()
+
+    def getvalue(self):
+        """
+        @return (str|None): collected body, None if sink does not keep it
+        """
+        return None
+
+
+class BufferSink(BaseSink):
+    """ Collects body in memory"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, chunk):
+        self._chunks.append(chunk)
+
+    def getvalue(self):
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+
+class SpoolSink(BaseSink):
+    """ Collects body in memory until it exceeds threshold, then spills it to a temporary file
+
+    Body of spilled response is returned as read-only `mmap`: it supports `len`,
+    slicing, `find` and `read`, pages are loaded on access and are not part of
+    process heap. Temporary file is unlinked at once, it is removed with the last reference to map.
+    """
+
+    def __init__(self, threshold, directory=None):
+        """
+        @param threshold (int): size in bytes kept in memory
+        @param directory (str): directory for temporary files, system default by default
+        """
+        self.threshold = threshold
+        self.directory = directory
+        self._chunks = []
+        self._size = 0
+        self._file = None
+        self._value = None
+
+    @property
+    def spilled(self):
+        return self._file is not None or isinstance(self._value, mmap.mmap)
+
+    def write(self, chunk):
+        if self._file is None:
+            self._size += len(chunk)
+            if self._size <= self.threshold:
+                self._chunks.append(chunk)
+                return
+            self._file = tempfile.TemporaryFile(prefix='eve-spool-', dir=self.directory)
+            for buffered in self._chunks:
+                self._file.write(buffered)
+            self._chunks = []
+        self._file.write(chunk)
+
+    def getvalue(self):
+        """
+        @return (str|mmap.mmap): body, read-only memory map if it was spilled to disk
+        """
+        if self._value is not None:
+            return self._value
+        if self._file is None:
+            self._value = ''.join(self._chunks)
+            self._chunks = []
+            return self._value
+        self._file.flush()
+        try:
+            self._value = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            self._file.close()  # map keeps its own descriptor
+            self._file = None
+        return self._value
+
+
+class CallbackSink(BaseSink):
+    """ Passes every chunk to callback as soon as it is received"""
+
+    def __init__(self, callback):
+        """
+        @param callback (callable): `callback(chunk)`
+        """
+        self.callback = callback
+
+    def write(self, chunk):
+        self.callback(chunk)
+
+
+class ChunkQueue(BaseSink):
+    """ Keeps received chunks until they are taken by `Curl.stream` iterator"""
+
+    def __init__(self):
+        self._chunks = deque()
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def write(self, chunk):
+        self._chunks.append(chunk)
+
+    def pop_all(self):
+        while self._chunks:
+            yield self._chunks.popleft()
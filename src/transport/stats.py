@@ -0,0 +1,276 @@
+import threading
+import time
+import urlparse
+from bisect import bisect_left
+from collections import deque
+
+from . import curl_codes as codes
+
+# upper bounds of histogram buckets in seconds: 0.5 ms .. ~120 s, every next bucket is 10% wider
+BUCKETS = []
+_bound = 0.0005
+while _bound < 120:
+    BUCKETS.append(round(_bound, 6))
+    _bound *= 1.1
+del _bound
+
+METRICS = ('total', 'ttfb', 'connect')
+PERCENTILES = (50, 95, 99)
+
+
+def host_key(url):
+    """
+    @param url (object with __str__ method): url
+    @return (str): host with port (if it is in url), key of per-host stats
+    """
+    return urlparse.urlsplit(str(url)).netloc.rpartition('@')[2]
+
+
+class TimingRecord(object):
+    """ Timings of one transfer, times are in seconds from the start of transfer"""
+
+    __slots__ = ('url', 'host', 'secure', 'method', 'status', 'error', 'dns', 'connect', 'tls', 'ttfb', 'total',
+                 'bytes_down', 'bytes_up', 'reused', 'timestamp')
+
+    def __init__(self, url, method, status, error, dns, connect, tls, ttfb, total, bytes_down, bytes_up, reused):
+        self.url = url
+        self.host = host_key(url or '')
+        self.secure = (url or '').startswith('https:')
+        self.method = method
+        self.status = status
+        self.error = error
+        self.dns = dns
+        self.connect = connect
+        self.tls = tls
+        self.ttfb = ttfb
+        self.total = total
+        self.bytes_down = bytes_down
+        self.bytes_up = bytes_up
+        self.reused = reused
+        self.timestamp = time.time()
+
+    @classmethod
+    def from_curl(cls, curl, method=None, error=None):
+        """
+        @param curl (Curl): handle after transfer
+        @param method (str): request method
+        @param error (int): libcurl error code, None for successful transfer
+        @return (TimingRecord): record
+        """
+        getinfo = curl.getinfo
+        return cls(getinfo(codes.EFFECTIVE_URL), method, getinfo(codes.RESPONSE_CODE), error,
+                   getinfo(codes.NAMELOOKUP_TIME), getinfo(codes.CONNECT_TIME), getinfo(codes.APPCONNECT_TIME),
+                   getinfo(codes.STARTTRANSFER_TIME), getinfo(codes.TOTAL_TIME), int(getinfo(codes.SIZE_DOWNLOAD)),
+                   int(getinfo(codes.SIZE_UPLOAD)), not (error or getinfo(codes.NUM_CONNECTS)))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return '<TimingRecord %s %s %.3fs>' % (self.method, self.url, self.total)
+
+
+class RollingHistogram(object):
+    """ Latency histogram over the last `window` seconds
+
+    Window is split into `slots` parts, the oldest part is dropped as a whole.
+    """
+
+    __slots__ = ('slot_width', '_slots')
+
+    def __init__(self, window=60, slots=6):
+        """
+        @param window (int): window in seconds
+        @param slots (int): count of window parts
+        """
+        self.slot_width = float(window) / slots
+        self._slots = [[None, None] for _ in xrange(slots)]  # [slot id, bucket counts]
+
+    def add(self, value, now=None):
+        slot_id = int((now or time.time()) / self.slot_width)
+        slot = self._slots[slot_id % len(self._slots)]
+        if slot[0] != slot_id:
+            slot[0] = slot_id
+            slot[1] = [0] * (len(BUCKETS) + 1)
+        slot[1][bisect_left(BUCKETS, value)] += 1
+
+    def counts(self, now=None):
+        """
+        @return (list): bucket counts over window
+        """
+        oldest = int((now or time.time()) / self.slot_width) - len(self._slots)
+        counts = [0] * (len(BUCKETS) + 1)
+        for slot_id, slot_counts in self._slots:
+            if slot_id is not None and slot_id > oldest:
+                counts = [a + b for a, b in zip(counts, slot_counts)]
+        return counts
+
+    def percentiles(self, percentiles=PERCENTILES, now=None):
+        """
+        @param percentiles (tuple): percentiles in 0..100
+        @return (dict): `count` and `p<N>` -> upper bound of bucket in seconds (None if no data)
+        """
+        counts = self.counts(now)
+        total = sum(counts)
+        result = {'count': total}
+        for percentile in percentiles:
+            value = None
+            if total:
+                rank = total * percentile / 100.0
+                seen = 0
+                for index, count in enumerate(counts):
+                    seen += count
+                    if seen >= rank and count:
+                        value = BUCKETS[index] if index < len(BUCKETS) else float('inf')
+                        break
+            result['p%d' % percentile] = value
+        return result
+
+
+class HostStats(object):
+    __slots__ = ('histograms', 'counters')
+
+    def __init__(self, window, slots):
+        self.histograms = {metric: RollingHistogram(window, slots) for metric in METRICS}
+        self.counters = {
+            'requests': 0,
+            'errors': 0,
+            'reused': 0,
+            'bytes_down': 0,
+            'bytes_up': 0,
+            'dns_time': 0.0,
+            'connect_time': 0.0,
+            'tls_time': 0.0,
+        }
+
+
+class TransportStats(object):
+    """ Thread-safe per-host timings of transfers"""
+
+    def __init__(self, window=60, slots=6, keep_records=256):
+        """
+        @param window (int): histograms window in seconds
+        @param slots (int): count of histogram window parts
+        @param keep_records (int): count of the last records kept for inspection
+        """
+        self.window = window
+        self.slots = slots
+        self._hosts = {}
+        self._records = deque(maxlen=keep_records)
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        """
+        @param record (TimingRecord): record of finished transfer
+        @return: None
+        """
+        # timed out transfer would take at least its elapsed time, the sample lets adaptive timeouts grow;
+        # other failures are not latency samples
+        timed_out = record.error == codes.E_OPERATION_TIMEDOUT
+        now = record.timestamp
+        with self._lock:
+            host = self._hosts.get(record.host)
+            if host is None:
+                host = self._hosts[record.host] = HostStats(self.window, self.slots)
+            counters = host.counters
+            counters['requests'] += 1
+            counters['bytes_down'] += record.bytes_down
+            counters['bytes_up'] += record.bytes_up
+            if record.error:
+                counters['errors'] += 1
+            if record.reused:
+                counters['reused'] += 1
+            else:
+                counters['dns_time'] += record.dns
+                counters['connect_time'] += record.connect - record.dns
+                if record.secure:
+                    counters['tls_time'] += record.tls - record.connect
+                if not record.error or timed_out:  # whole connection phase, as limited by connect timeout
+                    connected = record.tls if record.secure else record.connect
+                    host.histograms['connect'].add(max(record.connect, record.tls) if connected else record.total,
+                                                   now)
+            if not record.error or timed_out:
+                host.histograms['total'].add(record.total, now)
+            if not record.error:
+                host.histograms['ttfb'].add(record.ttfb, now)
+            self._records.append(record)
+
+    def timeouts(self, host, multiplier, bounds, connect_bounds, min_samples=20, percentile=99):
+        """ Timeouts for request to host derived from its latency
+        @param host (str): host (with port if it was in url)
+        @param multiplier (float): multiplier of latency percentile
+        @param bounds (tuple): `(min, max)` of timeout in seconds
+        @param connect_bounds (tuple): `(min, max)` of connect timeout in seconds
+        @param min_samples (int): samples in window needed for estimate, upper bounds are used without them
+        @param percentile (int): latency percentile in 0..100
+        @return (tuple): `(timeout, connect_timeout)` in seconds
+        """
+        result = []
+        with self._lock:
+            stats = self._hosts.get(host)
+            for metric, (lower, upper) in (('total', bounds), ('connect', connect_bounds)):
+                value = upper
+                if stats is not None:
+                    estimate = stats.histograms[metric].percentiles((percentile,))
+                    if estimate['count'] >= min_samples:
+                        value = min(max(estimate['p%d' % percentile] * multiplier, lower), upper)
+                result.append(value)
+        return tuple(result)
+
+    def hosts(self):
+        with self._lock:
+            return self._hosts.keys()
+
+    def percentiles(self, host, metric='total', percentiles=PERCENTILES):
+        """
+        @param host (str): host (with port if it was in url)
+        @param metric (str): one of `METRICS`
+        @param percentiles (tuple): percentiles in 0..100
+        @return (dict|None): see `RollingHistogram.percentiles`, None for unknown host
+        """
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                return None
+            return stats.histograms[metric].percentiles(percentiles)
+
+    def snapshot(self):
+        """
+        @return (dict): host -> counters and percentiles of every metric
+        """
+        with self._lock:
+            result = {}
+            for name, stats in self._hosts.iteritems():
+                host = dict(stats.counters)
+                for metric, histogram in stats.histograms.iteritems():
+                    host[metric] = histogram.percentiles()
+                result[name] = host
+            return result
+
+    def last_records(self):
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+            self._records.clear()
+
+
+_default_stats = TransportStats()
+
+
+def configure_stats(window=60, slots=6, keep_records=256):
+    """ Replace transport stats, collected timings are dropped
+    @param window (int): histograms window in seconds
+    @param slots (int): count of histogram window parts
+    @param keep_records (int): count of the last records kept for inspection
+    @return: None
+    """
+    global _default_stats
+    _default_stats = TransportStats(window, slots, keep_records)
+
+
+def get_stats():
+    """ Timings shared by all transport handles"""
+    return _default_stats
@@ -0,0 +1,127 @@
+import threading
+import urlparse
+
+import pycurl
+
+from src.logger import get_logger
+from .curl_connector import Curl, codes
+from .exceptions import BaseCurlException
+from .scheduler import BACKGROUND
+
+log = get_logger('transport.warmup')
+
+HEAD = 'head'  # HEAD request on transport handles, connections stay alive in them
+CONNECT = 'connect'  # CONNECT_ONLY, warms shared DNS cache and TLS sessions only
+MODES = (HEAD, CONNECT)
+
+
+def origin_of(url):
+    """
+    @param url (object with __str__ method): url
+    @return (str|None): `scheme://host[:port]/`, None for url without host
+    """
+    parts = urlparse.urlsplit(str(url))
+    if not parts.scheme or not parts.netloc:
+        return None
+    return '%s://%s/' % (parts.scheme, parts.netloc.rsplit('@', 1)[-1])
+
+
+class Warmer(object):
+    """ Pre-resolves and pre-connects to declared upstream origins
+
+    In `head` mode every origin gets `connections` HEAD requests on separate
+    handles of the transport, keep-alive connections stay in those handles and
+    the first real request skips DNS, TCP and TLS setup. libcurl does not reuse
+    CONNECT_ONLY connections for transfers, so `connect` mode only fills shared
+    DNS cache and TLS session cache. Connections are refreshed every
+    `refresh_interval` seconds, so servers do not close them as idle.
+    """
+
+    def __init__(self, transport, origins=(), mode=HEAD, connections=1, refresh_interval=55):
+        """
+        @param transport (object): transport to warm up
+        @param origins (iterable): urls, only scheme, host and port are used
+        @param mode (str): `head` or `connect`
+        @param connections (int): warm connections per origin
+        @param refresh_interval (float): seconds between refreshes, 0 - warm up once
+        """
+        self.transport = transport
+        self.origins = []
+        self.mode = mode
+        self.connections = connections
+        self.refresh_interval = refresh_interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self.add_origins(origins)
+
+    def add_origins(self, origins):
+        for url in origins:
+            origin = origin_of(url)
+            if origin is None:
+                log.warning('Warmup: %s has no host, skipped' % url)
+            elif origin not in self.origins:
+                self.origins.append(origin)
+
+    def warm(self):
+        """ Warm up all origins, errors are logged
+        @return (int): count of warmed origins
+        """
+        warmed = 0
+        for origin in list(self.origins):
+            try:
+                if self.mode == CONNECT:
+                    self._connect(origin)
+                else:
+                    self._head(origin)
+            except BaseCurlException, e:
+                log.warning('Warmup of %s failed: %s' % (origin, e))
+            else:
+                warmed += 1
+        log.debug('Warmup: %d of %d origins are warm' % (warmed, len(self.origins)))
+        return warmed
+
+    def _connect(self, origin):
+        curl = Curl()
+        try:
+            curl.setopt(codes.URL, origin)
+            curl.setopt(codes.CONNECT_ONLY, 1)
+            try:
+                curl.perform()
+            except pycurl.error, e:
+                curl.raise_error(*e.args)
+        finally:
+            curl.close()
+
+    def _head(self, origin):
+        if not hasattr(self.transport, 'checkout'):
+            self.transport.request(origin, 'HEAD', use_cache=False, priority=BACKGROUND)
+            return
+        handles = []
+        try:
+            for _ in xrange(self.connections):
+                handles.append(self.transport.checkout())
+            for curl in handles:
+                with self.transport.scheduler.slot(BACKGROUND):  # warmup must not crowd out requests
+                    curl.request(origin, 'HEAD', profile=self.transport.profile, use_cache=False)
+        finally:
+            for curl in handles:
+                self.transport.checkin(curl)
+
+    def start(self):
+        """ Warm up in background thread and keep refreshing connections"""
+        if self._thread is not None or not self.origins:
+            return
+        self._thread = threading.Thread(target=self._run, name='transport-warmup')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        self.warm()
+        while self.refresh_interval and not self._stopped.wait(self.refresh_interval):
+            self.warm()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
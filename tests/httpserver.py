@@ -0,0 +1,70 @@
+import BaseHTTPServer
+import SocketServer
+import socket
+import sys
+import threading
+import time
+import urlparse
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Upstream of tests, response is described by query params:
+
+    `status` - status code, `delay` - latency in seconds, `size` - body size,
+    `cookie` - value of `Set-Cookie`, `cc` - value of `Cache-Control`,
+    `vary` - value of `Vary`, `nolength` - body is delimited by closing of
+    connection. Body is `size` bytes or, by default, the value of request
+    header named by `echo` (`Cookie` by default).
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        params = dict(urlparse.parse_qsl(urlparse.urlsplit(self.path).query))
+        if params.get('delay'):
+            time.sleep(float(params['delay']))
+        if 'size' in params:
+            body = 'x' * int(params['size'])
+        else:
+            body = self.headers.get(params.get('echo', 'Cookie')) or ''
+        self.send_response(int(params.get('status', 200)))
+        for param, header in (('cookie', 'Set-Cookie'), ('cc', 'Cache-Control'), ('vary', 'Vary')):
+            if params.get(param):
+                self.send_header(header, params[param])
+        if params.get('nolength'):
+            self.send_header('Connection', 'close')
+            self.close_connection = 1
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_HEAD = do_POST = do_GET
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], socket.error):  # client aborted transfer
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+def start_server():
+    """
+    @return (Server): server running in a background thread, `url` is its base url, `requests` - received requests
+    """
+    server = Server(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.url = 'http://127.0.0.1:%d/' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
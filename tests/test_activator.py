@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import re
+import unittest
+
+from src.core.utils.activator import Activator, KeywordAutomaton
+
+
+class KeywordAutomatonTest(unittest.TestCase):
+    def test_overlapping_keywords(self):
+        automaton = KeywordAutomaton()
+        for keyword in (u'he', u'she', u'his', u'hers'):
+            automaton.add(keyword, keyword)
+        automaton.compile()
+        self.assertEqual(automaton.search(u'ushers'), set([u'he', u'she', u'hers']))
+        self.assertEqual(automaton.search(u'this'), set([u'his']))
+        self.assertEqual(automaton.search(u'hx'), set())
+
+    def test_add_after_compile(self):
+        automaton = KeywordAutomaton()
+        automaton.add(u'one', 1)
+        automaton.compile()
+        automaton.add(u'two', 2)
+        self.assertEqual(automaton.search(u'one two'), set([1, 2]))
+
+
+class ActivatorTest(unittest.TestCase):
+    def setUp(self):
+        self.activator = Activator()
+        self.activator.add('weather', ['Weather', u'погода'])
+        self.activator.add('time', [re.compile(r'\d+:\d+')])
+        self.activator.add('chat')
+        self.activator.add('music', ['play'])
+        self.activator.compile()
+
+    def test_candidates_in_order_of_add(self):
+        self.assertEqual(self.activator.candidates('play weather at 10:30'), ['weather', 'time', 'chat', 'music'])
+
+    def test_plugin_without_triggers_is_always_candidate(self):
+        self.assertEqual(self.activator.candidates('hello'), ['chat'])
+
+    def test_keywords_are_case_insensitive(self):
+        self.assertEqual(self.activator.candidates('weather'), ['weather', 'chat'])
+
+    def test_unicode_keywords_in_utf8_text(self):
+        self.assertEqual(self.activator.candidates(u'какая погода'.encode('utf-8')), ['weather', 'chat'])
+
+    def test_patterns(self):
+        self.assertEqual(self.activator.candidates('wake me at 7:15'), ['time', 'chat'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import time
+import unittest
+
+from src.transport.batch import request_many
+from src.transport.curl_multi import CurlMulti
+from src.transport.evented import EventedMulti
+from src.transport.exceptions import ErrorResponse, ECurlConnectionError, ECurlConnectionTimeout
+from src.transport.pool import CurlPool
+from tests.httpserver import start_server
+from tests.test_cassette import closed_port_url
+
+
+class PoolBatchTest(unittest.TestCase):
+    engine = CurlPool
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.transport = self.engine(coalesce=False)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def url(self, delay=0, size=1, n=0):
+        return self.server.url + '?delay=%s&size=%d&n=%d' % (delay, size, n)
+
+    def test_results_in_input_order(self):
+        specs = [self.url(delay=delay, size=i) for i, delay in enumerate((0.3, 0.2, 0.1, 0))]
+        start = time.time()
+        results = request_many([{'url': url, 'use_cache': False} for url in specs], self.transport)
+        self.assertEqual([body for response, body in results], ['x' * i for i in xrange(4)])
+        self.assertLess(time.time() - start, 0.6)
+
+    def test_as_completed(self):
+        specs = [{'url': self.url(delay=delay, n=i), 'use_cache': False} for i, delay in enumerate((0.3, 0.2, 0.1, 0))]
+        indexes = [index for index, result in request_many(specs, self.transport, as_completed=True)]
+        self.assertEqual(indexes, [3, 2, 1, 0])
+
+    def test_deadline(self):
+        specs = [{'url': self.url(delay=delay, n=i), 'use_cache': False} for i, delay in enumerate((1.0, 0, 1.0))]
+        start = time.time()
+        results = request_many(specs, self.transport, timeout=0.3)
+        self.assertLess(time.time() - start, 0.8)
+        self.assertEqual(results[1][0].status, 200)
+        for result in (results[0], results[2]):
+            self.assertIsInstance(result, ErrorResponse)
+            self.assertEqual(result.error, ErrorResponse.TIMEOUT)
+
+    def test_per_host_limit(self):
+        specs = [{'url': self.url(delay=0.2, n=i), 'use_cache': False} for i in xrange(3)]
+        start = time.time()
+        results = request_many(specs, self.transport, max_per_host=1)
+        self.assertGreaterEqual(time.time() - start, 0.6)
+        self.assertEqual([response.status for response, body in results], [200] * 3)
+
+    def test_mixed_errors(self):
+        specs = [
+            {'url': self.url(size=2), 'use_cache': False},
+            {'url': closed_port_url(), 'use_cache': False},
+            {'url': self.url(delay=2, n=1), 'timeout': 1, 'adaptive_timeout': False, 'use_cache': False},
+            {'url': self.url(size=1000, n=2), 'download_limit': 100, 'use_cache': False},
+        ]
+        results = request_many(specs, self.transport, timeout=10)
+        self.assertEqual(results[0][1], 'xx')
+        self.assertEqual([result.error for result in results[1:]],
+                         [ErrorResponse.CONNECT_FAIL, ErrorResponse.TIMEOUT, ErrorResponse.DOWNLOAD_LIMIT_EXCEEDED])
+        self.assertIs(results[1].request['url'], specs[1]['url'])
+
+    def test_request_errors(self):
+        self.assertRaises(ECurlConnectionError, self.transport.request, closed_port_url(), use_cache=False)
+        self.assertRaises(ECurlConnectionTimeout, self.transport.request, self.url(delay=2), timeout=1,
+                          adaptive_timeout=False, use_cache=False)
+        self.assertEqual(self.transport.request(self.url(size=2, n=1), use_cache=False)[1], 'xx')
+
+
+class MultiBatchTest(PoolBatchTest):
+    engine = CurlMulti
+
+
+class EventedBatchTest(PoolBatchTest):
+    engine = EventedMulti
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from benchmarks.runner import compare
+
+BASELINE = {'pool': {'rps': 1000, 'p50_ms': 1.0, 'p99_ms': 5.0, 'cpu_ms_per_req': 0.5, 'peak_rss_kb': 20000,
+                     'errors': 0}}
+
+
+def results(**changes):
+    metrics = dict(BASELINE['pool'])
+    metrics.update(changes)
+    return {'pool': metrics}
+
+
+class CompareTest(unittest.TestCase):
+    def test_no_regressions(self):
+        self.assertEqual(compare(BASELINE, results(rps=900, p99_ms=5.5)), [])
+
+    def test_metric_regressions(self):
+        regressions = compare(BASELINE, results(rps=700, p99_ms=7.0))
+        self.assertEqual([(name, metric) for name, metric, _, _, _ in regressions],
+                         [('pool', 'p99_ms'), ('pool', 'rps')])
+
+    def test_new_errors_are_regression(self):
+        self.assertEqual(compare(BASELINE, results(errors=1)), [('pool', 'errors', 0, 1, float('inf'))])
+
+    def test_more_errors_are_regression(self):
+        baseline = {'pool': dict(BASELINE['pool'], errors=10)}
+        self.assertEqual(compare(baseline, results(errors=11)), [('pool', 'errors', 10, 11, 0.1)])
+        self.assertEqual(compare(baseline, results(errors=5)), [])
+
+    def test_unknown_scenario_is_skipped(self):
+        self.assertEqual(compare(BASELINE, {'multi': dict(BASELINE['pool'], errors=3)}), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
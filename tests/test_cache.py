@@ -0,0 +1,122 @@
+import unittest
+
+from src.transport.cache import ResponseCache
+from src.transport.curl_connector import Curl, Response
+from tests.httpserver import start_server
+
+URL = 'http://example.com/data'
+
+
+def response(*headers):
+    return Response(['Cache-Control: max-age=60'] + list(headers), 'HTTP/1.1 200 OK')
+
+
+class VaryTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+
+    def store(self, *headers):
+        return self.cache.add_to_cache(ResponseCache.make_key('GET', URL), response(*headers), 'body')
+
+    def test_vary_on_key_headers_is_stored(self):
+        self.assertIsNotNone(self.store('Vary: Accept-Language, Cookie'))
+        self.assertIsNotNone(self.store('Vary: accept-encoding'))
+
+    def test_vary_on_other_headers_is_not_stored(self):
+        self.assertIsNone(self.store('Vary: User-Agent'))
+        self.assertIsNone(self.store('Vary: Cookie', 'Vary: X-Variant'))
+        self.assertIsNone(self.store('Vary: *'))
+
+    def test_key_headers_select_variant(self):
+        english = ResponseCache.make_key('GET', URL, {'Accept-Language': 'en'})
+        german = ResponseCache.make_key('GET', URL, {'Accept-Language': 'de', 'X-Request-Id': '1'})
+        self.cache.add_to_cache(english, response('Vary: Accept-Language'), 'hello')
+        self.assertIsNone(self.cache.get_from_cache(german))
+        self.assertEqual(ResponseCache.make_key('GET', URL, {'accept-language': 'en', 'X-Request-Id': '2'}), english)
+
+
+class PrivateResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+
+    def store(self, key, *headers):
+        return self.cache.add_to_cache(key, Response(list(headers), 'HTTP/1.1 200 OK'), 'body')
+
+    def test_set_cookie_is_not_stored(self):
+        key = ResponseCache.make_key('GET', URL)
+        self.assertIsNone(self.store(key, 'Cache-Control: max-age=60', 'Set-Cookie: sid=1'))
+        self.assertIsNotNone(self.store(key, 'Cache-Control: public, max-age=60', 'Set-Cookie: sid=1'))
+
+    def test_credentialed_request_is_not_stored(self):
+        for key in (ResponseCache.make_key('GET', URL, {'Authorization': 'Basic x'}),
+                    ResponseCache.make_key('GET', URL, {'Cookie': 'sid=1'}),
+                    ResponseCache.make_key('GET', URL, credentials='fingerprint')):
+            self.assertIsNone(self.store(key, 'Cache-Control: max-age=60'))
+            self.assertIsNotNone(self.store(key, 'Cache-Control: public, max-age=60'))
+
+    def test_credentials_are_part_of_key(self):
+        self.assertNotEqual(ResponseCache.make_key('GET', URL, credentials='a'),
+                            ResponseCache.make_key('GET', URL, credentials='b'))
+
+
+class CredentialsTransferTest(unittest.TestCase):
+    """ Response to request with credentials of handle is never served to request with other credentials"""
+
+    def setUp(self):
+        self.server = start_server()
+        self.curl = Curl(cache=ResponseCache())
+        self.public = self.server.url + '?cc=public%2C+max-age%3D60'
+
+    def tearDown(self):
+        self.curl.close()
+        self.server.shutdown()
+
+    def test_cookie_data(self):
+        self.assertEqual(self.curl.request(self.public, cookie_data='session=A')[1], 'session=A')
+        response, body = self.curl.request(self.public, cookie_data='session=B')
+        self.assertFalse(response.fromcache)
+        self.assertEqual(body, 'session=B')
+        self.assertTrue(self.curl.request(self.public, cookie_data='session=B')[0].fromcache)
+
+    def test_http_auth(self):
+        self.curl.request(self.public, http_auth_credintals={'username': 'alice', 'password': 'x'})
+        self.assertFalse(self.curl.request(self.public,
+                                           http_auth_credintals={'username': 'bob', 'password': 'x'})[0].fromcache)
+        self.assertFalse(self.curl.request(self.public)[0].fromcache)
+
+    def test_private_response_is_not_stored(self):
+        url = self.server.url + '?cc=max-age%3D60'
+        self.curl.request(url, cookie_data='session=A')
+        self.assertFalse(self.curl.request(url, cookie_data='session=A')[0].fromcache)
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class VaryTransferTest(unittest.TestCase):
+    """ Variant selected by request header which is not a part of cache key is never served to another request"""
+
+    def setUp(self):
+        self.server = start_server()
+        self.curl = Curl(cache=ResponseCache())
+
+    def tearDown(self):
+        self.curl.close()
+        self.server.shutdown()
+
+    def request(self, url, variant):
+        return self.curl.request(url, headers={'X-Variant': variant})[1]
+
+    def test_named_vary(self):
+        url = self.server.url + '?cc=max-age%3D60&vary=X-Variant&echo=X-Variant'
+        self.assertEqual(self.request(url, 'a'), 'a')
+        self.assertEqual(self.request(url, 'b'), 'b')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_vary_on_key_header_is_cached(self):
+        url = self.server.url + '?cc=max-age%3D60&vary=Accept-Encoding'
+        self.request(url, 'a')
+        self.request(url, 'b')
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from src.transport.cassette import CassetteTransport, RECORD, REPLAY, AUTO
+from src.transport.exceptions import ECurlCassetteMiss, ECurlConnectionError
+from src.transport.pool import CurlPool
+from tests.httpserver import start_server
+
+
+def closed_port_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:%d/' % port
+
+
+class CassetteTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        del self.server.requests[:]
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.cassette')
+        self.transports = []
+
+    def tearDown(self):
+        for transport in self.transports:
+            transport.close()
+        shutil.rmtree(self.directory)
+
+    def cassette(self, mode, **kwargs):
+        live = CurlPool(coalesce=False)
+        transport = CassetteTransport(path=self.path, mode=mode, transport=live, **kwargs)
+        self.transports.extend([transport, live])
+        return transport
+
+    def test_record_and_replay(self):
+        refused = closed_port_url()
+        recorder = self.cassette(RECORD)
+        recorded = recorder.request(self.server.url + '?size=3&cc=no-cache', use_cache=False)
+        posted = recorder.request(self.server.url + '?size=1', 'POST', body='payload')
+        self.assertRaises(ECurlConnectionError, recorder.request, refused, use_cache=False)
+        self.assertEqual(recorder.stats()['recorded'], 3)
+        recorder.close()
+        del self.server.requests[:]
+
+        player = self.cassette(REPLAY)
+        response, body = player.request(self.server.url + '?size=3&cc=no-cache')
+        self.assertEqual((response.status, response.reason, response.version, body), (200, 'OK', 11, 'xxx'))
+        self.assertEqual(response.raw_headers, recorded[0].raw_headers)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(player.request(self.server.url + '?size=1', 'POST', body='payload')[1], posted[1])
+        self.assertRaises(ECurlConnectionError, player.request, refused)
+        self.assertRaises(ECurlCassetteMiss, player.request, self.server.url + '?size=1', 'POST', body='other')
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(player.stats(), {'replayed': 3, 'recorded': 0, 'missed': 1, 'exchanges': 3})
+
+    def test_auto_mode_records_new_exchanges(self):
+        transport = self.cassette(AUTO)
+        first = transport.request(self.server.url + '?size=2', use_cache=False)
+        second = transport.request(self.server.url + '?size=2', use_cache=False)
+        self.assertEqual(first[1], second[1])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual((transport.stats()['recorded'], transport.stats()['replayed']), (1, 1))
+
+    def test_original_latency(self):
+        self.cassette(RECORD).request(self.server.url + '?delay=0.2', use_cache=False)
+        self.transports[0].close()
+        start = time.time()
+        self.cassette(REPLAY, latency='original').request(self.server.url + '?delay=0.2')
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_truncated_record_is_skipped(self):
+        recorder = self.cassette(RECORD)
+        recorder.request(self.server.url + '?size=1', use_cache=False)
+        recorder.close()
+        with open(self.path, 'ab') as f:
+            f.write('\x00\x00\x00\x10broken')
+        player = self.cassette(REPLAY)
+        self.assertEqual(player.request(self.server.url + '?size=1')[1], 'x')
+        self.assertEqual(player.stats()['exchanges'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from src.transport import curl_codes as codes
+from src.transport.curl_connector import Curl
+from tests.httpserver import start_server
+
+
+class LeanRequestTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.curl = Curl()
+
+    def tearDown(self):
+        self.curl.close()
+
+    def test_headers_without_verbose_capture(self):
+        response, body = self.curl.request(self.server.url + '?size=2&cookie=a%3Db&cc=no-store', use_cache=False)
+        self.assertIsNone(self.curl.debug_buffer)
+        self.assertEqual((response.status, body), (200, 'xx'))
+        self.assertEqual(response.get('Set-Cookie'), 'a=b')
+        self.assertEqual(response.get('Cache-Control'), 'no-store')
+
+    def test_raw_request_is_rebuilt_without_verbose_capture(self):
+        self.curl.request(self.server.url + '?size=1', headers={'X-Test': 'value'}, use_cache=False)
+        raw_request = self.curl.raw_request()
+        self.assertTrue(raw_request.startswith('GET /?size=1 HTTP/1.1\r\nHost: 127.0.0.1:'))
+        self.assertIn('X-Test: value\r\n', raw_request)
+
+    def test_diagnostic_mode_captures_libcurl_output(self):
+        self.curl.set_debug()
+        self.curl.request(self.server.url, 'POST', body='payload', headers={'X-Test': 'value'}, use_cache=False)
+        self.assertTrue(self.curl.debug_buffer[codes.INFOTYPE_HEADER_IN])
+        raw_request = self.curl.raw_request()
+        self.assertIn('X-Test: value\r\n', raw_request)
+        self.assertIn('Accept-Encoding:', raw_request)  # added by libcurl itself
+        self.assertTrue(raw_request.endswith('payload'))
+        self.curl.set_debug(False)
+        self.curl.request(self.server.url, use_cache=False)
+        self.assertIsNone(self.curl.debug_buffer)
+
+
+if __name__ == '__main__':
+    unittest.main()
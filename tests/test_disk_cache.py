@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from src.transport.cache import ResponseCache
+from src.transport.curl_connector import Response
+from src.transport.disk_cache import DiskCache, TieredCache
+from src.transport.sinks import SpoolSink
+
+URL = 'http://example.com/data'
+
+
+def response(body_tag, max_age=60):
+    return Response(['Cache-Control: public, max-age=%d' % max_age, 'ETag: "%s"' % body_tag], 'HTTP/1.1 200 OK')
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tiered(self):
+        return TieredCache(DiskCache(self.path))
+
+    def test_request_headers_are_not_stored_in_plain_text(self):
+        cache = self.tiered()
+        key = ResponseCache.make_key('GET', URL, {'Authorization': 'Bearer SECRET', 'Cookie': 'sid=SECRET2'})
+        cache.add_to_cache(key, response('a'), 'body')
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                data = f.read()
+            self.assertFalse('SECRET' in data, 'Request header value found in %s' % name)
+        self.assertEqual(self.tiered().get_from_cache(key).body, 'body')
+
+    def test_keys_with_different_headers_differ(self):
+        cache = self.tiered()
+        alice = ResponseCache.make_key('GET', URL, {'Authorization': 'alice'})
+        bob = ResponseCache.make_key('GET', URL, {'Authorization': 'bob'})
+        cache.add_to_cache(alice, response('a'), 'alice')
+        self.assertIsNone(self.tiered().get_from_cache(bob))
+        self.assertEqual(self.tiered().get_from_cache(alice).body, 'alice')
+
+    def test_stale_memory_entry_is_replaced_by_fresher_disk_entry(self):
+        key = ResponseCache.make_key('GET', URL)
+        worker, other = self.tiered(), self.tiered()
+        worker.add_to_cache(key, response('old'), 'old')
+        worker.get_from_cache(key).expires = time.time() - 1  # stale in memory of worker
+        other.add_to_cache(key, response('new'), 'new')
+        entry = worker.get_from_cache(key)
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(entry.body, 'new')
+        self.assertIs(worker.get_from_cache(key), entry)  # promoted to memory
+
+    def test_stale_entry_is_kept_without_fresher_one(self):
+        key = ResponseCache.make_key('GET', URL)
+        cache = self.tiered()
+        cache.add_to_cache(key, response('old'), 'old')
+        entry = cache.get_from_cache(key)
+        entry.expires = time.time() - 1
+        cache.disk.touch(key, entry.expires)
+        self.assertIs(cache.get_from_cache(key), entry)  # stale, but can be revalidated
+
+    def test_entries_survive_restart(self):
+        key = ResponseCache.make_key('GET', URL)
+        self.tiered().add_to_cache(key, response('a'), 'body')
+        entry = self.tiered().get_from_cache(key)
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(entry.response.get('ETag'), '"a"')
+
+    def test_spooled_body_is_not_stored(self):
+        key = ResponseCache.make_key('GET', URL)
+        sink = SpoolSink(threshold=10)
+        sink.write('x' * 100)
+        body = sink.getvalue()
+        self.assertFalse(isinstance(body, str))
+        disk = DiskCache(self.path)
+        self.tiered().add_to_cache(key, response('a'), 'small')
+        TieredCache(disk).add_to_cache(key, response('b'), body)
+        self.assertEqual(disk.stats()['skipped'], 1)
+        self.assertIsNone(DiskCache(self.path).get(key))  # previous body is dropped as well
+
+    def test_oversize_body_is_not_stored(self):
+        key = ResponseCache.make_key('GET', URL)
+        disk = DiskCache(self.path, max_entry_size=10)
+        cache = TieredCache(disk)
+        cache.add_to_cache(key, response('a'), 'x' * 11)
+        self.assertEqual(cache.get_from_cache(key).body, 'x' * 11)  # memory tier still has it
+        self.assertEqual(disk.stats()['skipped'], 1)
+        self.assertIsNone(self.tiered().get_from_cache(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from src.core.utils.futures import Future, CancelledError, chain
+
+
+class FutureTest(unittest.TestCase):
+    def setUp(self):
+        self.future = Future()
+        self.calls = []
+        self.future.add_done_callback(self.calls.append)
+
+    def test_result_after_cancel_is_ignored(self):
+        self.assertTrue(self.future.cancel())
+        self.future.set_result('late')
+        self.future.set_exception(ValueError('late'))
+        self.assertTrue(self.future.cancelled())
+        self.assertRaises(CancelledError, self.future.result, 0)
+        self.assertEqual(self.calls, [self.future])
+
+    def test_first_result_wins(self):
+        self.future.set_result('first')
+        self.future.set_result('second')
+        self.future.set_exception(ValueError('late'))
+        self.assertEqual(self.future.result(0), 'first')
+        self.assertIsNone(self.future.exception(0))
+        self.assertEqual(self.calls, [self.future])
+
+    def test_first_exception_wins(self):
+        self.future.set_exception(ValueError('first'))
+        self.future.set_result('late')
+        self.assertRaises(ValueError, self.future.result, 0)
+        self.assertEqual(self.calls, [self.future])
+
+
+class ChainTest(unittest.TestCase):
+    def setUp(self):
+        self.source, self.target = Future(), Future()
+        chain(self.source, self.target)
+
+    def test_result(self):
+        self.source.set_result('done')
+        self.assertEqual(self.target.result(0), 'done')
+
+    def test_exception(self):
+        self.source.set_exception(ValueError('boom'))
+        self.assertRaises(ValueError, self.target.result, 0)
+
+    def test_cancel(self):
+        self.source.cancel()
+        self.assertTrue(self.target.cancelled())
+
+
+if __name__ == '__main__':
+    unittest.main()
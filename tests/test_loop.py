@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+import unittest
+
+from src.core.utils.futures import Future
+from src.core.utils.loop import EventLoop
+
+
+class EventLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread is not None:
+            self.loop.stop()
+            self.thread.join(5)
+            self.assertFalse(self.thread.is_alive())
+        self.loop.close()
+
+    def run_in_thread(self):
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        time.sleep(0.05)  # loop is blocked in poll without timeout
+
+    def test_call_soon_from_another_thread_wakes_loop(self):
+        self.run_in_thread()
+        done = threading.Event()
+        start = time.time()
+        self.loop.call_soon(done.set)
+        self.assertTrue(done.wait(1))
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_call_later_from_another_thread_wakes_loop(self):
+        self.loop.call_later(60, lambda: None)  # loop sleeps until this timer
+        self.run_in_thread()
+        done = threading.Event()
+        start = time.time()
+        self.loop.call_later(0.05, done.set)
+        self.assertTrue(done.wait(1))
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_full_wakeup_pipe_does_not_block(self):
+        calls = []
+        writer = threading.Thread(target=lambda: [self.loop.call_soon_threadsafe(calls.append, i)
+                                                  for i in xrange(200000)])
+        writer.daemon = True
+        writer.start()
+        writer.join(10)
+        self.assertFalse(writer.is_alive())
+        self.loop.run_once(0)
+        self.assertEqual(len(calls), 200000)
+
+    def test_timer_order_and_cancel(self):
+        calls = []
+        self.loop.call_later(0.02, calls.append, 2)
+        self.loop.call_later(0.01, calls.append, 1)
+        self.loop.call_later(0.01, calls.append, 'cancelled').cancel()
+        future = Future()
+        self.loop.call_later(0.03, future.set_result, 'done')
+        self.assertEqual(self.loop.run_until_complete(future, 1), 'done')
+        self.assertEqual(calls, [1, 2])
+
+    def test_reader(self):
+        r, w = os.pipe()
+        future = Future()
+        self.loop.add_reader(r, lambda: future.set_result(os.read(r, 10)))
+        os.write(w, 'ping')
+        self.assertEqual(self.loop.run_until_complete(future, 1), 'ping')
+        self.loop.remove_reader(r)
+        os.close(r)
+        os.close(w)
+
+    def test_fds_are_changed_on_loop_thread_only(self):
+        r, w = os.pipe()
+        self.run_in_thread()
+        self.assertRaises(RuntimeError, self.loop.add_reader, r, lambda: None)
+        future = Future()
+        self.loop.call_soon(lambda: future.set_result(self.loop.add_reader(r, lambda: None)))
+        future.result(1)
+        os.close(r)
+        os.close(w)
+
+
+if __name__ == '__main__':
+    unittest.main()
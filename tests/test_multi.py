@@ -0,0 +1,132 @@
+import threading
+import time
+import unittest
+
+from src.transport.curl_multi import CurlMulti
+from src.transport.evented import EventedMulti
+from src.transport.exceptions import ECurlConfigError, ECurlUnknownRequestError
+from src.transport.profiles import HTTP2_SUPPORTED
+from tests.httpserver import start_server
+
+
+class SharedMultiTest(unittest.TestCase):
+    """ Threads sharing one multi transport run their requests concurrently"""
+
+    engine = CurlMulti
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        del self.server.requests[:]
+        self.transport = self.engine()
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_staggered_requests_overlap(self):
+        latencies, bodies = [], []
+
+        def request(i):
+            start = time.time()
+            bodies.append(self.transport.request(self.server.url + '?delay=0.3&size=%d' % i, use_cache=False)[1])
+            latencies.append(time.time() - start)
+
+        start = time.time()
+        threads = []
+        for i in xrange(10):
+            thread = threading.Thread(target=request, args=(i,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.03)
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(sorted(bodies), ['x' * i for i in xrange(10)])
+        self.assertLess(max(latencies), 0.6)
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_request_after_driver_left(self):
+        self.assertEqual(self.transport.request(self.server.url + '?size=1', use_cache=False)[1], 'x')
+        self.assertEqual(self.transport.request(self.server.url + '?size=2', use_cache=False)[1], 'xx')
+
+    def test_identical_requests_are_joined(self):
+        url = self.server.url + '?delay=0.3&size=3'
+        bodies = []
+        threads = [threading.Thread(target=lambda: bodies.append(self.transport.request(url, use_cache=False)[1]))
+                   for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(bodies, ['xxx'] * 4)
+        self.assertEqual(len(self.server.requests), 1)
+        stats = self.transport.stats()
+        self.assertEqual((stats['coalesce']['leaders'], stats['coalesce']['absorbed']), (1, 3))
+        self.assertEqual(stats['coalesce']['in_flight'], 0)
+        self.assertEqual(stats['active'], 0)
+
+
+class SharedEventedMultiTest(SharedMultiTest):
+    engine = EventedMulti
+
+    def test_close_with_transfer_in_flight(self):
+        future = self.transport.add_request(self.server.url + '?delay=1', use_cache=False)
+        time.sleep(0.2)  # socket of transfer is registered in the loop
+        self.transport.close()
+        self.assertRaises(ECurlUnknownRequestError, future.result, 1)
+        self.transport = EventedMulti()
+
+
+class MultiplexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        del self.server.requests[:]
+        self.transports = []
+
+    def tearDown(self):
+        for transport in self.transports:
+            transport.close()
+
+    def multi(self, **kwargs):
+        transport = CurlMulti(**kwargs)
+        self.transports.append(transport)
+        return transport
+
+    def elapsed(self, transport, count):
+        start = time.time()
+        futures = [transport.add_request(self.server.url + '?delay=0.2&n=%d' % i, use_cache=False)
+                   for i in xrange(count)]
+        while transport.perform():
+            pass
+        self.assertEqual([future.result()[0].status for future in futures], [200] * count)
+        return time.time() - start
+
+    def test_host_connections_limit(self):
+        self.assertLess(self.elapsed(self.multi(), 3), 0.4)
+        self.assertGreaterEqual(self.elapsed(self.multi(max_host_connections=1), 3), 0.6)
+
+    def test_cleartext_http2_falls_back_to_http11(self):
+        if not HTTP2_SUPPORTED:
+            self.skipTest('libcurl is built without HTTP/2 support')
+        response, body = self.multi().request(self.server.url + '?size=2', http_version='2', use_cache=False)
+        self.assertEqual((response.status, response.version, body), (200, 11, 'xx'))
+        self.assertEqual(self.server.requests[0][2].get('upgrade'), 'h2c')
+
+    def test_unknown_http_version(self):
+        self.assertRaises(ECurlConfigError, self.multi().request, self.server.url, http_version='4')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+
+from src.core.controllers.plugin import Dispatch
+from src.core.pipeline import Pipeline
+from src.core.utils.executor import ExecutorBusy
+from tests.test_plugin import FakePlugin
+
+
+class EchoPlugin(object):
+    def process_message(self, message):
+        return message.msg
+
+
+class StubPlugins(object):
+    """ Plugin controller whose plugins are candidates of every message, named in priority order"""
+
+    def __init__(self, plugins, concurrent=True):
+        self.plugins = plugins
+        self.concurrent = concurrent
+
+    def candidates(self, message):
+        return sorted(self.plugins)
+
+    def dispatch(self, message, names, executor):
+        return Dispatch(self.plugins, names, message, executor, self.concurrent).start()
+
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.pipelines = []
+
+    def tearDown(self):
+        for pipeline in self.pipelines:
+            pipeline.close()
+
+    def pipeline(self, plugins, concurrent=True, **kwargs):
+        pipeline = Pipeline(StubPlugins(plugins, concurrent), 'fallback', **kwargs)
+        self.pipelines.append(pipeline)
+        return pipeline
+
+    def test_answer_and_callback(self):
+        calls = []
+        done = threading.Event()
+
+        def callback(message, response):
+            calls.append((message.msg, response, threading.current_thread().name))
+            done.set()
+
+        future = self.pipeline({'a': FakePlugin(None), 'b': FakePlugin('b')}).submit('Hi', callback)
+        self.assertEqual(future.result(1), 'b')
+        self.assertTrue(done.wait(1))
+        self.assertEqual(calls[0][:2], ('hi', 'b'))
+        self.assertTrue(calls[0][2].startswith('responser'))
+
+    def test_submit_does_not_block(self):
+        pipeline = self.pipeline({'a': FakePlugin('slow', delay=0.3)})
+        start = time.time()
+        future = pipeline.submit('hi')
+        self.assertLess(time.time() - start, 0.1)
+        self.assertEqual(future.result(1), 'slow')
+
+    def test_messages_get_own_answers(self):
+        pipeline = self.pipeline({'echo': EchoPlugin()})
+        futures = [pipeline.submit('message %d' % i) for i in xrange(50)]
+        self.assertEqual([future.result(1) for future in futures], ['message %d' % i for i in xrange(50)])
+
+    def test_fallback_without_answer(self):
+        self.assertEqual(self.pipeline({'a': FakePlugin(None)}).submit('hi').result(1), 'fallback')
+        self.assertEqual(self.pipeline({}).submit('hi').result(1), 'fallback')
+
+    def test_fallback_on_plugin_exception(self):
+        plugins = {'a': FakePlugin(error=ValueError('boom')), 'b': FakePlugin('b')}
+        self.assertEqual(self.pipeline(plugins, concurrent=False).submit('hi').result(1), 'fallback')
+
+    def test_priority_without_deadline(self):
+        plugins = {'a': FakePlugin('slow', delay=0.2), 'b': FakePlugin('fast')}
+        self.assertEqual(self.pipeline(plugins).submit('hi').result(1), 'slow')
+
+    def test_deadline_takes_best_answer_so_far(self):
+        plugins = {'a': FakePlugin('slow', delay=0.5), 'b': FakePlugin('fast')}
+        start = time.time()
+        self.assertEqual(self.pipeline(plugins, deadline=0.1).submit('hi').result(1), 'fast')
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_deadline_without_answers(self):
+        plugins = {'a': FakePlugin('slow', delay=0.5)}
+        self.assertEqual(self.pipeline(plugins, deadline=0.1).submit('hi').result(0.4), 'fallback')
+
+    def test_deadline_does_not_cut_sequential_dispatch(self):
+        plugins = {'a': FakePlugin(None, delay=0.2), 'b': FakePlugin('slow', delay=0.2)}
+        pipeline = self.pipeline(plugins, concurrent=False, deadline=0.1)
+        self.assertEqual(pipeline.submit('hi').result(1), 'slow')
+
+    def test_full_activator_queue(self):
+        pipeline = self.pipeline({'a': FakePlugin('a')}, activator_workers=1, queue_size=1)
+        pipeline._activator.submit(time.sleep, 0.2)  # occupies the only worker
+        time.sleep(0.05)
+        pipeline._activator.submit(time.sleep, 0)  # fills the queue
+        self.assertRaises(ExecutorBusy, pipeline.submit, 'hi')
+
+
+if __name__ == '__main__':
+    unittest.main()
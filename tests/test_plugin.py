@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+
+from src.communicators import Message
+from src.core.controllers.plugin import Dispatch
+from src.core.utils.executor import Executor
+from src.core.utils.futures import Future
+
+
+class FakePlugin(object):
+    """ Plugin answering `answer` after `delay` seconds, or raising `error`"""
+
+    def __init__(self, answer=None, delay=0, error=None, deferred=False):
+        """
+        @param deferred (bool): answer with a future resolved from another thread
+        """
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.deferred = deferred
+        self.calls = 0
+
+    def process_message(self, message):
+        self.calls += 1
+        if self.deferred:
+            future = Future()
+            timer = threading.Timer(self.delay, future.set_result, (self.answer,))
+            timer.daemon = True
+            timer.start()
+            return future
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+class DispatchTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = Executor(8, name='test-plugins')
+
+    def tearDown(self):
+        self.executor.shutdown(wait=False)
+
+    def dispatch(self, plugins, concurrent, executor=None):
+        names = sorted(plugins)  # plugins are named in priority order
+        return Dispatch(plugins, names, Message('hi'), executor or self.executor, concurrent).start()
+
+    def test_no_candidates(self):
+        self.assertIsNone(self.dispatch({}, True).future.result(1))
+
+    def test_sequential_asks_next_after_refusal(self):
+        plugins = {'a': FakePlugin(None), 'b': FakePlugin('b'), 'c': FakePlugin('c')}
+        self.assertEqual(self.dispatch(plugins, False).future.result(1), 'b')
+        self.assertEqual([plugins[name].calls for name in 'abc'], [1, 1, 0])
+
+    def test_sequential_fails_on_exception(self):
+        plugins = {'a': FakePlugin(error=ValueError('boom')), 'b': FakePlugin('b')}
+        self.assertRaises(ValueError, self.dispatch(plugins, False).future.result, 1)
+        self.assertEqual(plugins['b'].calls, 0)
+
+    def test_concurrent_priority_wins_over_speed(self):
+        plugins = {'a': FakePlugin('slow', delay=0.2), 'b': FakePlugin('fast')}
+        self.assertEqual(self.dispatch(plugins, True).future.result(1), 'slow')
+
+    def test_concurrent_resolves_without_waiting_for_lower_priority(self):
+        plugins = {'a': FakePlugin('fast'), 'b': FakePlugin('slow', delay=0.5)}
+        start = time.time()
+        self.assertEqual(self.dispatch(plugins, True).future.result(1), 'fast')
+        self.assertLess(time.time() - start, 0.3)
+
+    def test_concurrent_exception_is_refusal(self):
+        plugins = {'a': FakePlugin(error=ValueError('boom')), 'b': FakePlugin(None), 'c': FakePlugin('c')}
+        self.assertEqual(self.dispatch(plugins, True).future.result(1), 'c')
+
+    def test_future_answer(self):
+        plugins = {'a': FakePlugin('deferred', delay=0.05, deferred=True), 'b': FakePlugin('b')}
+        self.assertEqual(self.dispatch(plugins, True).future.result(1), 'deferred')
+        self.assertEqual(self.dispatch(plugins, False).future.result(1), 'deferred')
+
+    def test_expire_takes_best_answer_so_far(self):
+        plugins = {'a': FakePlugin('slow', delay=0.5), 'b': FakePlugin('b'), 'c': FakePlugin('c')}
+        dispatch = self.dispatch(plugins, True)
+        time.sleep(0.1)
+        dispatch.expire()
+        self.assertEqual(dispatch.future.result(0), 'b')
+
+    def test_expire_without_answers(self):
+        dispatch = self.dispatch({'a': FakePlugin('slow', delay=0.5)}, True)
+        dispatch.expire()
+        self.assertIsNone(dispatch.future.result(0))
+
+    def test_queued_plugins_are_cancelled(self):
+        executor = Executor(1, name='test-single')
+        try:
+            plugins = {'a': FakePlugin('a', delay=0.1), 'b': FakePlugin('b')}
+            self.assertEqual(self.dispatch(plugins, True, executor).future.result(1), 'a')
+            time.sleep(0.05)
+            self.assertEqual(plugins['b'].calls, 0)
+        finally:
+            executor.shutdown(wait=False)
+
+    def test_busy_executor_is_refusal(self):
+        executor = Executor(1, max_queue=1, name='test-busy')
+        try:
+            plugins = {'a': FakePlugin(None, delay=0.1), 'b': FakePlugin(None), 'c': FakePlugin('c')}
+            self.assertIsNone(self.dispatch(plugins, True, executor).future.result(1))
+        finally:
+            executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import threading
+import time
+import unittest
+
+from src.transport.exceptions import ECurlPoolTimeout
+from src.transport.pool import CurlPool
+from src.transport.scheduler import PriorityScheduler, INTERACTIVE, BACKGROUND
+from tests.httpserver import start_server
+
+
+class PoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        del self.server.requests[:]
+        self.pool = CurlPool(max_size=4)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_identical_requests_are_joined(self):
+        url = self.server.url + '?delay=0.3&size=3'
+        bodies = []
+        threads = [threading.Thread(target=lambda: bodies.append(self.pool.request(url, use_cache=False)[1]))
+                   for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(bodies, ['xxx'] * 4)
+        self.assertEqual(len(self.server.requests), 1)
+        coalesce = self.pool.stats()['coalesce']
+        self.assertEqual((coalesce['leaders'], coalesce['absorbed'], coalesce['in_flight']), (1, 3, 0))
+
+    def test_concurrent_requests_get_own_handles(self):
+        bodies = []
+        threads = [threading.Thread(target=lambda i=i: bodies.append(
+            self.pool.request(self.server.url + '?delay=0.1&size=%d' % i, use_cache=False)[1])) for i in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(sorted(bodies), ['x' * i for i in xrange(8)])
+        stats = self.pool.stats()
+        self.assertLessEqual(stats['created'], 4)
+        self.assertEqual((stats['in_use'], stats['idle']), (0, stats['size']))
+
+    def test_checkout_timeout(self):
+        handles = [self.pool.checkout() for _ in xrange(4)]
+        start = time.time()
+        self.assertRaises(ECurlPoolTimeout, self.pool.checkout, 0.1)
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+        self.pool.checkin(handles.pop())
+        handles.append(self.pool.checkout(0.1))
+        for curl in handles:
+            self.pool.checkin(curl)
+
+    def test_waiting_checkout_gets_returned_handle(self):
+        handles = [self.pool.checkout() for _ in xrange(4)]
+        timer = threading.Timer(0.1, self.pool.checkin, (handles[0],))
+        timer.start()
+        self.assertIs(self.pool.checkout(1), handles[0])
+        self.assertEqual(self.pool.stats()['waits'], 1)
+        for curl in handles:
+            self.pool.checkin(curl)
+
+    def test_thread_gets_back_its_handle(self):
+        with self.pool.handle() as first:
+            with self.pool.handle() as second:
+                pass
+        with self.pool.handle() as curl:
+            self.assertIs(curl, second)
+        self.assertEqual(self.pool.stats()['affinity_hits'], 1)
+        self.assertIsNot(first, second)
+
+    def test_discarded_and_idle_handles_are_closed(self):
+        pool = CurlPool(max_size=2, idle_timeout=0.05)
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first, discard=True)
+        pool.checkin(second)
+        self.assertEqual(pool.stats()['size'], 1)
+        time.sleep(0.1)
+        self.assertEqual(pool.evict_idle(), 1)
+        self.assertEqual((pool.stats()['size'], pool.stats()['evicted']), (0, 1))
+
+    def test_scheduler_budget_limits_requests_in_flight(self):
+        scheduler = PriorityScheduler(concurrency=1)
+        pool = CurlPool(scheduler=scheduler, coalesce=False)
+        self.addCleanup(pool.close)
+        threads = [threading.Thread(target=pool.request, args=(self.server.url + '?delay=0.2',),
+                                    kwargs={'use_cache': False, 'priority': priority})
+                   for priority in (BACKGROUND, INTERACTIVE)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join(10)
+        self.assertGreaterEqual(time.time() - start, 0.4)
+        self.assertEqual(pool.stats()['created'], 1)
+        stats = scheduler.stats()
+        self.assertEqual(stats['dispatched'], {BACKGROUND: 1, INTERACTIVE: 1})
+        self.assertEqual(stats['waited'][INTERACTIVE], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
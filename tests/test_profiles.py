@@ -0,0 +1,140 @@
+import unittest
+
+from src.transport import curl_codes as codes
+from src.transport.curl_connector import Curl
+from src.transport.exceptions import ECurlConnectionTimeout
+from src.transport.profiles import Profile
+from tests.httpserver import start_server
+
+
+class CookieIsolationTest(unittest.TestCase):
+    """ Cookies must not leak between profiles which share one handle"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+        cls.set_cookie = cls.server.url + '?cookie=sid%3Dsecret'
+        cls.echo = cls.server.url + '?echo=Cookie'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.curl = Curl()
+        self.cookies = Profile('cookies', handle_cookie=True, use_cache=False)
+        self.other_cookies = Profile('other_cookies', handle_cookie=True, use_cache=False)
+        self.plain = Profile('plain', use_cache=False)
+
+    def tearDown(self):
+        self.curl.close()
+
+    def request(self, url, profile):
+        return self.curl.request(url, profile=profile)[1]
+
+    def test_cookie_profile_keeps_cookies(self):
+        self.request(self.set_cookie, self.cookies)
+        self.assertEqual(self.request(self.echo, self.cookies), 'sid=secret')
+
+    def test_plain_profile_after_cookie_profile(self):
+        self.request(self.echo, self.cookies)
+        self.request(self.set_cookie, self.plain)
+        self.assertEqual(self.request(self.echo, self.plain), '')
+        self.assertEqual(self.curl._options.get(codes.COOKIEFILE), None)
+
+    def test_cookies_are_dropped_on_profile_switch(self):
+        self.request(self.set_cookie, self.cookies)
+        self.assertEqual(self.request(self.echo, self.other_cookies), '')
+        self.assertEqual(self.request(self.echo, self.cookies), '')
+
+    def test_cookie_profile_after_plain_profile(self):
+        self.request(self.set_cookie, self.plain)
+        self.assertEqual(self.request(self.echo, self.cookies), '')
+
+
+class OneOffSettingsTest(unittest.TestCase):
+    """ Settings passed with one request do not stick to the handle"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+        cls.url = cls.server.url + '?size=5'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.curl = Curl()
+
+    def tearDown(self):
+        self.curl.close()
+
+    def test_no_body_is_not_kept(self):
+        self.assertEqual(self.curl.request(self.url, no_body=True, use_cache=False)[1], '')
+        self.assertEqual(self.curl.request(self.url)[1], 'xxxxx')  # response without lifetime is not cached
+        self.assertEqual(self.server.requests[-1][0], 'GET')
+
+    def test_cookie_data_is_not_kept(self):
+        echo = self.server.url + '?echo=Cookie'
+        self.assertEqual(self.curl.request(echo, cookie_data='sid=1', use_cache=False)[1], 'sid=1')
+        self.assertEqual(self.curl.request(echo)[1], '')
+
+    def test_configured_settings_are_kept(self):
+        self.curl.configure(cookie_data='sid=1', use_cache=False)
+        echo = self.server.url + '?echo=Cookie'
+        self.assertEqual(self.curl.request(echo)[1], 'sid=1')
+        self.assertEqual(self.curl.request(echo, no_body=True)[1], '')
+        self.assertEqual(self.curl.request(echo)[1], 'sid=1')
+
+
+class ProfileDiffTest(unittest.TestCase):
+    """ Switching profiles sends only changed options to libcurl"""
+
+    def setUp(self):
+        self.curl = Curl()
+        self.sent = []
+        setopt = self.curl.setopt
+
+        def recording_setopt(option, value):
+            self.sent.append(option)
+            setopt(option, value)
+
+        self.curl.setopt = recording_setopt
+        self.profile = Profile('diff', timeout=10, use_cache=False)
+
+    def tearDown(self):
+        self.curl.close()
+
+    def test_same_profile_sends_nothing(self):
+        self.curl.apply_profile(self.profile)
+        del self.sent[:]
+        self.curl.apply_profile(self.profile)
+        self.assertEqual(self.sent, [])
+
+    def test_changed_options_only(self):
+        self.curl.apply_profile(self.profile)
+        del self.sent[:]
+        derived = self.profile.derive(timeout=3)
+        self.curl.apply_profile(derived)
+        self.assertEqual(self.sent, [codes.TIMEOUT_MS] + [option for option, value in derived.actions])
+        self.assertEqual(self.curl.timeouts, (3, 5))
+
+    def test_derived_profiles_are_cached(self):
+        derived = self.profile.derive(timeout=3, no_body=True)
+        self.assertIs(self.profile.derive(no_body=True, timeout=3), derived)
+        self.assertIs(self.profile.derive(), self.profile)
+        self.assertEqual(derived.settings, {'timeout': 3, 'no_body': True, 'use_cache': False})
+
+    def test_switched_options_take_effect(self):
+        server = start_server()
+        self.addCleanup(server.shutdown)
+        short = self.profile.derive(timeout=1, adaptive_timeout=False)
+        self.assertRaises(ECurlConnectionTimeout, self.curl.request, server.url + '?delay=1.5', profile=short)
+        self.assertEqual(self.curl.request(server.url + '?size=1', profile=self.profile)[1], 'x')
+        head = self.profile.derive(no_body=True)
+        self.assertEqual(self.curl.request(server.url + '?size=1', 'HEAD', profile=head)[1], '')
+
+
+if __name__ == '__main__':
+    unittest.main()
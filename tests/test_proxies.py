@@ -0,0 +1,126 @@
+import threading
+import unittest
+
+from src.transport.curl_multi import CurlMulti
+from src.transport.pool import CurlPool
+from src.transport.proxies import ProxyPool, ProxiedTransport, ProxiedHandle
+from src.transport.stats import get_stats, host_key
+from tests.httpserver import start_server
+
+# upstream is never resolved, test servers act as HTTP proxies
+UPSTREAM = 'http://upstream.invalid/'
+
+
+class ProxiedTransportTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = [start_server(), start_server()]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.shutdown()
+
+    def setUp(self):
+        for server in self.servers:
+            del server.requests[:]
+        self.proxies = ProxyPool([{'host': '127.0.0.1', 'port': server.server_address[1]}
+                                  for server in self.servers])
+        self.transports = []
+
+    def tearDown(self):
+        for transport in self.transports:
+            transport.close()
+
+    def proxied(self, transport):
+        self.transports.append(transport)
+        return ProxiedTransport(self.proxies, transport)
+
+    def proxied_paths(self):
+        return [path for server in self.servers for _, path, _ in server.requests]
+
+    def accounted(self):
+        return sum(proxy['requests'] for proxy in self.proxies.stats().itervalues())
+
+    def test_request(self):
+        transport = self.proxied(CurlPool(coalesce=False))
+        self.assertEqual(transport.request(UPSTREAM)[0].status, 200)
+        self.assertEqual(self.proxied_paths(), [UPSTREAM])
+        self.assertEqual(self.accounted(), 1)
+
+    def test_stream(self):
+        transport = self.proxied(CurlPool())
+        response, chunks = transport.stream(UPSTREAM + '?size=10')
+        self.assertEqual(''.join(chunks), 'x' * 10)
+        self.assertEqual(self.proxied_paths(), [UPSTREAM + '?size=10'])
+        self.assertEqual(self.accounted(), 1)
+
+    def test_checked_out_handle(self):
+        transport = self.proxied(CurlPool())
+        with transport.handle() as curl:
+            self.assertIsInstance(curl, ProxiedHandle)
+            curl.request(UPSTREAM, profile=transport.profile, use_cache=False)
+        curl = transport.checkout()
+        curl.request(UPSTREAM + '?again', profile=transport.profile, use_cache=False)
+        transport.checkin(curl)
+        self.assertEqual(sorted(self.proxied_paths()), [UPSTREAM, UPSTREAM + '?again'])
+        self.assertEqual(transport.stats()['idle'], 1)
+
+    def test_interface_follows_transport(self):
+        pooled, multi = self.proxied(CurlPool()), self.proxied(CurlMulti())
+        for name in ('stream', 'checkout', 'checkin', 'handle'):
+            self.assertTrue(hasattr(pooled, name))
+            self.assertFalse(hasattr(multi, name))
+        for name in ('add_request', 'perform'):
+            self.assertFalse(hasattr(pooled, name))
+            self.assertTrue(hasattr(multi, name))
+
+    def test_add_request(self):
+        transport = self.proxied(CurlMulti(coalesce=False))
+        futures = [transport.add_request(UPSTREAM + '?n=%d' % i) for i in xrange(3)]
+        while transport.perform():
+            pass
+        self.assertEqual([future.result()[0].status for future in futures], [200] * 3)
+        self.assertEqual(len(self.proxied_paths()), 3)
+        self.assertEqual(self.accounted(), 3)
+        self.assertEqual(sum(proxy['in_flight'] for proxy in self.proxies.stats().itervalues()), 0)
+
+    def test_request_many_on_multi(self):
+        transport = self.proxied(CurlMulti())
+        results = transport.request_many([UPSTREAM + '?n=%d' % i for i in xrange(4)], timeout=10)
+        self.assertEqual([response.status for response, _ in results], [200] * 4)
+        self.assertEqual(len(self.proxied_paths()), 4)
+
+    def test_identical_requests_are_coalesced_across_proxies(self):
+        transport = self.proxied(CurlPool())
+        url = UPSTREAM + '?delay=0.3'
+        threads = [threading.Thread(target=transport.request, args=(url,), kwargs={'use_cache': False})
+                   for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.proxied_paths(), [url])
+        coalesce = transport.stats()['proxy_coalesce']
+        self.assertEqual((coalesce['leaders'], coalesce['absorbed']), (1, 3))
+
+    def test_queued_identical_requests_are_coalesced(self):
+        transport = self.proxied(CurlMulti())
+        url = UPSTREAM + '?delay=0.1'
+        futures = [transport.add_request(url, use_cache=False) for _ in xrange(3)]
+        while transport.perform():
+            pass
+        self.assertEqual([future.result()[0].status for future in futures], [200] * 3)
+        self.assertEqual(self.proxied_paths(), [url])
+        self.assertEqual(transport.stats()['proxy_coalesce']['absorbed'], 2)
+
+    def test_health_check_does_not_touch_transport_stats(self):
+        check_url = 'http://health.invalid/'
+        proxies = ProxyPool([{'host': '127.0.0.1', 'port': self.servers[0].server_address[1]}], check_url=check_url)
+        self.assertEqual(proxies.check(), 1)
+        self.assertEqual(self.proxied_paths(), [check_url])
+        self.assertNotIn(host_key(check_url), get_stats().hosts())
+
+
+if __name__ == '__main__':
+    unittest.main()
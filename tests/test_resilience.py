@@ -0,0 +1,159 @@
+import time
+import unittest
+
+from src.transport.exceptions import (ECurlCircuitOpen, ECurlConfigError, ECurlPoolTimeout,
+                                      ECurlSSLConnectionError)
+from src.transport.pool import CurlPool
+from src.transport.resilience import CircuitBreaker, ResilientPool, CLOSED, OPEN, HALF_OPEN
+from src.transport.scheduler import PriorityScheduler, INTERACTIVE
+from src.transport.stats import host_key
+from tests.httpserver import start_server
+
+URL = 'http://example.com/'
+HOST = host_key(URL)
+
+
+class FakeResponse(object):
+    def __init__(self, status):
+        self.status = status
+
+
+class StubPool(CurlPool):
+    """ `CurlPool` whose requests end with `outcome` without network"""
+
+    outcome = None
+
+    def request(self, url, method='GET', body=None, headers=None, sink=None, priority=None, **curlargs):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return FakeResponse(self.outcome), ''
+
+
+class StubResilientPool(ResilientPool, StubPool):
+    pass
+
+
+class FixedHedgePool(ResilientPool):
+    """ `ResilientPool` which hedges every request after 50ms"""
+
+    def hedge_delay(self, host):
+        return 0.05
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+
+    def open_circuit(self):
+        self.breaker.failure(HOST)
+        self.breaker.failure(HOST)
+        self.assertEqual(self.breaker.state(HOST), OPEN)
+
+    def test_opens_after_threshold(self):
+        self.breaker.failure(HOST)
+        self.assertEqual(self.breaker.state(HOST), CLOSED)
+        self.breaker.before_request(HOST)
+        self.open_circuit()
+        self.assertRaises(ECurlCircuitOpen, self.breaker.before_request, HOST)
+
+    def test_success_resets_failures(self):
+        self.breaker.failure(HOST)
+        self.breaker.success(HOST)
+        self.breaker.failure(HOST)
+        self.assertEqual(self.breaker.state(HOST), CLOSED)
+
+    def test_one_probe_after_reset_timeout(self):
+        self.open_circuit()
+        time.sleep(0.06)
+        self.breaker.before_request(HOST)
+        self.assertEqual(self.breaker.state(HOST), HALF_OPEN)
+        self.assertRaises(ECurlCircuitOpen, self.breaker.before_request, HOST)
+
+    def test_probe_success_closes(self):
+        self.open_circuit()
+        time.sleep(0.06)
+        self.breaker.before_request(HOST)
+        self.breaker.success(HOST)
+        self.assertEqual(self.breaker.state(HOST), CLOSED)
+
+    def test_probe_failure_opens_again(self):
+        self.open_circuit()
+        time.sleep(0.06)
+        self.breaker.before_request(HOST)
+        self.breaker.failure(HOST)
+        self.assertEqual(self.breaker.state(HOST), OPEN)
+        self.assertRaises(ECurlCircuitOpen, self.breaker.before_request, HOST)
+
+    def test_release_lets_next_probe_in(self):
+        self.open_circuit()
+        time.sleep(0.06)
+        self.breaker.before_request(HOST)
+        self.breaker.release(HOST)
+        self.assertEqual(self.breaker.state(HOST), OPEN)
+        self.breaker.before_request(HOST)
+        self.assertEqual(self.breaker.state(HOST), HALF_OPEN)
+
+
+class ResilientPoolBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = StubResilientPool(retries=0, breaker_threshold=1, breaker_reset_timeout=0.05)
+        self.pool.breaker.failure(HOST)
+        time.sleep(0.06)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def probe(self, outcome):
+        self.pool.outcome = outcome
+        try:
+            self.pool.request(URL)
+        except Exception:
+            pass
+        return self.pool.breaker.state(HOST)
+
+    def test_local_errors_do_not_close_circuit(self):
+        self.assertEqual(self.probe(ECurlPoolTimeout('no free handle')), OPEN)
+        self.assertEqual(self.probe(ECurlConfigError('bad option')), OPEN)
+
+    def test_host_error_opens_circuit(self):
+        self.assertEqual(self.probe(ECurlSSLConnectionError('handshake failed')), OPEN)
+        self.assertRaises(ECurlCircuitOpen, self.pool.request, URL)
+
+    def test_response_closes_circuit(self):
+        self.assertEqual(self.probe(404), CLOSED)
+
+    def test_retryable_status_keeps_circuit_open(self):
+        self.assertEqual(self.probe(503), OPEN)
+
+
+class HedgeSlotTest(unittest.TestCase):
+    """ Hedge is one more transfer, it needs its own slot of scheduler budget"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+        cls.url = cls.server.url + '?delay=0.2'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def hedged_request(self, concurrency):
+        scheduler = PriorityScheduler(concurrency=concurrency)
+        pool = FixedHedgePool(scheduler=scheduler, retries=0)
+        try:
+            self.assertEqual(pool.request(self.url, use_cache=False)[0].status, 200)
+            self.assertEqual(scheduler.stats()['running'][INTERACTIVE], 0)
+            return pool.stats()['hedged']
+        finally:
+            pool.close()
+
+    def test_hedge_takes_free_slot(self):
+        self.assertEqual(self.hedged_request(2), 1)
+
+    def test_no_hedge_without_free_slot(self):
+        self.assertEqual(self.hedged_request(1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import copy
+import unittest
+
+from src.transport.curl_connector import Curl, Response
+from tests.httpserver import start_server
+
+HEADERS = ['Content-Type: text/plain', 'Set-Cookie: a=1', 'set-cookie: b=2', 'X-Folded: first',
+           '\tsecond', 'X-Empty:']
+
+
+class ResponseTest(unittest.TestCase):
+    def test_status_line(self):
+        response = Response(HEADERS, 'HTTP/1.0 404 Not Found\r\n')
+        self.assertEqual((response.status, response.reason, response.version), (404, 'Not Found', 10))
+        self.assertEqual(Response([], 'HTTP/2 204').reason, '')
+        self.assertEqual(Response([], 'HTTP/2 204').version, 20)
+
+    def test_index_is_lazy(self):
+        response = Response(HEADERS, 'HTTP/1.1 200 OK')
+        self.assertIsNone(response._index)
+        self.assertEqual(response['content-type'], 'text/plain')
+        self.assertIsNotNone(response._index)
+
+    def test_lookup_is_case_insensitive(self):
+        response = Response('\r\n'.join(HEADERS), 'HTTP/1.1 200 OK')
+        self.assertEqual(response['CONTENT-TYPE'], 'text/plain')
+        self.assertIn('Content-type', response)
+        self.assertNotIn('Location', response)
+        self.assertRaises(KeyError, response.__getitem__, 'Location')
+        self.assertEqual(response.get('location', 'none'), 'none')
+        self.assertEqual(response.get('X-Empty'), '')
+
+    def test_repeated_and_folded_headers(self):
+        response = Response(HEADERS, 'HTTP/1.1 200 OK')
+        self.assertEqual(response.get_all('SET-COOKIE'), ['a=1', 'b=2'])
+        self.assertEqual(response['Set-Cookie'], 'b=2')
+        self.assertEqual(response['X-Folded'], 'first second')
+        self.assertEqual([name for name, value in response.items()],
+                         ['Content-Type', 'Set-Cookie', 'set-cookie', 'X-Folded', 'X-Empty'])
+        self.assertEqual(sorted(response.keys()), ['content-type', 'set-cookie', 'x-empty', 'x-folded'])
+
+    def test_copy_is_independent(self):
+        response = Response(HEADERS, 'HTTP/1.1 200 OK')
+        duplicate = copy.copy(response)
+        duplicate.fromcache = True
+        self.assertFalse(response.fromcache)
+        self.assertEqual(duplicate.get_all('set-cookie'), ['a=1', 'b=2'])
+
+    def test_response_of_transfer(self):
+        server = start_server()
+        self.addCleanup(server.shutdown)
+        curl = Curl()
+        self.addCleanup(curl.close)
+        response, body = curl.request(server.url + '?size=5&cc=max-age%3D0', use_cache=False)
+        self.assertEqual(response['content-length'], '5')
+        self.assertEqual(response.get('CACHE-CONTROL'), 'max-age=0')
+        self.assertEqual(response.version, 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
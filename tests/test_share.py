@@ -0,0 +1,48 @@
+import unittest
+
+from src.transport.curl_connector import Curl
+from src.transport.share import CurlShare
+from src.transport.stats import TransportStats
+from tests.httpserver import start_server
+
+
+class ShareTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def request_on_two_handles(self, share):
+        handles = [Curl(share=share, stats=TransportStats()) for _ in xrange(2)]
+        try:
+            for curl in handles:
+                self.assertEqual(curl.request(self.server.url + '?size=1', use_cache=False)[1], 'x')
+        finally:
+            for curl in handles:
+                curl.close()
+        return share.stats()
+
+    def test_connection_is_reused_by_other_handle(self):
+        share = CurlShare()
+        if 'connections' not in share.shared:
+            self.skipTest('Sharing of connections is not supported by libcurl')
+        stats = self.request_on_two_handles(share)
+        self.assertEqual((stats['transfers'], stats['connects'], stats['connections_reused']), (2, 1, 1))
+
+    def test_dns_cache_is_shared_without_connections(self):
+        stats = self.request_on_two_handles(CurlShare(connections=False))
+        self.assertEqual(stats['shared'], ['dns', 'ssl_session'])
+        self.assertEqual((stats['connects'], stats['connections_reused']), (2, 0))
+        self.assertEqual((stats['lookups'], stats['lookups_avoided']), (1, 1))
+
+    def test_nothing_is_shared(self):
+        stats = self.request_on_two_handles(CurlShare(dns=False, ssl_session=False, connections=False))
+        self.assertEqual(stats['shared'], [])
+        self.assertEqual((stats['connects'], stats['lookups'], stats['lookups_avoided']), (2, 2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
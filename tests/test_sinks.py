@@ -0,0 +1,115 @@
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.transport.curl_connector import Curl
+from src.transport.exceptions import ECurlDownloadLimitExceeded
+from src.transport.pool import CurlPool
+from src.transport.sinks import CallbackSink, SpoolSink
+from tests.httpserver import start_server
+
+
+class StreamTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.curl = Curl()
+
+    def tearDown(self):
+        self.curl.close()
+
+    def test_stream_returns_headers_before_body(self):
+        response, chunks = self.curl.stream(self.server.url + '?size=100000', use_cache=False)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.get('Content-Length'), '100000')
+        self.assertEqual(''.join(chunks), 'x' * 100000)
+
+    def test_closed_stream_releases_handle(self):
+        response, chunks = self.curl.stream(self.server.url + '?size=100000&nolength=1', use_cache=False)
+        next(chunks)
+        chunks.close()
+        self.assertEqual(self.curl.request(self.server.url + '?size=3', use_cache=False)[1], 'xxx')
+
+    def test_callback_sink_gets_chunks(self):
+        received = []
+        response, body = self.curl.request(self.server.url + '?size=100000', sink=CallbackSink(received.append),
+                                           use_cache=False)
+        self.assertIsNone(body)
+        self.assertEqual(''.join(received), 'x' * 100000)
+
+    def test_download_limit_of_declared_length(self):
+        self.assertRaises(ECurlDownloadLimitExceeded, self.curl.request, self.server.url + '?size=1000',
+                          download_limit=100, use_cache=False)
+
+    def test_download_limit_is_enforced_while_receiving(self):
+        received = []
+        self.assertRaises(ECurlDownloadLimitExceeded, self.curl.request, self.server.url + '?size=100000&nolength=1',
+                          sink=CallbackSink(received.append), download_limit=1000, use_cache=False)
+        self.assertLessEqual(len(''.join(received)), 1000)
+        self.assertEqual(self.curl.request(self.server.url + '?size=3', use_cache=False)[1], 'xxx')
+
+    def test_pool_stream_returns_handle_when_consumed(self):
+        pool = CurlPool(max_size=1)
+        self.addCleanup(pool.close)
+        response, chunks = pool.stream(self.server.url + '?size=10', use_cache=False)
+        self.assertEqual(pool.stats()['in_use'], 1)
+        self.assertEqual(''.join(chunks), 'x' * 10)
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+
+class SpoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_small_body_is_kept_in_memory(self):
+        sink = SpoolSink(10, self.directory)
+        sink.write('x' * 5)
+        sink.write('y' * 5)
+        self.assertEqual(sink.getvalue(), 'x' * 5 + 'y' * 5)
+        self.assertFalse(sink.spilled)
+
+    def test_large_body_is_spilled_to_unlinked_file(self):
+        sink = SpoolSink(10, self.directory)
+        for chunk in ('a' * 6, 'b' * 6, 'c' * 6):
+            sink.write(chunk)
+        self.assertTrue(sink.spilled)
+        self.assertEqual(os.listdir(self.directory), [])
+        body = sink.getvalue()
+        self.assertIsInstance(body, mmap.mmap)
+        self.assertIs(sink.getvalue(), body)
+        self.assertEqual((len(body), body[:], body.find('c')), (18, 'a' * 6 + 'b' * 6 + 'c' * 6, 12))
+        self.assertRaises(TypeError, body.__setitem__, 0, 'z')
+
+    def test_request_with_spool_threshold(self):
+        curl = Curl()
+        self.addCleanup(curl.close)
+        response, body = curl.request(self.server.url + '?size=100000', spool_threshold=1000, use_cache=False)
+        self.assertIsInstance(body, mmap.mmap)
+        self.assertEqual(body[:], 'x' * 100000)
+        response, body = curl.request(self.server.url + '?size=100', spool_threshold=1000, use_cache=False)
+        self.assertEqual(body, 'x' * 100)
+        response, body = curl.request(self.server.url + '?size=100000', use_cache=False)
+        self.assertIsInstance(body, str)  # threshold is not kept on handle
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+
+from src.transport import curl_codes as codes
+from src.transport.curl_connector import Curl
+from src.transport.exceptions import ECurlConnectionTimeout, ECurlConnectionError
+from src.transport.profiles import Profile
+from src.transport.stats import TimingRecord, TransportStats, RollingHistogram, host_key
+from tests.httpserver import start_server
+
+URL = 'http://example.com/'
+HOST = host_key(URL)
+BOUNDS = (0.2, 10)
+CONNECT_BOUNDS = (0.1, 5)
+
+
+def record(total, error=None, connect=0.001):
+    return TimingRecord(URL, 'GET', 0 if error else 200, error, 0.0, connect, 0.0, total, total, 0, 0, False)
+
+
+class RollingHistogramTest(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = RollingHistogram()
+        for value in [0.01] * 90 + [1.0] * 10:
+            histogram.add(value, now=100)
+        result = histogram.percentiles(now=100)
+        self.assertEqual(result['count'], 100)
+        self.assertTrue(0.01 <= result['p50'] < 0.011)
+        self.assertTrue(1.0 <= result['p95'] < 1.1)
+        self.assertEqual(RollingHistogram().percentiles(), {'count': 0, 'p50': None, 'p95': None, 'p99': None})
+
+    def test_old_slots_leave_window(self):
+        histogram = RollingHistogram(window=60, slots=6)
+        histogram.add(0.1, now=100)
+        histogram.add(0.2, now=135)
+        self.assertEqual(sum(histogram.counts(now=140)), 2)
+        self.assertEqual(sum(histogram.counts(now=165)), 1)
+        self.assertEqual(sum(histogram.counts(now=200)), 0)
+
+
+class AdaptiveTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = TransportStats()
+
+    def timeouts(self):
+        return self.stats.timeouts(HOST, 2, BOUNDS, CONNECT_BOUNDS)
+
+    def test_upper_bounds_without_samples(self):
+        self.assertEqual(self.timeouts(), (10, 5))
+
+    def test_fast_host_gets_lower_bound(self):
+        for _ in xrange(20):
+            self.stats.record(record(0.01))
+        self.assertEqual(self.timeouts(), (0.2, 0.1))
+
+    def test_timeouts_grow_after_timed_out_transfers(self):
+        for _ in xrange(20):
+            self.stats.record(record(0.01))
+        timeout = self.timeouts()[0]
+        for _ in xrange(3):
+            self.stats.record(record(timeout, codes.E_OPERATION_TIMEDOUT))
+            grown = self.timeouts()[0]
+            self.assertGreater(grown, timeout)
+            timeout = grown
+        self.assertLessEqual(timeout, BOUNDS[1])
+
+    def test_connect_timeout_grows_when_connect_times_out(self):
+        for _ in xrange(20):
+            self.stats.record(record(0.01))
+        connect_timeout = self.timeouts()[1]
+        self.stats.record(record(connect_timeout, codes.E_OPERATION_TIMEDOUT, connect=0.0))
+        self.assertGreater(self.timeouts()[1], connect_timeout)
+
+    def test_other_errors_are_not_samples(self):
+        for _ in xrange(20):
+            self.stats.record(record(5, codes.E_COULDNT_CONNECT))
+        self.assertEqual(self.timeouts(), (10, 5))
+
+
+class AdaptiveTimeoutTransferTest(unittest.TestCase):
+    """ Host which slows down gets longer timeouts instead of failing until the window expires"""
+
+    def setUp(self):
+        self.server = start_server()
+        self.stats = TransportStats()
+        self.curl = Curl(stats=self.stats)
+        self.profile = Profile('adaptive', timeout=5, min_timeout=0.2, timeout_multiplier=2, use_cache=False)
+
+    def tearDown(self):
+        self.curl.close()
+        self.server.shutdown()
+
+    def test_slow_host_recovers(self):
+        for _ in xrange(20):
+            self.curl.request(self.server.url, profile=self.profile)
+        timeouts = 0
+        for _ in xrange(5):
+            try:
+                self.curl.request(self.server.url + '?delay=0.5', profile=self.profile)
+            except ECurlConnectionTimeout:
+                timeouts += 1
+            else:
+                break
+        else:
+            self.fail('Timeout did not grow')
+        self.assertGreater(timeouts, 0)
+
+
+class TransferTimingsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = start_server()
+        self.stats = TransportStats()
+        self.curl = Curl(stats=self.stats)
+
+    def tearDown(self):
+        self.curl.close()
+        self.server.shutdown()
+
+    def test_transfers_are_recorded_per_host(self):
+        for query in ('?size=10', '?size=20', '?delay=0.1'):
+            self.curl.request(self.server.url + query, use_cache=False)
+        host = self.stats.snapshot()[host_key(self.server.url)]
+        self.assertEqual((host['requests'], host['errors'], host['reused'], host['bytes_down']), (3, 0, 2, 30))
+        self.assertEqual((host['total']['count'], host['ttfb']['count'], host['connect']['count']), (3, 3, 1))
+        self.assertGreaterEqual(host['total']['p99'], 0.1)
+        self.assertEqual([record.status for record in self.stats.last_records()], [200] * 3)
+
+    def test_failed_transfer_is_not_latency_sample(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertRaises(ECurlConnectionError, self.curl.request, self.server.url, use_cache=False)
+        host = self.stats.snapshot()[host_key(self.server.url)]
+        self.assertEqual((host['requests'], host['errors'], host['total']['count']), (1, 1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()